@@ -0,0 +1,103 @@
+# api/ann_index.py
+import numpy as np
+
+
+class IVFPartition:
+    """
+    Galeri satırları için IVF (inverted file) yaklaşık en yakın komşu bölümlemesi.
+
+    Küresel k-means ile bulunan nlist merkez, normalize vektörleri kümelere
+    ayırır. Sorgu yalnızca kendisine en yakın nprobe kümedeki satırları puanlar:
+    nprobe büyüdükçe recall artar, gecikme de artar.
+
+    Satırlar global satır numarasıyla tutulur; eklenen satırlar bekleyen listeye
+    gider ve yeniden oluşturmaya kadar ayrıca taranır. Silme, galerinin 'alive'
+    maskesiyle yapılır.
+    """
+
+    def __init__(self, centroids):
+        self.centroids = np.ascontiguousarray(centroids, dtype=np.float32)
+        self.trained_rows = 0
+        self._order = np.empty(0, dtype=np.int64)  # kümeye göre sıralı satırlar
+        self._offsets = np.zeros(len(self.centroids) + 1, dtype=np.int64)
+        self._pending_rows = []
+        self._pending_lists = []
+
+    @property
+    def nlist(self):
+        return len(self.centroids)
+
+    @staticmethod
+    def default_nlist(row_count):
+        """Satır sayısına göre önerilen küme sayısı (~sqrt(N))"""
+        return int(min(1024, max(16, np.sqrt(row_count))))
+
+    @classmethod
+    def train(cls, matrix, nlist, iterations=10, sample_size=None, seed=0):
+        """Normalize satırlar üzerinde küresel k-means ile merkezleri öğren"""
+        rng = np.random.default_rng(seed)
+        row_count = len(matrix)
+        nlist = max(1, min(nlist, row_count))
+
+        sample_size = sample_size or min(row_count, 64 * nlist)
+        if sample_size < row_count:
+            sample = matrix[np.sort(rng.choice(row_count, sample_size, replace=False))]
+        else:
+            sample = matrix
+        sample = np.asarray(sample, dtype=np.float32)
+
+        centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+        for _ in range(iterations):
+            assign = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assign, sample)
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            empty = norms[:, 0] == 0
+            # Boş kalan kümeleri rastgele örneklerle yeniden başlat
+            if empty.any():
+                sums[empty] = sample[rng.choice(len(sample), int(empty.sum()))]
+                norms[empty] = 1.0
+            centroids = sums / norms
+
+        partition = cls(centroids)
+        partition.trained_rows = row_count
+        return partition
+
+    def assign(self, vectors, chunk_size=8192):
+        """Her vektör için en yakın küme numarasını döndür"""
+        vectors = np.atleast_2d(vectors)
+        result = np.empty(len(vectors), dtype=np.int32)
+        for start in range(0, len(vectors), chunk_size):
+            block = np.asarray(vectors[start:start + chunk_size], dtype=np.float32)
+            result[start:start + chunk_size] = np.argmax(block @ self.centroids.T, axis=1)
+        return result
+
+    def rebuild(self, rows, vectors):
+        """Verilen satırlar için ters listeleri baştan oluştur"""
+        lists = self.assign(vectors) if len(rows) else np.empty(0, dtype=np.int32)
+        order = np.argsort(lists, kind='stable')
+        self._order = np.asarray(rows, dtype=np.int64)[order]
+        self._offsets = np.searchsorted(lists[order], np.arange(self.nlist + 1))
+        self._pending_rows = []
+        self._pending_lists = []
+
+    def add(self, row, vector):
+        """Yeni bir satırı en yakın kümeye ekle"""
+        self._pending_lists.append(int(self.assign(vector)[0]))
+        self._pending_rows.append(row)
+
+    def candidates(self, query, nprobe):
+        """Sorguya en yakın nprobe kümedeki satır numaralarını döndür"""
+        nprobe = max(1, min(nprobe, self.nlist))
+        centroid_scores = self.centroids @ query
+        if nprobe < self.nlist:
+            probes = np.argpartition(-centroid_scores, nprobe - 1)[:nprobe]
+        else:
+            probes = np.arange(self.nlist)
+
+        parts = [self._order[self._offsets[c]:self._offsets[c + 1]] for c in probes]
+        if self._pending_rows:
+            pending_lists = np.asarray(self._pending_lists)
+            pending_rows = np.asarray(self._pending_rows, dtype=np.int64)
+            parts.append(pending_rows[np.isin(pending_lists, probes)])
+        return np.concatenate(parts) if parts else np.empty(0, dtype=np.int64)
@@ -4,7 +4,9 @@ import logging
 from channels.generic.websocket import AsyncWebsocketConsumer
 from django.utils import timezone
 from channels.db import database_sync_to_async
+from django.conf import settings
 from .models import Door
+from .uploads import face_crop_options
 
 # WebSocket logger
 websocket_logger = logging.getLogger('websocket')
@@ -144,6 +146,34 @@ class DoorConsumer(AsyncWebsocketConsumer):
                 else:
                     base64_data = face_image_base64
                 
+                # Sunucu tarafı modda görüntü Raspberry'lere dağıtılmaz; tanıma burada yapılıp
+                # sonuç yalnızca isteği gönderen istemciye döner
+                server_side = text_data_json.get(
+                    'server_side', getattr(settings, 'FACE_RECOGNITION_SERVER_SIDE', False)
+                )
+                if server_side:
+                    # 'aligned' / 'landmarks' ile gelen cihaz kırpıntılarında tespit atlanır
+                    try:
+                        crop_mode, landmarks = face_crop_options(text_data_json)
+                    except ValueError as e:
+                        await self.send(text_data=json.dumps({
+                            'type': 'error',
+                            'message': str(e),
+                            'timestamp': str(timezone.now())
+                        }))
+                        return
+                    result = await self.recognize_face(base64_data, crop_mode, landmarks)
+                    await self.send(text_data=json.dumps({
+                        'type': 'face_recognition_result',
+                        'name': name,
+                        'request_id': request_id,
+                        'server_side': True,
+                        'timestamp': str(timezone.now()),
+                        **result
+                    }))
+                    websocket_logger.info(f"Server-side face recognition for client [{self.client_id}]: {result.get('result')}")
+                    return
+                
                 # İsteği aktif istekler listesine ekle
                 self.active_requests[request_id] = {
                     'source_client_id': self.client_id,
@@ -405,6 +435,28 @@ class DoorConsumer(AsyncWebsocketConsumer):
     
     
 
+    @database_sync_to_async
+    def recognize_face(self, base64_data, crop_mode=False, landmarks=None):
+        from .inference import InferenceQueueFull, InferenceTimeout
+        from .recognition import base64_image_bytes, decode_image, recognize_image
+        
+        try:
+            image_data = base64_image_bytes(base64_data)
+            image, cache_key = decode_image(image_data, crop_mode, landmarks)
+        except Exception as e:
+            return {'result': 'error', 'message': f'Image processing error: {str(e)}'}
+        try:
+            # Aynı kare yeniden gönderilirse analiz sonucu içerik hash'iyle önbellekten döner
+            return recognize_image(image, cache_key=cache_key)
+        except InferenceQueueFull:
+            return {
+                'result': 'busy',
+                'message': 'Face analysis is busy, please retry shortly',
+                'retry_after': getattr(settings, 'FACE_INFERENCE_RETRY_AFTER', 2)
+            }
+        except InferenceTimeout:
+            return {'result': 'error', 'message': 'Face analysis timed out'}
+
     @database_sync_to_async
     def update_door_status(self, status):
         try:
@@ -0,0 +1,332 @@
+# api/embedding_cache.py
+import hashlib
+import json
+import logging
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from functools import partial
+
+import numpy as np
+from django.conf import settings
+from django.core.signals import setting_changed
+
+from .image_decode import detection_size, detection_sizes
+from .media_writer import media_writer
+
+logger = logging.getLogger(__name__)
+
+# Disk biçimi değişirse artırılır; sürüm anahtarına girer
+CACHE_FORMAT_VERSION = 1
+
+# Sürümü etkileyen ayarlar; değişince (ör. testlerde) özet yeniden hesaplanır
+VERSION_SETTINGS = (
+    'FACE_ANALYSIS_MODEL', 'FACE_RECOGNITION_MODEL_PATH', 'FACE_DETECTION_SIZE', 'FACE_DETECTION_SIZES',
+)
+_cache_version = None
+
+
+def cache_version():
+    """
+    Analiz sonucunu etkileyen model ayarlarının özeti. Model ya da dedektör
+    boyutları değişince anahtarlar ve disk dizini değişir, eski kayıtlar
+    kullanılmaz ve zamanla LRU ile silinir.
+    Modeller süreç başına bir kez yüklendiği için özet de ilk kullanımda bir kez hesaplanır.
+    """
+    global _cache_version
+    if _cache_version is None:
+        _cache_version = _compute_cache_version()
+    return _cache_version
+
+
+def _reset_cache_version(setting, **kwargs):
+    global _cache_version
+    if setting in VERSION_SETTINGS:
+        _cache_version = None
+
+
+setting_changed.connect(_reset_cache_version)
+
+
+def _compute_cache_version():
+    recognition_model = getattr(settings, 'FACE_RECOGNITION_MODEL_PATH', None)
+    if recognition_model and os.path.exists(recognition_model):
+        recognition_model = [os.path.basename(recognition_model), os.path.getsize(recognition_model)]
+    parts = [
+        CACHE_FORMAT_VERSION,
+        getattr(settings, 'FACE_ANALYSIS_MODEL', 'buffalo_l'),
+        recognition_model,
+        detection_size(),
+        detection_sizes(),
+    ]
+    return hashlib.sha256(json.dumps(parts).encode()).hexdigest()[:12]
+
+
+def embedding_cache_key(image_hash, crop_mode=False, landmarks=None, quality_gate=False, frame=None):
+    """
+    Görüntü içerik hash'i ve analiz seçeneklerinden önbellek anahtarı.
+    frame analiz edilen dizinin koordinat çerçevesidir (DetectorInput.frame); bbox ve
+    landmark'lar bu çerçevede saklandığı için farklı çerçeveler aynı kaydı paylaşmaz.
+    Kalite kapısı açıksa eşikler de anahtara girer; eşik değişince eski sonuçlar kapıyı atlatamaz.
+    """
+    options = [
+        bool(crop_mode),
+        np.asarray(landmarks, dtype=float).round(2).tolist() if landmarks is not None else None,
+        frame,
+    ]
+    if quality_gate:
+        options.append([
+            getattr(settings, 'FACE_QUALITY_MIN_FACE_SIZE', 40),
+            getattr(settings, 'FACE_QUALITY_MIN_DET_SCORE', 0.6),
+            getattr(settings, 'FACE_QUALITY_MIN_BLUR', 35.0),
+            list(getattr(settings, 'FACE_QUALITY_BRIGHTNESS_RANGE', (40, 220))),
+        ])
+    variant = hashlib.sha256(json.dumps(options).encode()).hexdigest()[:16]
+    return f"{image_hash}-{variant}"
+
+
+def _entry_size(faces):
+    return sum(
+        value.nbytes if isinstance(value, np.ndarray) else 64
+        for face in faces for value in face.values()
+    ) + 64
+
+
+def encode_faces(faces):
+    """Yüz listesini pickle kullanmadan .npz dizilerine çevir"""
+    meta = []
+    for face in faces:
+        meta.append({
+            'det_score': float(face['det_score']),
+            'detected': bool(face.get('detected', True)),
+            'has_kps': face['kps'] is not None,
+            'quality': face.get('quality'),
+        })
+    arrays = {'meta': np.array(json.dumps(meta))}
+    if faces:
+        arrays['bbox'] = np.stack([np.asarray(face['bbox'], dtype=np.float32) for face in faces])
+        arrays['kps'] = np.stack([
+            np.asarray(face['kps'], dtype=np.float32).reshape(5, 2) if face['kps'] is not None
+            else np.zeros((5, 2), dtype=np.float32)
+            for face in faces
+        ])
+        arrays['embedding'] = np.stack([np.asarray(face['embedding'], dtype=np.float32) for face in faces])
+    return arrays
+
+
+def decode_faces(arrays):
+    faces = []
+    for index, meta in enumerate(json.loads(str(arrays['meta']))):
+        face = {
+            'bbox': arrays['bbox'][index],
+            'kps': arrays['kps'][index] if meta['has_kps'] else None,
+            'det_score': meta['det_score'],
+            'detected': meta['detected'],
+            'embedding': arrays['embedding'][index],
+        }
+        if meta['quality'] is not None:
+            face['quality'] = meta['quality']
+        faces.append(face)
+    return faces
+
+
+class EmbeddingCache:
+    """
+    Görüntü içerik hash'inden analiz sonucuna (bbox, landmark, tespit skoru,
+    embedding) LRU bellek önbelleği ve disk katmanı.
+
+    İstemcinin zaman aşımı sonrası yeniden gönderdiği aynı görüntü tespit ve
+    embedding'i tekrar çalıştırmadan döner. Bellek katmanı süreç başınadır ve
+    FACE_EMBEDDING_CACHE_MAX_BYTES ile sınırlıdır; disk katmanı
+    (FACE_EMBEDDING_CACHE_DIR) süreçler ve yeniden başlatmalar arasında
+    paylaşılır ve FACE_EMBEDDING_CACHE_DISK_MAX_BYTES aşılınca en eski
+    dosyalardan başlayarak budanır.
+
+    Disk yazımı ve budama media_writer'ın arka plan iş parçacığında yapılır;
+    disk boyutu dizin bir kez tarandıktan sonra sayaçlarla izlenir.
+    """
+
+    def __init__(self):
+        self._entries = OrderedDict()  # {(sürüm, anahtar): (yüzler, bayt)}
+        self._bytes = 0
+        self._disk_bytes = None  # İlk disk yazımında arka planda bir kez taranır
+        self._disk_count = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self):
+        return getattr(settings, 'FACE_EMBEDDING_CACHE_MAX_BYTES', 64 * 1024 * 1024) > 0
+
+    def _directory(self):
+        return getattr(settings, 'FACE_EMBEDDING_CACHE_DIR', None)
+
+    def _path(self, version, key):
+        return os.path.join(self._directory(), version, key[:2], f"{key}.npz")
+
+    def get(self, key):
+        """Önbellekteki yüzleri döndür (çağıran listeyi değiştirebilir); yoksa None"""
+        if not self.enabled:
+            return None
+        version = cache_version()
+        with self._lock:
+            entry = self._entries.get((version, key))
+            if entry is not None:
+                self._entries.move_to_end((version, key))
+                self.hits += 1
+                return [dict(face) for face in entry[0]]
+
+        faces = self._read(version, key)
+        with self._lock:
+            if faces is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+        self._remember(version, key, faces)
+        return [dict(face) for face in faces]
+
+    def put(self, key, faces):
+        if not self.enabled:
+            return
+        version = cache_version()
+        faces = [dict(face) for face in faces]
+        self._remember(version, key, faces)
+        if self._directory() and not media_writer.run(partial(self._write, version, key, faces)):
+            logger.debug(f"Media writer queue is full, embedding cache entry {key} kept in memory only")
+
+    def _remember(self, version, key, faces):
+        size = _entry_size(faces)
+        max_bytes = getattr(settings, 'FACE_EMBEDDING_CACHE_MAX_BYTES', 64 * 1024 * 1024)
+        with self._lock:
+            previous = self._entries.pop((version, key), None)
+            if previous is not None:
+                self._bytes -= previous[1]
+            self._entries[(version, key)] = (faces, size)
+            self._bytes += size
+            while self._bytes > max_bytes and self._entries:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+
+    def _read(self, version, key):
+        if not self._directory():
+            return None
+        path = self._path(version, key)
+        try:
+            with np.load(path, allow_pickle=False) as arrays:
+                faces = decode_faces(arrays)
+            # Disk LRU'su değiştirilme zamanına göre; okunan dosya tazelenir
+            os.utime(path)
+            return faces
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"Embedding cache entry {key} could not be read: {e}")
+            return None
+
+    def _write(self, version, key, faces):
+        """.npz dosyasını atomik olarak yaz (arka plan iş parçacığında)"""
+        if not self._directory():
+            return
+        path = self._path(version, key)
+        tmp_path = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            try:
+                previous_size = os.path.getsize(path)
+            except FileNotFoundError:
+                previous_size = None
+            with open(tmp_path, 'wb') as cache_file:
+                np.savez(cache_file, **encode_faces(faces))
+            os.replace(tmp_path, path)
+            size = os.path.getsize(path)
+        except Exception as e:
+            logger.warning(f"Embedding cache entry {key} could not be written: {e}")
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            return
+
+        if self._disk_bytes is None:
+            files = self._disk_files()
+            with self._lock:
+                self._disk_bytes = sum(size for _, size in files)
+                self._disk_count = len(files)
+        else:
+            with self._lock:
+                if previous_size is None:
+                    self._disk_bytes += size
+                    self._disk_count += 1
+                else:
+                    self._disk_bytes += size - previous_size
+        with self._lock:
+            prune = self._disk_bytes > getattr(settings, 'FACE_EMBEDDING_CACHE_DISK_MAX_BYTES', 512 * 1024 * 1024)
+        if prune:
+            self._prune_disk()
+
+    def _disk_files(self):
+        """Disk katmanındaki (yol, bayt) çiftleri, en eski kullanılandan başlayarak"""
+        files = []
+        for root, _, file_names in os.walk(self._directory()):
+            for file_name in file_names:
+                if not file_name.endswith('.npz'):
+                    continue
+                path = os.path.join(root, file_name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, path, stat.st_size))
+        files.sort()
+        return [(path, size) for _, path, size in files]
+
+    def _prune_disk(self):
+        """
+        Disk katmanını sınırın %90'ına inene kadar en eski dosyalardan buda (eski sürümler önce gider).
+        Dizin yalnızca sınır aşıldığında taranır; sayaçlar gerçek değerlerle düzeltilir.
+        """
+        target = getattr(settings, 'FACE_EMBEDDING_CACHE_DISK_MAX_BYTES', 512 * 1024 * 1024) * 0.9
+        files = self._disk_files()
+        total = sum(size for _, size in files)
+        remaining = len(files)
+        for path, size in files:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                total -= size
+                remaining -= 1
+            except OSError:
+                pass
+        with self._lock:
+            self._disk_bytes = total
+            self._disk_count = remaining
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_rate': (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'disk_bytes': self._disk_bytes,
+                'disk_entries': self._disk_count,
+                'evictions': self.evictions,
+            }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+
+# Süreç düzeyinde analiz sonucu önbelleği
+embedding_cache = EmbeddingCache()
@@ -0,0 +1,822 @@
+# api/face_index.py
+import logging
+import os
+import tempfile
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Count, Max, Q
+
+from .ann_index import IVFPartition
+from .gallery_snapshot import read_snapshot, write_snapshot, snapshot_writer, snapshot_dir
+from .gallery_shm import SharedGallery
+from .models import User, FaceVector, AnonymousFaceVector, DoorAccess
+
+logger = logging.getLogger(__name__)
+
+INDEX_BACKENDS = ('exact', 'ivf')
+INDEX_PRECISIONS = ('float32', 'float16', 'int8')
+
+
+def _normalize(matrix):
+    """Satırları L2-normalize et (sıfır normlu satırlar sıfır kalır)"""
+    matrix = np.atleast_2d(np.asarray(matrix, dtype=np.float32)).copy()
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    matrix /= norms
+    return matrix
+
+
+def _encode(matrix, precision):
+    """Normalize float32 satırları depolama biçimine çevir -> (codes, scales)"""
+    if precision == 'float16':
+        return matrix.astype(np.float16), None
+    if precision == 'int8':
+        # Satır başına ölçekli simetrik int8 nicemleme
+        scales = np.abs(matrix).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        codes = np.rint(matrix / scales[:, None]).astype(np.int8)
+        return codes, scales.astype(np.float32)
+    return np.ascontiguousarray(matrix, dtype=np.float32), None
+
+
+def _decode(codes, scales):
+    """Depolanan satırları float32'ye geri çevir"""
+    matrix = codes.astype(np.float32)
+    if scales is not None:
+        matrix *= scales[:, None]
+    return matrix
+
+
+def _matmul(codes, scales, query, chunk_rows=8192):
+    """
+    Depolanan satırlarla sorgu(lar)ın çarpımı.
+    Nicemli satırlar, bellekte float32 kopyası oluşmaması için bloklar halinde açılır.
+    """
+    if codes.dtype == np.float32:
+        return codes @ query
+    out = np.empty((len(codes),) + query.shape[1:], dtype=np.float32)
+    for start in range(0, len(codes), chunk_rows):
+        out[start:start + chunk_rows] = codes[start:start + chunk_rows].astype(np.float32) @ query
+    if scales is not None:
+        out *= scales.reshape((-1,) + (1,) * (out.ndim - 1))
+    return out
+
+
+def quantized_scores(matrix, queries, precision):
+    """
+    Ölçüm için: normalize matrisi verilen hassasiyette saklayıp sorgularla puanla.
+    :return: (satır x sorgu skor matrisi, depolama bayt sayısı)
+    """
+    codes, scales = _encode(matrix, precision)
+    nbytes = codes.nbytes + (scales.nbytes if scales is not None else 0)
+    return _matmul(codes, scales, np.ascontiguousarray(queries.T)), nbytes
+
+
+def _spill(matrix):
+    """
+    Nicemli depolamada yeniden sıralama için float32 satırları disk üzerindeki
+    isimsiz bir dosyaya yazıp salt okunur eşle. Yalnızca okunan sayfalar belleğe
+    gelir ve işletim sistemi gerektiğinde geri alabilir.
+    """
+    matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+    if matrix.size == 0:
+        return matrix
+    # /tmp bazı sistemlerde bellekte (tmpfs); varsa anlık görüntü dizini tercih edilir
+    directory = snapshot_dir()
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    spill_file = tempfile.TemporaryFile(dir=directory or None)
+    matrix.tofile(spill_file)
+    spill_file.flush()
+    # Dosya zaten silinmiş durumda; eşleme kapanınca alanı da geri verilir
+    return np.memmap(spill_file, dtype=np.float32, mode='r', shape=matrix.shape)
+
+
+def _top_k(scores, k):
+    """En yüksek k skorun konumlarını azalan sırada döndür"""
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    if k < len(scores):
+        top = np.argpartition(-scores, k - 1)[:k]
+    else:
+        top = np.arange(len(scores))
+    return top[np.argsort(-scores[top])]
+
+
+class _VectorGroup:
+    """
+    Aynı boyuttaki vektörlerin deposu.
+
+    Tam yüklemede oluşan bir taban matris ile artımlı eklemeler için büyüyebilen
+    bir kuyruk tamponundan oluşur. Satır numaraları tabandan kuyruğa kesintisiz
+    devam eder; silinen ya da güncellenen satırlar 'alive' maskesiyle gizlenir
+    ve ölü satırlar birikince grup sıkıştırılır.
+
+    Nicemli hassasiyetlerde satırların float32 hali de tutulur (taban için bellek
+    eşlemeli dosya, kuyruk için bellekte); yeniden sıralama bunlardan yapılır.
+    """
+
+    def __init__(self, size, ids, matrix, precision='float32', encoded=None, shared=False, exact=None):
+        self.size = size
+        self.precision = precision
+        self.shared = shared  # taban paylaşılan bellek segmentinde mi
+        # encoded verilirse (ör. bellek eşlemeli anlık görüntü) kopyalanmadan kullanılır
+        self.base, self.base_scales = encoded if encoded is not None else _encode(matrix, precision)
+        self.base_exact = None
+        if precision != 'float32':
+            self.base_exact = exact if exact is not None else _spill(matrix)
+        self.tail = np.empty((0, size), dtype=self.base.dtype)
+        self.tail_scales = np.empty(0, dtype=np.float32) if self.base_scales is not None else None
+        self.tail_exact = np.empty((0, size), dtype=np.float32) if self.base_exact is not None else None
+        self.tail_count = 0
+        self.ids = list(ids)
+        self.alive = np.ones(len(self.ids), dtype=bool)
+        self.row_of = {pk: row for row, pk in enumerate(self.ids)}
+        self.ivf = None
+
+    def __len__(self):
+        return len(self.row_of)
+
+    @property
+    def row_count(self):
+        return len(self.base) + self.tail_count
+
+    @property
+    def dead_count(self):
+        return self.row_count - len(self.row_of)
+
+    @property
+    def nbytes(self):
+        """Vektör depolamasının bellekteki boyutu"""
+        total = self.base.nbytes + self.tail.nbytes
+        if self.base_scales is not None:
+            total += self.base_scales.nbytes + self.tail_scales.nbytes
+        if self.tail_exact is not None:
+            # Tabanın float32 kopyası disk üzerinde eşlenmiş durumda, sayılmaz
+            total += self.tail_exact.nbytes
+        return total
+
+    def add(self, pk, vector):
+        if pk in self.row_of:
+            self.remove(pk)
+        if self.tail_count == len(self.tail):
+            capacity = max(64, 2 * len(self.tail))
+            grown = np.empty((capacity, self.size), dtype=self.tail.dtype)
+            grown[:self.tail_count] = self.tail[:self.tail_count]
+            self.tail = grown
+            if self.tail_scales is not None:
+                grown_scales = np.empty(capacity, dtype=np.float32)
+                grown_scales[:self.tail_count] = self.tail_scales[:self.tail_count]
+                self.tail_scales = grown_scales
+            if self.tail_exact is not None:
+                grown_exact = np.empty((capacity, self.size), dtype=np.float32)
+                grown_exact[:self.tail_count] = self.tail_exact[:self.tail_count]
+                self.tail_exact = grown_exact
+            # Maske de kuyrukla aynı kapasitede büyür; row_count ötesi kullanılmaz
+            grown_alive = np.zeros(len(self.base) + capacity, dtype=bool)
+            grown_alive[:self.row_count] = self.alive[:self.row_count]
+            self.alive = grown_alive
+
+        row = self.row_count
+        codes, scales = _encode(vector[None, :], self.precision)
+        # Okuyucuların tutarlı görmesi için önce maske ve id, en son sayaç güncellenir
+        self.alive[row] = True
+        self.ids.append(pk)
+        self.tail[self.tail_count] = codes[0]
+        if scales is not None:
+            self.tail_scales[self.tail_count] = scales[0]
+        if self.tail_exact is not None:
+            self.tail_exact[self.tail_count] = vector
+        self.tail_count += 1
+        self.row_of[pk] = row
+        if self.ivf is not None:
+            self.ivf.add(row, vector)
+
+    def remove(self, pk):
+        row = self.row_of.pop(pk, None)
+        if row is not None:
+            self.alive[row] = False
+
+    def rows(self, rows):
+        """Global satır numaralarına karşılık gelen vektörleri float32 olarak topla"""
+        rows = np.asarray(rows, dtype=np.int64)
+        in_base = rows < len(self.base)
+        tail_rows = rows[~in_base] - len(self.base)
+        out = np.empty((len(rows), self.size), dtype=np.float32)
+        out[in_base] = _decode(
+            self.base[rows[in_base]],
+            self.base_scales[rows[in_base]] if self.base_scales is not None else None,
+        )
+        out[~in_base] = _decode(
+            self.tail[tail_rows],
+            self.tail_scales[tail_rows] if self.tail_scales is not None else None,
+        )
+        return out
+
+    def exact_rows(self, rows):
+        """Satırların float32 hali; nicemli depolamada kopyadan, değilse doğrudan matristen"""
+        if self.base_exact is None:
+            return self.rows(rows)
+        rows = np.asarray(rows, dtype=np.int64)
+        in_base = rows < len(self.base)
+        out = np.empty((len(rows), self.size), dtype=np.float32)
+        out[in_base] = self.base_exact[rows[in_base]]
+        out[~in_base] = self.tail_exact[rows[~in_base] - len(self.base)]
+        return out
+
+    def snapshot(self):
+        """Kilit dışında puanlama için o anki satırların tutarlı bir görünümü"""
+        row_count = self.row_count
+        return _GroupSnapshot(
+            self.base,
+            self.base_scales,
+            self.tail[:self.tail_count],
+            self.tail_scales[:self.tail_count] if self.tail_scales is not None else None,
+            self.base_exact,
+            self.tail_exact[:self.tail_count] if self.tail_exact is not None else None,
+            self.alive[:row_count],
+            self.ids,
+            row_count != len(self.row_of),
+        )
+
+    def candidate_scores(self, query, nprobe):
+        """IVF ile seçilen aday satırlar ve skorları"""
+        rows = self.ivf.candidates(query, nprobe)
+        rows = rows[self.alive[rows]]
+        return rows, self.rows(rows) @ query
+
+    def needs_compaction(self):
+        return (
+            self.dead_count > max(1000, self.row_count // 4)
+            or self.tail_count > max(1000, len(self.base) // 4)
+        )
+
+    def compacted(self):
+        """Canlı satırlardan yeni bir taban matrisle grubu yeniden kur"""
+        items = sorted(self.row_of.items(), key=lambda item: item[1])
+        ids = [pk for pk, _ in items]
+        matrix = self.exact_rows([row for _, row in items]) if items else np.empty((0, self.size), dtype=np.float32)
+        group = _VectorGroup(self.size, ids, matrix, self.precision)
+        if self.ivf is not None:
+            group.build_ivf(centroids=self.ivf.centroids, trained_rows=self.ivf.trained_rows)
+        return group
+
+    def build_ivf(self, nlist=0, centroids=None, trained_rows=0):
+        """IVF bölümlemesini kur; mevcut merkezler verilirse yeniden eğitme"""
+        live_rows = np.flatnonzero(self.alive[:self.row_count])
+        vectors = self.rows(live_rows)
+        if centroids is None or len(live_rows) > 4 * max(trained_rows, 1):
+            partition = IVFPartition.train(vectors, nlist or IVFPartition.default_nlist(len(live_rows)))
+        else:
+            partition = IVFPartition(centroids)
+            partition.trained_rows = trained_rows
+        partition.rebuild(live_rows, vectors)
+        self.ivf = partition
+
+
+class _GroupSnapshot:
+    """_VectorGroup'un kilit dışında okunabilen anlık görünümü"""
+
+    def __init__(self, base, base_scales, tail, tail_scales, base_exact, tail_exact, alive, ids, has_dead):
+        self.base = base
+        self.base_scales = base_scales
+        self.tail = tail
+        self.tail_scales = tail_scales
+        self.base_exact = base_exact
+        self.tail_exact = tail_exact
+        self.alive = alive
+        self.ids = ids
+        self.has_dead = has_dead
+
+    def export(self):
+        """Canlı satırları depolama biçiminde döndür -> (ids, codes, scales, exact)"""
+        live_rows = np.flatnonzero(self.alive)
+        in_base = live_rows < len(self.base)
+        tail_rows = live_rows[~in_base] - len(self.base)
+        codes = np.concatenate([self.base[live_rows[in_base]], self.tail[tail_rows]])
+        scales = None
+        if self.base_scales is not None:
+            scales = np.concatenate([self.base_scales[live_rows[in_base]], self.tail_scales[tail_rows]])
+        exact = None
+        if self.base_exact is not None:
+            exact = np.concatenate([self.base_exact[live_rows[in_base]], self.tail_exact[tail_rows]])
+        return [self.ids[row] for row in live_rows], codes, scales, exact
+
+    def scores(self, query):
+        """Tüm satırlar için kosinüs benzerliği (ölü satırlar -inf)"""
+        scores = _matmul(self.base, self.base_scales, query)
+        if len(self.tail):
+            scores = np.concatenate([scores, _matmul(self.tail, self.tail_scales, query)])
+        if self.has_dead:
+            scores[~self.alive] = -np.inf
+        return scores
+
+
+class FaceGalleryIndex:
+    """
+    Aktif yüz vektörlerini süreç belleğinde tutan galeri indeksi.
+
+    Vektörler boyutlarına göre gruplanır; her grup L2-normalize edilmiş bir
+    float32 matris ve ona paralel bir id dizisinden oluşur. Bir sorgu tek bir
+    matris-vektör çarpımı ve argpartition ile en iyi k sonuca indirgenir.
+
+    İsteğe bağlı 'ivf' arka ucu, büyük galerilerde yalnızca sorguya yakın
+    kümeleri tarayan yaklaşık bir arama yapar. Veritabanındaki değişiklikler
+    updated_at üzerinden artımlı olarak uygulanır.
+
+    FACE_INDEX_PRECISION 'float16' ya da 'int8' ise matrisler nicemli tutulur;
+    kaba taramadan gelen en iyi adaylar grubun disk üzerinde eşlenmiş float32
+    kopyasıyla yeniden sıralanır.
+
+    FACE_GALLERY_SHARED_MEMORY açıksa taban matrisler host başına tek bir
+    paylaşılan bellek segmentinde tutulur; her worker yalnızca son yayından
+    sonraki değişiklikleri kendi kuyruğunda taşır.
+    """
+
+    def __init__(self, name, queryset_factory, vector_field='vector_data', persistent=True):
+        self.name = name
+        self.persistent = persistent  # anlık görüntü ve paylaşılan bellek kullanılsın mı
+        self._queryset_factory = queryset_factory
+        self._vector_field = vector_field
+        self._groups = {}  # {vector_size: _VectorGroup}
+        self._signature = None
+        self._lock = threading.RLock()
+        self._shared = None
+        self._shared_generation = None
+        # Değişiklikler kanal katmanından geliyorsa veritabanı yalnızca bu aralıkla yoklanır
+        self.poll_interval = 0
+        self._checked_at = 0.0
+        self.version = 0  # her değişiklikte artar (sonuç önbellekleri için)
+
+    def __len__(self):
+        return sum(len(group) for group in self._groups.values())
+
+    def _db_signature(self):
+        """Tablo değiştiğinde değişen ucuz bir özet (satır sayısı + son güncelleme)"""
+        stats = self._queryset_factory().aggregate(
+            count=Count('pk'),
+            last_update=Max('updated_at'),
+        )
+        return (stats['count'], stats['last_update'])
+
+    @property
+    def precision(self):
+        precision = getattr(settings, 'FACE_INDEX_PRECISION', 'float32')
+        if precision not in INDEX_PRECISIONS:
+            raise ValueError(f"Unknown index precision '{precision}', expected one of {INDEX_PRECISIONS}")
+        return precision
+
+    def fetch_vectors(self):
+        """
+        Veritabanından yalnızca id ve vektör sütunlarını oku.
+        :return: {vector_size: (ids, normalize float32 matris)}
+        """
+        ids_by_size = {}
+        vectors_by_size = {}
+
+        rows = self._queryset_factory().values_list('pk', self._vector_field)
+        for pk, raw in rows.iterator(chunk_size=2000):
+            if not raw:
+                continue
+            vector = np.frombuffer(raw, dtype=np.float32)
+            ids_by_size.setdefault(len(vector), []).append(pk)
+            vectors_by_size.setdefault(len(vector), []).append(vector)
+
+        return {
+            size: (ids_by_size[size], _normalize(np.vstack(vectors)))
+            for size, vectors in vectors_by_size.items()
+        }
+
+    def _load(self):
+        """Veritabanındaki vektörlerden grupları baştan oluştur"""
+        precision = self.precision
+        groups = {}
+        for size, (ids, matrix) in self.fetch_vectors().items():
+            group = _VectorGroup(size, ids, matrix, precision)
+            previous = self._groups.get(size)
+            if previous is not None and previous.ivf is not None:
+                # Önceki merkezleri koru, yalnızca satırları yeniden ata
+                group.build_ivf(centroids=previous.ivf.centroids, trained_rows=previous.ivf.trained_rows)
+            groups[size] = group
+        return groups
+
+    def _load_snapshot(self):
+        """Diskteki anlık görüntüyü bellek eşlemeli olarak yükle; başarılıysa True"""
+        snapshot = read_snapshot(self.name)
+        if snapshot is None:
+            return False
+        signature, precision, groups = snapshot
+        if precision != self.precision:
+            return False
+
+        self._groups = {
+            size: _VectorGroup(size, ids, None, precision, encoded=(codes, scales), exact=exact)
+            for size, (ids, codes, scales, exact) in groups.items()
+        }
+        self._signature = signature
+        logger.info(f"Face gallery '{self.name}' mapped from snapshot: {len(self)} vectors")
+        return True
+
+    def write_snapshot(self):
+        """Galerinin o anki halini diske yaz (yönetim komutu ve arka plan yazıcısı)"""
+        with self._lock:
+            signature = self._signature
+            states = {size: group.snapshot() for size, group in self._groups.items()}
+        if signature is None:
+            return False
+        # Dışa aktarım kilit dışında yapılır; taban değişmez, kuyruk yalnızca büyür
+        groups = {size: state.export() for size, state in states.items()}
+        return write_snapshot(self.name, signature, self.precision, groups)
+
+    def _shared_gallery(self):
+        if not self.persistent or not getattr(settings, 'FACE_GALLERY_SHARED_MEMORY', False):
+            return None
+        if self._shared is None:
+            self._shared = SharedGallery(self.name)
+        return self._shared
+
+    def _attach_shared(self):
+        """Yazıcı yeni bir nesil yayınladıysa grupları paylaşılan segmente yeniden eşle"""
+        shared = self._shared_gallery()
+        if shared is None:
+            return
+        generation = shared.generation()
+        if generation is None or generation == self._shared_generation:
+            return
+        with self._lock:
+            if generation == self._shared_generation:
+                return
+            attached = shared.attach(generation)
+            if attached is None:
+                return
+            signature, precision, groups = attached
+            if precision != self.precision:
+                return
+            attached_groups = {}
+            for size, (ids, codes, scales, exact) in groups.items():
+                group = _VectorGroup(size, ids, None, precision, encoded=(codes, scales), shared=True, exact=exact)
+                previous = self._groups.get(size)
+                if previous is not None and previous.ivf is not None:
+                    group.build_ivf(centroids=previous.ivf.centroids, trained_rows=previous.ivf.trained_rows)
+                attached_groups[size] = group
+            self._groups = attached_groups
+            self._signature = signature
+            self._shared_generation = generation
+            # Bu sürecin nesilden sonra uyguladığı değişiklikler (silmeler dahil) segmentte
+            # olmayabilir; nesil imzasından itibaren veritabanıyla hemen yeniden eşitlenir
+            current = self._db_signature()
+            if not self._sync(current, full_check=True):
+                self._groups = self._load()
+            self._signature = current
+            self._checked_at = time.monotonic()
+            self.version += 1
+        logger.info(f"Face gallery '{self.name}' attached to shared memory generation {generation}")
+
+    def _publish_shared(self, signature):
+        """
+        Yazıcı süreçte, galeri paylaşılan segmentten yeterince uzaklaştıysa yeni nesil yayınla.
+        Okuyucular aradaki küçük değişiklikleri kendi artımlı senkronizasyonlarıyla uygular.
+        """
+        shared = self._shared_gallery()
+        if shared is None or not shared.is_writer:
+            return
+        republish_rows = getattr(settings, 'FACE_GALLERY_SHARED_REPUBLISH_ROWS', 256)
+        if self._shared_generation is not None and all(
+            group.shared and group.tail_count + group.dead_count < republish_rows
+            for group in self._groups.values()
+        ):
+            return
+        groups = {size: group.snapshot().export() for size, group in self._groups.items()}
+        shared.publish(signature, self.precision, groups)
+
+    def _changed_since(self, last_update):
+        """Verilen zamandan sonra eklenen ya da güncellenen satırlar"""
+        return self._queryset_factory().filter(updated_at__gte=last_update)
+
+    def _sync(self, signature, full_check=False):
+        """
+        Son senkronizasyondan beri değişen satırları artımlı olarak uygula.
+        full_check True ise satır sayısı tutsa da silinen/pasifleşen satırlar aranır
+        (aynı aralıkta bir silme ve bir ekleme sayıyı değiştirmez).
+        """
+        last_update = self._signature[1]
+        if last_update is not None:
+            changed = self._changed_since(last_update)
+            for pk, raw in changed.values_list('pk', self._vector_field).iterator(chunk_size=2000):
+                if raw:
+                    self.add(pk, raw)
+
+        # Sayı tutmuyorsa silinen ya da pasifleşen satırları bul
+        if full_check or len(self) != signature[0]:
+            current = set(self._queryset_factory().values_list('pk', flat=True))
+            for group in self._groups.values():
+                for pk in [pk for pk in group.row_of if pk not in current]:
+                    group.remove(pk)
+
+        for size, group in list(self._groups.items()):
+            if group.needs_compaction():
+                self._groups[size] = group.compacted()
+
+        return len(self) == signature[0]
+
+    def refresh(self):
+        """Veritabanı değiştiyse indeksi güncelle"""
+        self._attach_shared()
+        if self._signature is not None and time.monotonic() - self._checked_at < self.poll_interval:
+            return
+        self._checked_at = time.monotonic()
+        signature = self._db_signature()
+        if signature == self._signature:
+            return
+        with self._lock:
+            if signature == self._signature:
+                return
+            if self._signature is None and self.persistent:
+                # Soğuk başlangıç: önce anlık görüntüyü eşle, sonra updated_at'ten yetiş
+                self._load_snapshot()
+            if self._signature is None or not self._sync(signature):
+                self._groups = self._load()
+                logger.info(
+                    f"Face gallery '{self.name}' rebuilt: "
+                    f"{len(self)} vectors in {len(self._groups)} size group(s)"
+                )
+            self._signature = signature
+            self.version += 1
+            self._publish_shared(signature)
+        # Yazıcı kendi yayınladığı segmente geçerek özel kopyasını bırakır
+        self._attach_shared()
+        if self.persistent:
+            snapshot_writer.schedule(self)
+
+    def add(self, pk, raw):
+        """Tek bir vektörü ekle ya da güncelle (artımlı ekleme)"""
+        vector = np.frombuffer(raw, dtype=np.float32) if isinstance(raw, (bytes, memoryview)) else raw
+        vector = _normalize(vector)[0]
+        with self._lock:
+            for size, group in self._groups.items():
+                if size != len(vector):
+                    group.remove(pk)
+            group = self._groups.get(len(vector))
+            if group is None:
+                group = _VectorGroup(len(vector), [], np.empty((0, len(vector)), dtype=np.float32), self.precision)
+                self._groups[len(vector)] = group
+            group.add(pk, vector)
+            self.version += 1
+
+    def remove(self, pk):
+        """Tek bir vektörü indeksten çıkar (artımlı silme)"""
+        with self._lock:
+            for group in self._groups.values():
+                group.remove(pk)
+            self.version += 1
+
+    def apply_delta(self, added, removed):
+        """
+        Sinyallerden ya da diğer süreçlerden gelen değişiklikleri uygula.
+        Henüz yüklenmemiş galeri ilk refresh() ile zaten güncel halini okur.
+        :param added: {pk: vektör baytları}
+        :param removed: [pk, ...]
+        """
+        with self._lock:
+            if self._signature is None:
+                return
+            for pk in removed:
+                self.remove(pk)
+            for pk, raw in added.items():
+                self.add(pk, raw)
+
+    def sample(self, count, seed=0):
+        """Ölçüm komutları için en büyük boyut grubundan rastgele vektörler döndür"""
+        self.refresh()
+        with self._lock:
+            if not self._groups:
+                return np.empty((0, 0), dtype=np.float32)
+            group = max(self._groups.values(), key=len)
+            live_rows = np.flatnonzero(group.alive[:group.row_count])
+            rng = np.random.default_rng(seed)
+            chosen = rng.choice(live_rows, min(count, len(live_rows)), replace=False)
+            return group.rows(chosen)
+
+    def _resolve_backend(self, backend):
+        backend = backend or getattr(settings, 'FACE_INDEX_BACKEND', 'exact')
+        if backend not in INDEX_BACKENDS:
+            raise ValueError(f"Unknown index backend '{backend}', expected one of {INDEX_BACKENDS}")
+        return backend
+
+    def _ivf_group(self, group):
+        """Grup yeterince büyükse IVF bölümlemesini hazırla"""
+        if len(group) < getattr(settings, 'FACE_INDEX_IVF_MIN_ROWS', 2000):
+            return False
+        if group.ivf is None:
+            with self._lock:
+                if group.ivf is None:
+                    group.build_ivf(nlist=getattr(settings, 'FACE_INDEX_IVF_NLIST', 0))
+                    logger.info(
+                        f"Face gallery '{self.name}' IVF built: "
+                        f"{group.ivf.nlist} lists over {len(group)} vectors"
+                    )
+        return True
+
+    def _rerank(self, group, candidate_lists, queries):
+        """
+        Nicemli taramadan gelen adayları grubun float32 satırlarıyla yeniden puanla.
+        Arada silinen adaylar atlanır.
+        """
+        pks = list({pk for candidates in candidate_lists for pk, _ in candidates})
+        with self._lock:
+            pks = [pk for pk in pks if pk in group.row_of]
+            vectors = group.exact_rows([group.row_of[pk] for pk in pks])
+        exact_vectors = dict(zip(pks, vectors))
+
+        reranked_lists = []
+        for candidates, query in zip(candidate_lists, queries):
+            reranked = [(pk, float(exact_vectors[pk] @ query)) for pk, _ in candidates if pk in exact_vectors]
+            reranked.sort(key=lambda item: item[1], reverse=True)
+            reranked_lists.append(reranked)
+        return reranked_lists
+
+    def _candidates(self, group, queries, k, backend, nprobe):
+        """Her sorgu için gruptaki en iyi k adayı [(pk, score), ...] olarak döndür"""
+        if backend == 'ivf' and self._ivf_group(group):
+            # IVF adayları sorguya göre değiştiği için sorgular tek tek puanlanır
+            nprobe = nprobe or getattr(settings, 'FACE_INDEX_IVF_NPROBE', 8)
+            candidate_lists = []
+            for query in queries:
+                with self._lock:
+                    ids = group.ids
+                    rows, scores = group.candidate_scores(query, nprobe)
+                candidate_lists.append([(ids[rows[i]], float(scores[i])) for i in _top_k(scores, k)])
+            return candidate_lists
+
+        with self._lock:
+            snapshot = group.snapshot()
+        # Tüm sorgular için tek matris-matris çarpımı: (satır x sorgu)
+        scores = snapshot.scores(np.ascontiguousarray(queries.T))
+        return [
+            [(snapshot.ids[i], float(scores[i, q])) for i in _top_k(scores[:, q], k)]
+            for q in range(len(queries))
+        ]
+
+    def _query_groups(self, queries):
+        """Sorguları normalize edip vektör boyutuna göre grupla -> {size: (konumlar, matris)}"""
+        self.refresh()
+        by_size = {}
+        for position, query in enumerate(queries):
+            query = np.asarray(query, dtype=np.float32).ravel()
+            query_norm = np.linalg.norm(query)
+            if query_norm == 0:
+                continue
+            by_size.setdefault(len(query), []).append((position, query / query_norm))
+
+        batches = {}
+        for size, items in by_size.items():
+            group = self._groups.get(size)
+            if group is None or len(group) == 0:
+                continue
+            batches[size] = (group, [position for position, _ in items], np.vstack([q for _, q in items]))
+        return batches.values()
+
+    def _ranked_candidates(self, group, queries, k, backend, nprobe):
+        """Adayları bul; nicemli depolamada float32 ile yeniden sırala"""
+        if group.precision == 'float32':
+            return self._candidates(group, queries, k, backend, nprobe)
+        rerank_k = max(k, getattr(settings, 'FACE_INDEX_RERANK_CANDIDATES', 50))
+        return self._rerank(group, self._candidates(group, queries, rerank_k, backend, nprobe), queries)
+
+    def search_batch(self, queries, threshold, max_results, backend=None, nprobe=None):
+        """
+        Birden çok sorgu için search(); aynı boyuttaki sorgular tek çarpımda puanlanır.
+        :return: her sorgu için [(pk, similarity), ...]
+        """
+        backend = self._resolve_backend(backend)
+        results = [[] for _ in queries]
+        if max_results <= 0:
+            return results
+
+        for group, positions, matrix in self._query_groups(queries):
+            candidate_lists = self._ranked_candidates(group, matrix, max_results, backend, nprobe)
+            for position, candidates in zip(positions, candidate_lists):
+                results[position] = [
+                    (pk, score) for pk, score in candidates[:max_results] if score >= threshold
+                ]
+        return results
+
+    def search(self, query, threshold, max_results, backend=None, nprobe=None):
+        """
+        Sorgu vektörüne en benzer kayıtları döndür.
+        :param backend: 'exact' (kaba kuvvet) veya 'ivf' (yaklaşık); None ise ayardan
+        :param nprobe: ivf için taranacak küme sayısı
+        :return: benzerliğe göre azalan sırada [(pk, similarity), ...]
+        """
+        return self.search_batch([query], threshold, max_results, backend=backend, nprobe=nprobe)[0]
+
+    def best_match_batch(self, queries):
+        """
+        Birden çok sorgu için best_match(); tek matris-matris çarpımı ve argmax.
+        :return: her sorgu için (pk, similarity) ya da (None, 0.0)
+        """
+        results = [(None, 0.0)] * len(queries)
+        for group, positions, matrix in self._query_groups(queries):
+            candidate_lists = self._ranked_candidates(group, matrix, 1, 'exact', None)
+            for position, candidates in zip(positions, candidate_lists):
+                if candidates and candidates[0][1] > 0:
+                    results[position] = candidates[0]
+        return results
+
+    def best_match(self, query):
+        """
+        Sorguya en benzer tek kaydı döndür (1:N doğrulama için).
+        :return: (pk, similarity); pozitif benzerlikte eşleşme yoksa (None, 0.0)
+        """
+        return self.best_match_batch([query])[0]
+
+
+class DoorGalleryIndex(FaceGalleryIndex):
+    """
+    Yalnızca bir kapıdan geçme yetkisi olan kullanıcıların embedding galerisi.
+    Yetki verilip geri alındıkça sinyallerle artımlı güncellenir; küçük olduğu
+    için anlık görüntü ve paylaşılan bellek kullanmaz.
+    """
+
+    def __init__(self, door_id):
+        self.door_id = door_id
+        super().__init__(
+            f"door_{door_id}",
+            lambda: User.objects.filter(
+                is_face_registered=True,
+                face_embedding__isnull=False,
+                pk__in=DoorAccess.objects.filter(door_id=door_id).values('user_id'),
+            ),
+            vector_field='face_embedding',
+            persistent=False,
+        )
+
+    def _db_signature(self):
+        # Yetki eklemeleri kullanıcının updated_at alanını değiştirmez
+        count, last_update = super()._db_signature()
+        last_grant = DoorAccess.objects.filter(door_id=self.door_id).aggregate(last=Max('created_at'))['last']
+        return (count, max(filter(None, (last_update, last_grant)), default=None))
+
+    def _changed_since(self, last_update):
+        granted = DoorAccess.objects.filter(door_id=self.door_id, created_at__gte=last_update)
+        return self._queryset_factory().filter(
+            Q(updated_at__gte=last_update) | Q(pk__in=granted.values('user_id'))
+        )
+
+
+# Süreç düzeyinde paylaşılan indeksler
+face_vector_index = FaceGalleryIndex(
+    'face_vectors',
+    lambda: FaceVector.objects.filter(is_active=True),
+)
+anonymous_face_vector_index = FaceGalleryIndex(
+    'anonymous_face_vectors',
+    lambda: AnonymousFaceVector.objects.filter(is_active=True),
+)
+# Yüz kaydı yapılmış kullanıcıların embedding galerisi (FaceVerificationView)
+user_embedding_index = FaceGalleryIndex(
+    'user_embeddings',
+    lambda: User.objects.filter(is_face_registered=True, face_embedding__isnull=False),
+    vector_field='face_embedding',
+)
+
+galleries = {
+    index.name: index
+    for index in (face_vector_index, anonymous_face_vector_index, user_embedding_index)
+}
+# Kapı bazlı yetkili kullanıcı galerileri; ilk kullanımda oluşturulur
+door_galleries = {}
+_door_galleries_lock = threading.Lock()
+
+
+def door_gallery(door_id):
+    """Kapının yetkili kullanıcı galerisini döndür (yoksa oluştur)"""
+    name = f"door_{door_id}"
+    index = door_galleries.get(name)
+    if index is None:
+        with _door_galleries_lock:
+            index = door_galleries.get(name)
+            if index is None:
+                index = DoorGalleryIndex(door_id)
+                index.poll_interval = user_embedding_index.poll_interval
+                door_galleries[name] = index
+    return index
+
+
+def get_gallery(name):
+    """Ada göre galeri (kanal katmanından gelen değişiklikler için); yüklü değilse None"""
+    return galleries.get(name) or door_galleries.get(name)
+
+
+def warm_up():
+    """Worker başlarken galerileri önceden belleğe yükle"""
+    for index in galleries.values():
+        try:
+            index.refresh()
+        except Exception as e:
+            # Veritabanı henüz hazır değilse ilk istekte tembel olarak yüklenir
+            logger.warning(f"Face gallery '{index.name}' warm-up skipped: {e}")
@@ -0,0 +1,188 @@
+# api/face_models.py
+import glob
+import logging
+import os
+import threading
+
+import numpy as np
+import onnxruntime
+from django.conf import settings
+from insightface.model_zoo.model_zoo import ModelRouter
+from insightface.utils import ensure_available
+
+from .image_decode import detection_size, detection_sizes
+
+logger = logging.getLogger(__name__)
+
+PROVIDERS = ['CPUExecutionProvider']
+
+GRAPH_OPTIMIZATION_LEVELS = {
+    'disable': onnxruntime.GraphOptimizationLevel.ORT_DISABLE_ALL,
+    'basic': onnxruntime.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+    'extended': onnxruntime.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+    'all': onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL,
+}
+
+EXECUTION_MODES = {
+    'sequential': onnxruntime.ExecutionMode.ORT_SEQUENTIAL,
+    'parallel': onnxruntime.ExecutionMode.ORT_PARALLEL,
+}
+
+
+def intra_op_threads():
+    """
+    Oturum başına intra-op iş parçacığı sayısı. Ayar verilmemişse çekirdekler
+    çıkarım süreçleri arasında paylaştırılır; 0 ONNX Runtime varsayılanıdır.
+    """
+    threads = getattr(settings, 'FACE_ONNX_INTRA_OP_THREADS', None)
+    if threads is None:
+        workers = max(getattr(settings, 'FACE_INFERENCE_WORKERS', 2), 1)
+        threads = max((os.cpu_count() or 1) // workers, 1)
+    return threads
+
+
+def session_options():
+    """FACE_ONNX_* ayarlarından ONNX Runtime oturum seçenekleri"""
+    options = onnxruntime.SessionOptions()
+    options.intra_op_num_threads = intra_op_threads()
+    options.inter_op_num_threads = getattr(settings, 'FACE_ONNX_INTER_OP_THREADS', 1)
+    options.graph_optimization_level = GRAPH_OPTIMIZATION_LEVELS[getattr(settings, 'FACE_ONNX_GRAPH_OPTIMIZATION', 'all')]
+    options.execution_mode = EXECUTION_MODES[getattr(settings, 'FACE_ONNX_EXECUTION_MODE', 'sequential')]
+    if not getattr(settings, 'FACE_ONNX_ALLOW_SPINNING', False):
+        # Boşta dönen iş parçacıkları istek iş parçacıklarıyla CPU için yarışmasın
+        options.add_session_config_entry('session.intra_op.allow_spinning', '0')
+        options.add_session_config_entry('session.inter_op.allow_spinning', '0')
+    return options
+
+
+def load_model(model_file, options=None):
+    """
+    ONNX dosyasını insightface modeli olarak yükle; oturum ilk oluşturulurken
+    session_options() ile açılır. model_zoo.get_model oturum seçeneklerini
+    iletmediği için ModelRouter doğrudan kullanılır.
+    :return: SCRFD / ArcFaceONNX vb. ya da tanınmayan modelde None
+    """
+    return ModelRouter(model_file).get_model(sess_options=options or session_options(), providers=PROVIDERS)
+
+
+def load_package(name, tasks=('detection', 'recognition'), options=None):
+    """
+    insightface model paketinden (ör. buffalo_l) istenen görevlerin modellerini yükle.
+    FaceAnalysis yerine kullanılır: her oturum bir kez, ayarlardaki seçeneklerle
+    açılır ve paket 'detection' içermek zorunda değildir.
+    :return: {görev adı: model}
+    """
+    options = options or session_options()
+    model_dir = ensure_available('models', name, root='~/.insightface')
+    models = {}
+    for model_file in sorted(glob.glob(os.path.join(model_dir, '*.onnx'))):
+        model = load_model(model_file, options)
+        if model is not None and model.taskname in tasks and model.taskname not in models:
+            models[model.taskname] = model
+    missing = [task for task in tasks if task not in models]
+    if missing:
+        raise ValueError(f"Model package '{name}' has no {', '.join(missing)} model")
+    return models
+
+
+def load_recognizer(model_file, reference=None, options=None):
+    """
+    Ayrı bir ArcFace ONNX dosyasını (ör. INT8 nicemlenmiş) tanıma modeli olarak yükle.
+    Nicemlenmiş grafikte giriş normalizasyonu algılanamayabileceği için
+    reference modelin input_mean/input_std değerleri kullanılır.
+    """
+    recognizer = load_model(model_file, options)
+    if recognizer is None or recognizer.taskname != 'recognition':
+        raise ValueError(f"{model_file} is not a face recognition model")
+    if reference is not None:
+        recognizer.input_mean = reference.input_mean
+        recognizer.input_std = reference.input_std
+    return recognizer
+
+
+class FaceAnalysisModels:
+    """Yüklü tespit ve tanıma modelleri; FaceAnalysis ile aynı alan adları (models, det_model)"""
+
+    def __init__(self, models):
+        self.models = models
+        self.det_model = models['detection']
+
+
+class FaceModelRegistry:
+    """
+    Yüz analiz modellerinin (SCRFD dedektörü + ArcFace) süreç başına tek kopyası.
+
+    Modeller ilk kullanımda bir kez yüklenir ve tüm view'lar tarafından paylaşılır;
+    ONNX Runtime oturumları eşzamanlı çağrılar için güvenlidir.
+    """
+
+    def __init__(self):
+        self._models = {}  # {model adı: FaceAnalysisModels}
+        self._detection_sizes = {}  # {model adı: dedektörün desteklediği uyarlanabilir boyutlar}
+        self._lock = threading.Lock()
+
+    def get(self, name=None):
+        """Modeli döndür; yüklü değilse yükle (yükleme hatası çağırana iletilir)"""
+        name = name or getattr(settings, 'FACE_ANALYSIS_MODEL', 'buffalo_l')
+        analyzer = self._models.get(name)
+        if analyzer is None:
+            with self._lock:
+                analyzer = self._models.get(name)
+                if analyzer is None:
+                    analyzer = self._load(name)
+                    self._models[name] = analyzer
+        return analyzer
+
+    def detection_sizes(self, name=None):
+        """Modelin uyarlanabilir tespitte sırayla deneyeceği SCRFD giriş boyutları"""
+        name = name or getattr(settings, 'FACE_ANALYSIS_MODEL', 'buffalo_l')
+        self.get(name)
+        return self._detection_sizes[name]
+
+    def _load(self, name):
+        det_size = detection_size()
+        options = session_options()
+        # SCRFD + ArcFace; oturumlar CPU sağlayıcısı ve ayarlardaki seçeneklerle tek seferde açılır
+        analyzer = FaceAnalysisModels(load_package(name, ('detection', 'recognition'), options))
+        # Sabit girişli SCRFD dışa aktarımları yalnızca kendi boyutunda çalışır (prepare'den önce okunur);
+        # dinamik girişli modelde (buffalo_l) aynı oturum tüm boyutlara hizmet eder
+        fixed_size = getattr(analyzer.det_model, 'input_size', None)
+        self._detection_sizes[name] = (tuple(fixed_size),) if fixed_size else detection_sizes()
+        # ctx_id < 0 prepare'de set_providers ile oturumu yeniden kurar; sağlayıcı zaten CPU olduğundan 0 verilir
+        analyzer.det_model.prepare(0, input_size=det_size, det_thresh=0.5)
+        analyzer.models['recognition'].prepare(0)
+
+        recognition_model = getattr(settings, 'FACE_RECOGNITION_MODEL_PATH', None)
+        if recognition_model:
+            analyzer.models['recognition'] = load_recognizer(
+                recognition_model, reference=analyzer.models['recognition'], options=options
+            )
+            logger.info(f"Face recognition model replaced with {recognition_model}")
+
+        logger.info(
+            f"Face analysis model '{name}' loaded (det_sizes={self._detection_sizes[name]}, "
+            f"intra_op_threads={options.intra_op_num_threads}, inter_op_threads={options.inter_op_num_threads})"
+        )
+        return analyzer
+
+    def warm_up(self):
+        """
+        Modeli yükle ve boş girdilerle birer çıkarım yaparak ONNX oturumlarını ısıt.
+        Dedektör her uyarlanabilir boyutta bir kez çalıştırılır; SCRFD'nin çapa
+        merkezleri ve ONNX Runtime'ın şekil başına bellek planları önceden oluşur.
+        """
+        try:
+            analyzer = self.get()
+            det_width, det_height = detection_size()
+            image = np.zeros((det_height, det_width, 3), dtype=np.uint8)
+            for size in self.detection_sizes():
+                analyzer.det_model.detect(image, input_size=size, max_num=0, metric='default')
+            recognition = analyzer.models.get('recognition')
+            if recognition is not None:
+                recognition.get_feat(np.zeros((112, 112, 3), dtype=np.uint8))
+        except Exception as e:
+            # Model dosyaları yoksa ilk kayıt isteğinde tekrar denenir
+            logger.warning(f"Face analysis model warm-up skipped: {e}")
+
+
+face_models = FaceModelRegistry()
@@ -0,0 +1,242 @@
+# api/gallery_shm.py
+import fcntl
+import json
+import logging
+import os
+import struct
+import tempfile
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+from .gallery_snapshot import encode_ids, decode_ids, encode_signature, decode_signature, snapshot_dir
+
+logger = logging.getLogger(__name__)
+
+_CONTROL_FORMAT = '<q'  # generation (int64)
+_ALIGNMENT = 64
+
+
+def _open_segment(name, create=False, size=0):
+    """
+    SharedMemory segmentini aç/oluştur ve resource_tracker'dan çıkar.
+    Segmentlerin ömrünü tek yazıcı yönetir; bir worker'ın çıkışı segmenti silmemeli.
+    """
+    try:
+        return shared_memory.SharedMemory(name=name, create=create, size=size, track=False)
+    except TypeError:
+        # Python < 3.13: track parametresi yok
+        segment = shared_memory.SharedMemory(name=name, create=create, size=size)
+        try:
+            resource_tracker.unregister(segment._name, 'shared_memory')
+        except Exception:
+            pass
+        return segment
+
+
+def _unlink_segment(name):
+    """Segment adını sil; eşlemesi açık olan süreçler belleği kullanmaya devam eder"""
+    try:
+        segment = _open_segment(name)
+    except FileNotFoundError:
+        return
+    if not hasattr(segment, '_track'):
+        # Python < 3.13: unlink() kaydı tracker'dan düşmeye çalışır, önce yeniden kaydet
+        resource_tracker.register(segment._name, 'shared_memory')
+    segment.unlink()
+    segment.close()
+
+
+def _aligned(offset):
+    return (offset + _ALIGNMENT - 1) // _ALIGNMENT * _ALIGNMENT
+
+
+class SharedGallery:
+    """
+    Bir galerinin host başına tek kopyasını multiprocessing.shared_memory içinde tutar.
+
+    Küçük bir kontrol segmenti geçerli nesil (generation) numarasını taşır; her
+    yayında '<önek>_<nesil>' adlı yeni bir veri segmenti oluşturulur ve ardından
+    nesil numarası artırılır. Okuyucular nesil değiştiğinde yeni segmente bağlanır.
+    Nicemli galerilerin yeniden sıralamada kullanılan float32 satırları segmente
+    değil, nesille birlikte yazılan ve bellek eşlemeli açılan .npy dosyalarına konur.
+    Yazıcı, dosya kilidini ilk alan süreçtir; o süreç ölürse kilidi bir sonraki alır.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._prefix = f"fg_{name}"  # macOS'ta segment adları 31 karakterle sınırlı
+        self._lock_file = None
+        self._control = None
+        self._segments = {}  # {generation: SharedMemory}
+        self._retired = []
+
+    @property
+    def is_writer(self):
+        """Yazıcı kilidini almayı dene; alınmışsa süreç ömrü boyunca tutulur"""
+        if self._lock_file is not None:
+            return True
+        lock_file = open(os.path.join(tempfile.gettempdir(), f"{self._prefix}.lock"), 'w')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        logger.info(f"Process {os.getpid()} is the shared memory writer for face gallery '{self.name}'")
+        return True
+
+    def _exact_path(self, generation, size):
+        directory = snapshot_dir() or tempfile.gettempdir()
+        return os.path.join(directory, f"{self._prefix}_{generation}_{size}.exact.npy")
+
+    def _remove_exact_files(self, generation):
+        directory = snapshot_dir() or tempfile.gettempdir()
+        try:
+            file_names = os.listdir(directory)
+        except FileNotFoundError:
+            return
+        for file_name in file_names:
+            if file_name.startswith(f"{self._prefix}_{generation}_") and file_name.endswith('.exact.npy'):
+                try:
+                    os.remove(os.path.join(directory, file_name))
+                except OSError:
+                    pass
+
+    def generation(self):
+        """Kontrol segmentindeki geçerli nesil; henüz yayın yoksa None"""
+        if self._control is None:
+            try:
+                self._control = _open_segment(self._prefix)
+            except FileNotFoundError:
+                return None
+        generation, = struct.unpack_from(_CONTROL_FORMAT, self._control.buf, 0)
+        return generation or None
+
+    def attach(self, generation):
+        """
+        Verilen nesildeki veri segmentine bağlan (kopyasız numpy görünümleri).
+        :return: (signature, precision, {size: (ids, codes, scales, exact)}) ya da None
+        """
+        try:
+            segment = self._segments.get(generation) or _open_segment(f"{self._prefix}_{generation}")
+        except FileNotFoundError:
+            return None
+
+        header_length, = struct.unpack_from('<Q', segment.buf, 0)
+        header = json.loads(bytes(segment.buf[8:8 + header_length]))
+        data_start = _aligned(8 + header_length)
+
+        groups = {}
+        for size, group in header['groups'].items():
+            rows = len(group['ids'])
+            codes = np.ndarray(
+                (rows, int(size)), dtype=group['dtype'],
+                buffer=segment.buf, offset=data_start + group['codes_offset'],
+            )
+            codes.flags.writeable = False
+            scales = None
+            if group['scales_offset'] is not None:
+                scales = np.ndarray(
+                    (rows,), dtype=np.float32,
+                    buffer=segment.buf, offset=data_start + group['scales_offset'],
+                )
+                scales.flags.writeable = False
+            exact = None
+            if group.get('exact'):
+                try:
+                    exact = np.load(self._exact_path(generation, size), mmap_mode='r')
+                except FileNotFoundError:
+                    # Yazıcı bu arada daha yeni bir nesil yayınlamış
+                    return None
+            groups[int(size)] = (decode_ids(header['pk_type'], group['ids']), codes, scales, exact)
+
+        self._retire_except(generation, segment)
+        return decode_signature(header['signature']), header['precision'], groups
+
+    def _create_segment(self, generation, size):
+        name = f"{self._prefix}_{generation}"
+        try:
+            return _open_segment(name, create=True, size=size)
+        except FileExistsError:
+            # Çöken bir yazıcıdan kalmış segment
+            _unlink_segment(name)
+            return _open_segment(name, create=True, size=size)
+
+    def publish(self, signature, precision, groups):
+        """Galeriyi yeni bir nesil olarak yaz ve okuyuculara duyur (yalnızca yazıcı)"""
+        header = {
+            'signature': encode_signature(signature),
+            'precision': precision,
+            'pk_type': 'int',
+            'groups': {},
+        }
+        # Ofsetler başlıktan sonraki veri bölgesinin başına görelidir
+        layout = []
+        offset = 0
+        for size, (ids, codes, scales, exact) in groups.items():
+            pk_type, encoded_ids = encode_ids(ids)
+            if encoded_ids:
+                header['pk_type'] = pk_type
+            entry = {
+                'ids': encoded_ids, 'dtype': codes.dtype.str, 'codes_offset': offset, 'scales_offset': None,
+                'exact': exact is not None,
+            }
+            offset = _aligned(offset + codes.nbytes)
+            if scales is not None:
+                entry['scales_offset'] = offset
+                offset = _aligned(offset + scales.nbytes)
+            header['groups'][str(size)] = entry
+            layout.append((entry, codes, scales))
+
+        header_bytes = json.dumps(header).encode()
+        data_start = _aligned(8 + len(header_bytes))
+
+        generation = (self.generation() or 0) + 1
+        for size, (_, _, _, exact) in groups.items():
+            if exact is not None:
+                os.makedirs(os.path.dirname(self._exact_path(generation, size)), exist_ok=True)
+                np.save(self._exact_path(generation, size), np.ascontiguousarray(exact, dtype=np.float32))
+        segment = self._create_segment(generation, max(data_start + offset, 1))
+        struct.pack_into('<Q', segment.buf, 0, len(header_bytes))
+        segment.buf[8:8 + len(header_bytes)] = header_bytes
+        for entry, codes, scales in layout:
+            target = np.ndarray(codes.shape, dtype=codes.dtype, buffer=segment.buf,
+                                offset=data_start + entry['codes_offset'])
+            target[:] = codes
+            if scales is not None:
+                target = np.ndarray(scales.shape, dtype=np.float32, buffer=segment.buf,
+                                    offset=data_start + entry['scales_offset'])
+                target[:] = scales
+            del target
+
+        if self._control is None:
+            try:
+                self._control = _open_segment(self._prefix)
+            except FileNotFoundError:
+                self._control = _open_segment(self._prefix, create=True, size=struct.calcsize(_CONTROL_FORMAT))
+        previous = self.generation()
+        self._segments[generation] = segment
+        struct.pack_into(_CONTROL_FORMAT, self._control.buf, 0, generation)
+
+        # Eski nesli sil; bağlı okuyucuların eşlemeleri açık kaldıkça geçerli kalır
+        if previous:
+            _unlink_segment(f"{self._prefix}_{previous}")
+            self._remove_exact_files(previous)
+
+        logger.info(f"Face gallery '{self.name}' published to shared memory (generation {generation})")
+        return generation
+
+    def _retire_except(self, generation, segment):
+        """Eski segmentleri kapat; hâlâ numpy görünümü olanlar sonraki denemeye kalır"""
+        for old_generation in [g for g in self._segments if g != generation]:
+            self._retired.append(self._segments.pop(old_generation))
+        self._segments[generation] = segment
+
+        still_used = []
+        for old in self._retired:
+            try:
+                old.close()
+            except BufferError:
+                still_used.append(old)
+        self._retired = still_used
@@ -0,0 +1,200 @@
+# api/gallery_snapshot.py
+import fcntl
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from datetime import datetime
+
+import numpy as np
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_FORMAT_VERSION = 2
+
+
+def snapshot_dir():
+    """Anlık görüntü dizini; ayar boşsa özellik kapalıdır"""
+    return getattr(settings, 'FACE_GALLERY_SNAPSHOT_DIR', None)
+
+
+def _sidecar_path(directory, name):
+    return os.path.join(directory, f"{name}.json")
+
+
+def encode_signature(signature):
+    count, last_update = signature
+    return [count, last_update.isoformat() if last_update else None]
+
+
+def decode_signature(value):
+    count, last_update = value
+    return (count, datetime.fromisoformat(last_update) if last_update else None)
+
+
+def encode_ids(ids):
+    """Birincil anahtarları JSON için metne çevir (UUID veya tamsayı)"""
+    pk_type = 'uuid' if ids and isinstance(ids[0], uuid.UUID) else 'int'
+    return pk_type, [str(pk) for pk in ids]
+
+
+def decode_ids(pk_type, ids):
+    if pk_type == 'uuid':
+        return [uuid.UUID(pk) for pk in ids]
+    return [int(pk) for pk in ids]
+
+
+def read_snapshot(name):
+    """
+    Diskteki galeri anlık görüntüsünü bellek eşlemeli olarak aç.
+    :return: (signature, precision, {size: (ids, codes, scales, exact)}) ya da None
+    """
+    directory = snapshot_dir()
+    if not directory:
+        return None
+    try:
+        with open(_sidecar_path(directory, name)) as sidecar_file:
+            sidecar = json.load(sidecar_file)
+        if sidecar.get('format') != SNAPSHOT_FORMAT_VERSION:
+            return None
+
+        groups = {}
+        for size, group in sidecar['groups'].items():
+            codes = np.load(os.path.join(directory, group['codes']), mmap_mode='r')
+            scales = None
+            if group.get('scales'):
+                scales = np.load(os.path.join(directory, group['scales']), mmap_mode='r')
+            exact = None
+            if group.get('exact'):
+                exact = np.load(os.path.join(directory, group['exact']), mmap_mode='r')
+            groups[int(size)] = (decode_ids(sidecar['pk_type'], group['ids']), codes, scales, exact)
+        return decode_signature(sidecar['signature']), sidecar['precision'], groups
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.warning(f"Face gallery snapshot '{name}' could not be read: {e}")
+        return None
+
+
+def write_snapshot(name, signature, precision, groups):
+    """
+    Galeriyi .npy dosyaları ve id/sürüm bilgisi içeren bir JSON eşlik dosyası olarak yaz.
+    Aynı anda yalnızca bir süreç yazar; diskteki görüntü zaten güncelse yazılmaz.
+    :param groups: {size: (ids, codes, scales, exact)}; exact nicemli depolamada float32 satırlardır
+    :return: yazıldıysa True
+    """
+    directory = snapshot_dir()
+    if not directory:
+        return False
+    os.makedirs(directory, exist_ok=True)
+
+    with open(os.path.join(directory, f"{name}.lock"), 'w') as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            # Başka bir worker şu anda yazıyor
+            return False
+
+        sidecar_path = _sidecar_path(directory, name)
+        encoded_signature = encode_signature(signature)
+        try:
+            with open(sidecar_path) as sidecar_file:
+                current = json.load(sidecar_file)
+            if current.get('signature') == encoded_signature and current.get('precision') == precision:
+                return False
+        except (FileNotFoundError, ValueError):
+            pass
+
+        version = uuid.uuid4().hex[:12]
+        sidecar = {
+            'format': SNAPSHOT_FORMAT_VERSION,
+            'version': version,
+            'signature': encoded_signature,
+            'precision': precision,
+            'pk_type': 'int',
+            'groups': {},
+        }
+        written = set()
+        for size, (ids, codes, scales, exact) in groups.items():
+            pk_type, encoded_ids = encode_ids(ids)
+            if encoded_ids:
+                sidecar['pk_type'] = pk_type
+            codes_file = f"{name}_{size}_{version}.npy"
+            np.save(os.path.join(directory, codes_file), np.ascontiguousarray(codes))
+            written.add(codes_file)
+            scales_file = None
+            if scales is not None:
+                scales_file = f"{name}_{size}_{version}.scales.npy"
+                np.save(os.path.join(directory, scales_file), np.ascontiguousarray(scales))
+                written.add(scales_file)
+            exact_file = None
+            if exact is not None:
+                exact_file = f"{name}_{size}_{version}.exact.npy"
+                np.save(os.path.join(directory, exact_file), np.ascontiguousarray(exact, dtype=np.float32))
+                written.add(exact_file)
+            sidecar['groups'][str(size)] = {
+                'ids': encoded_ids, 'codes': codes_file, 'scales': scales_file, 'exact': exact_file,
+            }
+
+        # Eşlik dosyası atomik olarak değiştirilir; okuyucular ya eskiyi ya yeniyi görür
+        tmp_path = f"{sidecar_path}.{version}.tmp"
+        with open(tmp_path, 'w') as sidecar_file:
+            json.dump(sidecar, sidecar_file)
+        os.replace(tmp_path, sidecar_path)
+
+        # Eski sürüm dosyalarını temizle (eşlenmiş dosyalar açık kaldıkça geçerli kalır)
+        for file_name in os.listdir(directory):
+            if file_name.startswith(f"{name}_") and file_name.endswith('.npy') and file_name not in written:
+                try:
+                    os.remove(os.path.join(directory, file_name))
+                except OSError:
+                    pass
+
+    logger.info(f"Face gallery snapshot '{name}' written (version {version})")
+    return True
+
+
+class SnapshotWriter:
+    """
+    Galeri değişikliklerinden sonra anlık görüntüyü arka planda yazan iş parçacığı.
+    Sık değişikliklerde yazımlar FACE_GALLERY_SNAPSHOT_INTERVAL saniye ile seyreltilir.
+    """
+
+    def __init__(self):
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._event = threading.Event()
+        self._thread = None
+
+    def schedule(self, index):
+        if not snapshot_dir():
+            return
+        with self._lock:
+            self._pending[index.name] = index
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='face-gallery-snapshot', daemon=True)
+                self._thread.start()
+        self._event.set()
+
+    def _run(self):
+        while True:
+            self._event.wait()
+            time.sleep(getattr(settings, 'FACE_GALLERY_SNAPSHOT_INTERVAL', 30))
+            with self._lock:
+                self._event.clear()
+                pending, self._pending = self._pending, {}
+            for index in pending.values():
+                try:
+                    index.write_snapshot()
+                except Exception as e:
+                    logger.error(f"Face gallery snapshot '{index.name}' write failed: {e}")
+            # Yazım sırasında yeni iş gelmediyse bir sonraki schedule() çağrısını bekle
+            with self._lock:
+                if not self._pending:
+                    self._event.clear()
+
+
+snapshot_writer = SnapshotWriter()
@@ -0,0 +1,170 @@
+# api/gallery_sync.py
+import asyncio
+import logging
+import threading
+import time
+import uuid
+
+from asgiref.sync import async_to_sync
+from channels.layers import InMemoryChannelLayer, get_channel_layer
+from django.conf import settings
+
+from .face_index import galleries, door_galleries, get_gallery
+from .gallery_snapshot import encode_ids, decode_ids
+
+logger = logging.getLogger(__name__)
+
+DELTA_GROUP = 'face_gallery_deltas'
+DELTA_MESSAGE_TYPE = 'gallery.delta'
+_GROUP_RENEW_SECONDS = 3600  # channels_redis grup üyeliği varsayılan olarak bir günde düşer
+_MAX_BATCH_COMMITS = 512  # tek mesajda birleştirilecek en fazla commit
+
+
+def encode_delta(added, removed):
+    """{pk: baytlar} eklemeleri ve silinen pk'ları kanal mesajına uygun hale getir"""
+    pk_type, encoded = encode_ids(list(added) + list(removed))
+    return {
+        'pk_type': pk_type,
+        'add': encoded[:len(added)],
+        'vectors': [bytes(raw) for raw in added.values()],
+        'remove': encoded[len(added):],
+    }
+
+
+def decode_delta(delta):
+    added = dict(zip(decode_ids(delta['pk_type'], delta['add']), delta['vectors']))
+    return added, decode_ids(delta['pk_type'], delta['remove'])
+
+
+class GalleryDeltaBus:
+    """
+    Galeri değişikliklerini süreçler arasında kanal katmanı üzerinden dağıtır.
+
+    Commit edilen her değişiklik önce yerel indekse uygulanır, sonra
+    DELTA_GROUP grubuna yalnızca değişen satırları içeren bir mesaj olarak
+    gönderilir. Dinleyici iş parçacığı diğer süreçlerin mesajlarını alıp kendi
+    indekslerine uygular; bu sürede galeriler veritabanını yalnızca
+    FACE_GALLERY_POLL_INTERVAL saniyede bir yoklar (kaçan değişiklikler için).
+
+    InMemoryChannelLayer süreç dışına çıkmadığı için yalnızca yerel uygulama yapılır.
+    """
+
+    def __init__(self):
+        self.origin = uuid.uuid4().hex
+        self._loop = None
+        self._queue = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def _layer(self):
+        layer = get_channel_layer()
+        if layer is None or isinstance(layer, InMemoryChannelLayer):
+            return None
+        return layer
+
+    def commit(self, index, added=None, removed=()):
+        """Commit edilmiş değişikliği yerel indekse uygula ve diğer süreçlere duyur"""
+        added = added or {}
+        removed = list(removed)
+        if not added and not removed:
+            return
+        index.apply_delta(added, removed)
+
+        if self._layer() is None:
+            return
+        if self._loop is not None and self._thread.is_alive():
+            self._loop.call_soon_threadsafe(self._queue.put_nowait, (index.name, added, removed))
+            return
+        # Dinleyicisi olmayan süreçler (yönetim komutları) mesajı doğrudan gönderir
+        try:
+            async_to_sync(self._send)(self._layer(), [(index.name, added, removed)])
+        except Exception as e:
+            logger.warning(f"Face gallery delta for '{index.name}' could not be published: {e}")
+
+    def start(self):
+        """Dinleyici iş parçacığını başlat; kanal katmanı süreçler arası değilse False"""
+        if self._layer() is None:
+            logger.info("Face gallery deltas are process-local (in-memory channel layer)")
+            return False
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='face-gallery-deltas', daemon=True)
+                self._thread.start()
+        return True
+
+    def _set_poll_interval(self, interval):
+        for index in [*galleries.values(), *door_galleries.values()]:
+            index.poll_interval = interval
+
+    def _run(self):
+        while True:
+            loop = asyncio.new_event_loop()
+            try:
+                loop.run_until_complete(self._listen(loop))
+            except Exception as e:
+                logger.error(f"Face gallery delta listener failed, falling back to polling: {e}")
+            finally:
+                self._loop = None
+                self._set_poll_interval(0)
+                loop.close()
+            time.sleep(5)
+
+    async def _listen(self, loop):
+        layer = self._layer()
+        channel = await layer.new_channel()
+        await layer.group_add(DELTA_GROUP, channel)
+        self._queue = asyncio.Queue()
+        self._loop = loop
+        self._set_poll_interval(getattr(settings, 'FACE_GALLERY_POLL_INTERVAL', 30))
+        logger.info(f"Face gallery delta listener subscribed as {channel}")
+
+        sender = asyncio.ensure_future(self._send_queued(layer, channel))
+        try:
+            while True:
+                message = await layer.receive(channel)
+                if message.get('type') != DELTA_MESSAGE_TYPE or message.get('origin') == self.origin:
+                    continue
+                for name, delta in message['deltas'].items():
+                    index = get_gallery(name)
+                    if index is not None:
+                        index.apply_delta(*decode_delta(delta))
+        finally:
+            sender.cancel()
+
+    async def _send_queued(self, layer, channel):
+        """Kuyruktaki değişiklikleri biriktirip tek mesajda gönder"""
+        while True:
+            try:
+                batch = [await asyncio.wait_for(self._queue.get(), _GROUP_RENEW_SECONDS)]
+            except asyncio.TimeoutError:
+                await layer.group_add(DELTA_GROUP, channel)
+                continue
+            while not self._queue.empty() and len(batch) < _MAX_BATCH_COMMITS:
+                batch.append(self._queue.get_nowait())
+            try:
+                await self._send(layer, batch)
+            except Exception as e:
+                logger.warning(f"Face gallery deltas could not be published: {e}")
+
+    async def _send(self, layer, batch):
+        # Aynı pk için son değişiklik geçerlidir
+        changes = {}
+        for name, added, removed in batch:
+            gallery_changes = changes.setdefault(name, {})
+            gallery_changes.update({pk: None for pk in removed})
+            gallery_changes.update(added)
+
+        deltas = {}
+        for name, gallery_changes in changes.items():
+            added = {pk: raw for pk, raw in gallery_changes.items() if raw is not None}
+            removed = [pk for pk, raw in gallery_changes.items() if raw is None]
+            deltas[name] = encode_delta(added, removed)
+
+        await layer.group_send(DELTA_GROUP, {
+            'type': DELTA_MESSAGE_TYPE,
+            'origin': self.origin,
+            'deltas': deltas,
+        })
+
+
+delta_bus = GalleryDeltaBus()
@@ -0,0 +1,150 @@
+# api/image_decode.py
+import io
+import math
+
+import cv2
+import numpy as np
+from django.conf import settings
+from PIL import Image
+
+
+# ArcFace giriş boyutu; istemcide hizalanmış kırpıntılar bu boyuta getirilir
+ALIGNED_FACE_SIZE = 112
+
+
+def detection_size():
+    """Dedektör giriş boyutu (genişlik, yükseklik)"""
+    return tuple(getattr(settings, 'FACE_DETECTION_SIZE', (640, 640)))
+
+
+def detection_sizes():
+    """
+    Uyarlanabilir tespitte sırayla denenecek dedektör boyutları (küçükten büyüğe).
+    Letterbox FACE_DETECTION_SIZE'da yapılır; daha küçük boyutlarda SCRFD girişi kendisi küçültür.
+    """
+    return tuple(tuple(size) for size in getattr(settings, 'FACE_DETECTION_SIZES', (detection_size(),)))
+
+
+def fit_scale(image_size, target_size):
+    """image_size'ı en-boy oranını koruyarak target_size içine sığdıran ölçek"""
+    return min(target_size[0] / image_size[0], target_size[1] / image_size[1])
+
+
+def open_image(data, target_size=None):
+    """
+    Görüntü baytlarını RGB PIL görüntüsüne çöz.
+    JPEG kaynak target_size'a sığdırılmış halinden büyükse Image.draft ile
+    1/2, 1/4 veya 1/8 ölçekte çözülür (tam çözünürlüklü çözme atlanır).
+    :return: (görüntü, orijinal (genişlik, yükseklik))
+    """
+    image = Image.open(io.BytesIO(data))
+    original_size = image.size
+    if target_size and image.format == 'JPEG':
+        scale = fit_scale(original_size, target_size)
+        if scale < 1:
+            image.draft('RGB', (math.ceil(original_size[0] * scale), math.ceil(original_size[1] * scale)))
+    image.load()
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    return image, original_size
+
+
+class DetectorInput:
+    """
+    Dedektör için letterbox uygulanmış görüntü ve koordinat dönüşümleri.
+
+    Çözülen görüntü en-boy oranı korunarak dedektör boyutuna ölçeklenir ve
+    ortalanarak siyah kenarlarla doldurulur. Dedektör koordinatları
+    to_decoded() ile çözülen görüntüye, to_original() ile kaynak görüntüye
+    geri taşınır.
+    """
+
+    def __init__(self, image, original_size, size=None):
+        self.image = image
+        self.original_size = original_size
+        self.size = size or detection_size()
+
+        width, height = self.size
+        self.scale = fit_scale(image.size, self.size)
+        resized_width = min(width, round(image.width * self.scale))
+        resized_height = min(height, round(image.height * self.scale))
+        self.pad_x = (width - resized_width) // 2
+        self.pad_y = (height - resized_height) // 2
+
+        array = np.asarray(image)
+        if (resized_width, resized_height) != image.size:
+            interpolation = cv2.INTER_AREA if self.scale < 1 else cv2.INTER_LINEAR
+            array = cv2.resize(array, (resized_width, resized_height), interpolation=interpolation)
+        # Kenar dolgusu yeniden boyutlandırılmış diziden tek kopyada yapılır
+        self.array = cv2.copyMakeBorder(
+            array,
+            self.pad_y, height - resized_height - self.pad_y,
+            self.pad_x, width - resized_width - self.pad_x,
+            cv2.BORDER_CONSTANT, value=(0, 0, 0),
+        )
+
+    @property
+    def frame(self):
+        """Analiz edilen dizinin koordinat çerçevesi (önbellek anahtarına girer); ölçek ve dolgu bundan türer"""
+        return ['letterbox', list(self.size), list(self.image.size)]
+
+    @classmethod
+    def from_bytes(cls, data, size=None):
+        size = size or detection_size()
+        image, original_size = open_image(data, size)
+        return cls(image, original_size, size)
+
+    @property
+    def decoded(self):
+        """Çözülen (draft ile küçültülmüş olabilir) görüntü dizisi; kopyalanmaz"""
+        return np.asarray(self.image)
+
+    def to_decoded(self, points):
+        """Dedektör koordinatlarını ([x, y] satırları) çözülen görüntü koordinatlarına çevir"""
+        points = np.asarray(points, dtype=np.float32).reshape(-1, 2)
+        return (points - (self.pad_x, self.pad_y)) / self.scale
+
+    def to_original(self, points):
+        """Dedektör koordinatlarını kaynak görüntü koordinatlarına çevir"""
+        ratio = (self.original_size[0] / self.image.width, self.original_size[1] / self.image.height)
+        return self.to_decoded(points) * ratio
+
+
+class CropInput:
+    """
+    İstemcinin kendi tespit ettiği yüz kırpıntısı; DetectorInput ile aynı arayüz.
+
+    landmarks verilmişse kırpıntı bu noktalarla hizalanır; verilmemişse görüntü
+    zaten hizalanmış kare yüzdür ve gerekirse ALIGNED_FACE_SIZE'a ölçeklenir.
+    Dedektör çalışmadığı için koordinatlar kırpıntının kendisine göredir.
+    """
+
+    def __init__(self, image, original_size, landmarks=None):
+        self.image = image
+        self.original_size = original_size
+        self.landmarks = landmarks
+        self.scale = 1.0
+
+        array = np.asarray(image)
+        if landmarks is None and array.shape[:2] != (ALIGNED_FACE_SIZE, ALIGNED_FACE_SIZE):
+            if image.width != image.height:
+                raise ValueError(f"Aligned face crops must be square (got {image.width}x{image.height})")
+            self.scale = ALIGNED_FACE_SIZE / image.width
+            interpolation = cv2.INTER_AREA if self.scale < 1 else cv2.INTER_LINEAR
+            array = cv2.resize(array, (ALIGNED_FACE_SIZE, ALIGNED_FACE_SIZE), interpolation=interpolation)
+        self.array = array
+        self.size = (array.shape[1], array.shape[0])
+
+    @property
+    def decoded(self):
+        return self.array
+
+    @property
+    def frame(self):
+        return ['crop', list(self.size)]
+
+    def to_decoded(self, points):
+        return np.asarray(points, dtype=np.float32).reshape(-1, 2)
+
+    def to_original(self, points):
+        return self.to_decoded(points) / self.scale
@@ -0,0 +1,96 @@
+# api/image_store.py
+import hashlib
+import logging
+import os
+from collections import Counter
+from functools import partial
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+
+from .media_writer import media_writer, jpeg_bytes
+from .models import FaceImage
+
+logger = logging.getLogger(__name__)
+
+# Ham görüntüden türetilen dosyaların son ekleri ('' orijinalin kendisi)
+DERIVATIVES = ('', '_aligned')
+
+
+def content_hash(data):
+    """Görüntü baytlarının SHA-256 hash'i (depo anahtarı; türetilmiş önbellekler de kullanır)"""
+    return hashlib.sha256(data).hexdigest()
+
+
+def image_path(sha256, suffix=''):
+    """MEDIA_ROOT'a göre dosya yolu: face_images/sha256/ab/cd/abcd....jpg"""
+    return os.path.join('face_images', 'sha256', sha256[:2], sha256[2:4], f"{sha256}{suffix}.jpg")
+
+
+def image_url(sha256, suffix=''):
+    return media_writer.url(image_path(sha256, suffix))
+
+
+class ImageStore:
+    """
+    Yüz görüntüleri için içerik adresli, tekilleştirilmiş depo.
+
+    Aynı baytlar (ör. istemcinin yeniden denediği yükleme) tek dosya ve tek
+    FaceImage kaydı olarak saklanır; her referans ref_count'u bir artırır.
+    Dosya zaten diskteyse arka plan yazıcısı yazımı ve kodlamayı atlar.
+    Referanslar release() ile bırakılır; sıfıra düşen görüntüler silinir.
+    """
+
+    def store(self, data):
+        """
+        Görüntüyü depoya ekle ve referans sayısını artır.
+        :return: FaceImage
+        """
+        sha256 = content_hash(data)
+        with transaction.atomic():
+            try:
+                with transaction.atomic():
+                    face_image, _ = FaceImage.objects.get_or_create(sha256=sha256, defaults={'size': len(data)})
+            except IntegrityError:
+                # Eşzamanlı aynı yükleme kaydı önce oluşturdu
+                face_image = FaceImage.objects.get(sha256=sha256)
+            FaceImage.objects.filter(pk=sha256).update(ref_count=F('ref_count') + 1)
+            media_writer.submit(image_path(sha256), partial(jpeg_bytes, data), overwrite=False)
+        return face_image
+
+    def store_derivative(self, sha256, suffix, data):
+        """
+        Görüntüden türetilen dosyayı (ör. hizalanmış yüz) yaz; zaten varsa atla.
+        :param data: bayt ya da bayt döndüren çağrılabilir
+        """
+        media_writer.submit(image_path(sha256, suffix), data, overwrite=False)
+        return image_url(sha256, suffix)
+
+    def read(self, sha256, suffix=''):
+        """Görüntü baytlarını diskten oku (istenince, satırlarla birlikte yüklenmez); yoksa None"""
+        try:
+            with open(media_writer.path(image_path(sha256, suffix)), 'rb') as image_file:
+                return image_file.read()
+        except FileNotFoundError:
+            return None
+
+    def release(self, sha256s):
+        """Referansları bırak; hiç referansı kalmayan görüntüleri ve türevlerini sil"""
+        counts = Counter(sha256 for sha256 in sha256s if sha256)
+        if not counts:
+            return
+        with transaction.atomic():
+            for sha256, count in counts.items():
+                FaceImage.objects.filter(pk=sha256).update(ref_count=Greatest(F('ref_count') - count, 0))
+            orphans = FaceImage.objects.filter(pk__in=list(counts), ref_count__lte=0).values_list('pk', flat=True)
+            for sha256 in list(orphans):
+                # Bu arada yeni referans aldıysa koşullu silme hiçbir şey silmez
+                deleted, _ = FaceImage.objects.filter(pk=sha256, ref_count__lte=0).delete()
+                if deleted:
+                    for suffix in DERIVATIVES:
+                        media_writer.delete(image_path(sha256, suffix))
+                    logger.info(f"Face image {sha256[:12]} released")
+
+
+image_store = ImageStore()
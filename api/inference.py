@@ -0,0 +1,392 @@
+# api/inference.py
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import CancelledError, Future, ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+
+import numpy as np
+from django.conf import settings
+from insightface.utils import face_align
+
+from .embedding_cache import embedding_cache
+from .face_models import face_models
+from .metrics import HitCounters, stage_metrics
+from .quality import assess_face, quality_stats
+
+logger = logging.getLogger(__name__)
+
+
+class InferenceQueueFull(Exception):
+    """Çıkarım kuyruğu dolu; istemci Retry-After sonrası yeniden denemeli"""
+
+
+class InferenceTimeout(Exception):
+    """Çıkarım işi FACE_INFERENCE_TIMEOUT içinde tamamlanmadı"""
+
+
+def _init_worker():
+    """Worker süreci: Django'yu kur, modelleri bir kez yükleyip ısıt"""
+    import django
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+    django.setup()
+    face_models.warm_up()
+
+
+class FaceCrop(namedtuple('FaceCrop', ['image', 'kps'])):
+    """
+    İstemcinin cihazda tespit ettiği yüz: kps (5 nokta) verilmişse kırpıntı bu
+    noktalarla hizalanır, verilmemişse görüntü zaten hizalanmış 112x112 yüzdür.
+    Her iki durumda da SCRFD tespiti atlanır.
+    """
+    __slots__ = ()
+
+
+def _crop_face(item, recognizer):
+    """FaceCrop için tespit sonucu yerine geçen yüz kaydı ve tanıma girişi"""
+    size = recognizer.input_size[0]
+    height, width = item.image.shape[:2]
+    if item.kps is None:
+        kps = face_align.arcface_dst * (width / 112.0)
+        crop = item.image
+    else:
+        kps = np.asarray(item.kps, dtype=np.float32).reshape(5, 2)
+        crop = face_align.norm_crop(item.image, landmark=kps, image_size=size)
+    face = {
+        'bbox': np.array([0, 0, width, height], dtype=np.float32),
+        'kps': kps,
+        'det_score': 1.0,  # Tespit istemcide yapıldı
+        'detected': False,
+        'embedding': None,
+    }
+    return face, crop
+
+
+def _detect(analyzer, image, sizes):
+    """
+    SCRFD'yi küçük giriş boyutundan başlayarak çalıştır; yüz bulunan ilk boyutta dur.
+    Kutular her boyutta görüntünün kendi koordinatlarındadır.
+    :return: (bboxes, kpss, [(boyut, yüz bulundu mu), ...])
+    """
+    attempts = []
+    for size in sizes:
+        bboxes, kpss = analyzer.det_model.detect(image, input_size=size, max_num=0, metric='default')
+        attempts.append((size, bboxes.shape[0] > 0))
+        if bboxes.shape[0]:
+            break
+    return bboxes, kpss, attempts
+
+
+def analyze_faces_batch(images, gates=None):
+    """
+    Görüntülerdeki yüzleri tespit et ve tüm yüzlerin embedding'lerini tek tensörde çıkar.
+    FaceAnalysis.get() ile aynı adımlar; yalnızca ArcFace tüm kırpıntılar için bir kez çalışır.
+    gates[i] True ise i. görüntünün yüzleri embedding'den önce kalite kapısından geçer
+    (api.quality.assess_face); reddedilen yüzlerin 'quality' alanı dolar, embedding'i None kalır.
+    :param images: RGB uint8 numpy dizileri ya da tespiti atlanacak FaceCrop'lar
+    :return: (her görüntü için [{'bbox', 'kps', 'det_score', 'embedding'}, ...],
+              {'detection': [görüntü başına saniye], 'embedding': yığın için saniye,
+               'detection_attempts': [görüntü başına [(boyut, yüz bulundu mu), ...]]})
+    """
+    analyzer = face_models.get()
+    recognizer = analyzer.models['recognition']
+    sizes = face_models.detection_sizes()
+    gates = gates or [False] * len(images)
+
+    results = []
+    crops = []
+    embedded = []
+    detection_times = []
+    detection_attempts = []
+    for image, gate in zip(images, gates):
+        started_at = time.perf_counter()
+        if isinstance(image, FaceCrop):
+            face, crop = _crop_face(image, recognizer)
+            faces, face_crops = [face], [crop]
+            detection_attempts.append([])
+        else:
+            bboxes, kpss, attempts = _detect(analyzer, image, sizes)
+            detection_attempts.append(attempts)
+            faces, face_crops = [], []
+            for i in range(bboxes.shape[0]):
+                kps = kpss[i] if kpss is not None else None
+                faces.append({
+                    'bbox': bboxes[i, :4],
+                    'kps': kps,
+                    'det_score': float(bboxes[i, 4]),
+                    'detected': True,
+                    'embedding': None,
+                })
+                face_crops.append(face_align.norm_crop(image, landmark=kps, image_size=recognizer.input_size[0]))
+        for face, crop in zip(faces, face_crops):
+            if gate:
+                face['quality'] = assess_face(face, crop)
+                if face['quality']['reasons']:
+                    continue
+            crops.append(crop)
+            embedded.append(face)
+        results.append(faces)
+        detection_times.append(0.0 if isinstance(image, FaceCrop) else time.perf_counter() - started_at)
+
+    started_at = time.perf_counter()
+    if crops:
+        for face, embedding in zip(embedded, recognizer.get_feat(crops)):
+            face['embedding'] = embedding
+    return results, {
+        'detection': detection_times,
+        'embedding': time.perf_counter() - started_at,
+        'detection_attempts': detection_attempts,
+    }
+
+
+def _image_result(batch_result, index):
+    """Yığın sonucundan tek görüntünün yüzlerini ve aşama sürelerini ayır"""
+    results, timings = batch_result
+    return results[index], {
+        'detection': timings['detection'][index],
+        'embedding': timings['embedding'],
+        'detection_attempts': timings['detection_attempts'][index],
+    }
+
+
+def _warm_up_worker():
+    return os.getpid()
+
+
+class _MicroBatcher:
+    """
+    Eşzamanlı analiz isteklerini FACE_INFERENCE_BATCH_WAIT_MS kadar biriktirip
+    en fazla FACE_INFERENCE_BATCH_SIZE görüntülük tek bir havuz işi olarak gönderir.
+    Her çağıran yalnızca kendi görüntüsünün sonucunu alır.
+
+    Havuza aynı anda en fazla worker sayısı kadar yığın gönderilir; geri kalan
+    istekler burada bekler ve çağıranı zaman aşımına uğrayanlar (iptal edilen
+    Future'lar) hiç gönderilmeden atlanır. Motorun kuyruk yeri istek atlandığında
+    ya da yığını tamamlandığında bırakılır.
+    """
+
+    def __init__(self, engine):
+        self._engine = engine
+        self._queue = queue.Queue()
+        self._thread = None
+        self._slots = None  # Havuzdaki yığın sayısı sınırı
+        self._lock = threading.Lock()
+
+    def submit(self, image, gate=False):
+        future = Future()
+        self._queue.put((image, gate, future))
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._slots = threading.Semaphore(max(self._engine.workers, 1))
+                self._thread = threading.Thread(target=self._run, name='face-inference-batcher', daemon=True)
+                self._thread.start()
+        return future
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        batch_size = getattr(settings, 'FACE_INFERENCE_BATCH_SIZE', 8)
+        deadline = time.monotonic() + getattr(settings, 'FACE_INFERENCE_BATCH_WAIT_MS', 5) / 1000
+        while len(batch) < batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        # Zaman aşımına uğrayıp iptal edilen istekler gönderilmeden atlanır
+        running = []
+        for image, gate, future in batch:
+            if future.set_running_or_notify_cancel():
+                running.append((image, gate, future))
+            else:
+                self._engine._release()
+        return running
+
+    def _run(self):
+        while True:
+            # Boş bir worker olana kadar istekler kuyrukta (iptal edilebilir halde) bekler
+            self._slots.acquire()
+            batch = self._collect()
+            if not batch:
+                self._slots.release()
+                continue
+            try:
+                executor = self._engine._get_executor()
+                pool_future = executor.submit(
+                    analyze_faces_batch, [image for image, _, _ in batch], [gate for _, gate, _ in batch]
+                )
+            except Exception as e:
+                self._slots.release()
+                for _, _, future in batch:
+                    self._engine._release()
+                    future.set_exception(e)
+                continue
+            pool_future.add_done_callback(partial(self._deliver, batch, executor))
+
+    def _deliver(self, batch, executor, pool_future):
+        self._slots.release()
+        for _ in batch:
+            self._engine._release()
+        if pool_future.cancelled():
+            # Havuz yeniden kurulurken bekleyen işler iptal edildi
+            error = CancelledError()
+        else:
+            error = pool_future.exception()
+        if isinstance(error, BrokenProcessPool):
+            # Bir worker çöktü (ör. bellek yetersizliği); havuz bir sonraki işte yeniden kurulur
+            logger.error("Face inference pool is broken, restarting")
+            self._engine._reset_executor(executor)
+        for index, (_, _, future) in enumerate(batch):
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(_image_result(pool_future.result(), index))
+
+
+class InferenceEngine:
+    """
+    ONNX çıkarımını istek iş parçacıklarından ayrı bir süreç havuzunda çalıştırır.
+
+    Bekleyen + çalışan iş sayısı FACE_INFERENCE_QUEUE_SIZE ile sınırlıdır; kuyruk
+    doluysa iş beklemeden InferenceQueueFull ile reddedilir, böylece kayıt
+    patlamaları kapı komutlarını ve diğer view'ları aç bırakmaz. Eşzamanlı
+    analiz istekleri mikro yığınlar halinde birleştirilir (_MicroBatcher).
+    FACE_INFERENCE_WORKERS 0 ise çıkarım çağıran iş parçacığında yapılır.
+    """
+
+    def __init__(self):
+        self._executor = None
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._batcher = _MicroBatcher(self)
+
+    @property
+    def workers(self):
+        return getattr(settings, 'FACE_INFERENCE_WORKERS', 2)
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=_init_worker,
+                )
+                logger.info(f"Face inference pool started with {self.workers} worker(s)")
+            return self._executor
+
+    def _reset_executor(self, executor):
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def _acquire(self):
+        with self._lock:
+            if self._pending >= getattr(settings, 'FACE_INFERENCE_QUEUE_SIZE', 16):
+                raise InferenceQueueFull()
+            self._pending += 1
+
+    def _release(self):
+        with self._lock:
+            self._pending -= 1
+
+    def _wait(self, future):
+        try:
+            return future.result(timeout=getattr(settings, 'FACE_INFERENCE_TIMEOUT', 10))
+        except FutureTimeoutError:
+            future.cancel()
+            raise InferenceTimeout()
+
+    def run(self, function, *args):
+        """
+        İşi havuzda çalıştır ve sonucunu bekle.
+        Kuyruk yeri iş bitince (ya da iptal edilince) bırakılır; zaman aşımına
+        uğrayan ama havuzda çalışmaya devam eden iş yerini tutmaya devam eder.
+        """
+        if self.workers <= 0:
+            return function(*args)
+
+        self._acquire()
+        try:
+            executor = self._get_executor()
+            future = executor.submit(function, *args)
+        except BaseException:
+            self._release()
+            raise
+        future.add_done_callback(lambda _: self._release())
+        try:
+            return self._wait(future)
+        except BrokenProcessPool:
+            logger.error("Face inference pool is broken, restarting")
+            self._reset_executor(executor)
+            raise
+
+    def analyze(self, image, pipeline='inference', quality_gate=False, cache_key=None):
+        """
+        Tek görüntüyü analiz et; eşzamanlı isteklerle aynı yığında çalışabilir.
+        image bir FaceCrop ise tespit atlanır ve yalnızca embedding çıkarılır.
+        quality_gate True ise kalite kapısından geçemeyen yüzlerin embedding'i çıkarılmaz.
+        cache_key (embedding_cache_key) verilmişse sonuç önce önbellekte aranır;
+        kalite kapısında reddedilen yüz içeren sonuçlar önbelleğe yazılmaz.
+        Tespit, embedding ve bekleme süreleri '<pipeline>.detection' vb. aşamalarına yazılır.
+        """
+        started_at = time.perf_counter()
+        if cache_key is not None:
+            faces = embedding_cache.get(cache_key)
+            if faces is not None:
+                stage_metrics.observe(f"{pipeline}.cache_hit", time.perf_counter() - started_at)
+                return faces
+
+        if self.workers <= 0:
+            faces, timings = _image_result(analyze_faces_batch([image], [quality_gate]), 0)
+        else:
+            # Kuyruk yerini _MicroBatcher istek atlandığında ya da yığını bitince bırakır
+            self._acquire()
+            faces, timings = self._wait(self._batcher.submit(image, quality_gate))
+
+        # Kalite ve dedektör boyutu sayaçları ana süreçte tutulur (/api/metrics/)
+        for size, found in timings['detection_attempts']:
+            detection_size_stats.record(f"{size[0]}x{size[1]}", found)
+        for face in faces:
+            if 'quality' in face:
+                quality_stats.record(face['quality'])
+
+        if not isinstance(image, FaceCrop):
+            stage_metrics.observe(f"{pipeline}.detection", timings['detection'])
+        stage_metrics.observe(f"{pipeline}.embedding", timings['embedding'])
+        # Kuyruk, yığın toplama ve süreçler arası aktarım
+        waited = time.perf_counter() - started_at - timings['detection'] - timings['embedding']
+        stage_metrics.observe(f"{pipeline}.inference_wait", max(waited, 0.0))
+
+        if cache_key is not None and not any(face.get('quality', {}).get('reasons') for face in faces):
+            embedding_cache.put(cache_key, faces)
+        return faces
+
+    def warm_up(self):
+        """Havuzu başlat; worker'lar modelleri initializer içinde yükler"""
+        if self.workers <= 0:
+            face_models.warm_up()
+            return
+        try:
+            executor = self._get_executor()
+            for future in [executor.submit(_warm_up_worker) for _ in range(self.workers)]:
+                future.result()
+        except Exception as e:
+            logger.warning(f"Face inference pool warm-up failed: {e}")
+
+    @property
+    def pending(self):
+        return self._pending
+
+
+inference_engine = InferenceEngine()
+
+# Dedektör giriş boyutu başına deneme ve yüz bulma sayıları
+detection_size_stats = HitCounters()
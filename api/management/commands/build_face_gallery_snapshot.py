@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api.face_index import galleries
+from api.gallery_snapshot import snapshot_dir
+
+
+class Command(BaseCommand):
+    help = 'Write memory-mappable snapshots of the in-memory face galleries'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--gallery', choices=sorted(galleries), action='append',
+                            help='Gallery to snapshot (default: all)')
+
+    def handle(self, *args, **options):
+        directory = snapshot_dir()
+        if not directory:
+            raise CommandError('FACE_GALLERY_SNAPSHOT_DIR is not configured')
+
+        for name in options['gallery'] or sorted(galleries):
+            index = galleries[name]
+            index.refresh()
+            if index.write_snapshot():
+                self.stdout.write(self.style.SUCCESS(
+                    f"Snapshot for '{name}' written to {directory} ({len(index)} vectors)"
+                ))
+            else:
+                self.stdout.write(f"Snapshot for '{name}' is already up to date")
@@ -0,0 +1,67 @@
+import time
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from api.face_index import galleries
+
+
+class Command(BaseCommand):
+    help = 'Compare IVF (approximate) face search against brute-force search (recall@k and latency)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--gallery', choices=sorted(galleries), default='face_vectors',
+                            help='Gallery to measure')
+        parser.add_argument('--queries', type=int, default=200, help='Number of sampled queries')
+        parser.add_argument('--k', type=int, default=10, help='Top-k used for recall')
+        parser.add_argument('--nprobe', type=int, nargs='+', default=[1, 4, 8, 16, 32],
+                            help='nprobe values to evaluate')
+        parser.add_argument('--noise', type=float, default=0.05,
+                            help='Gaussian noise added to sampled gallery vectors')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        index = galleries[options['gallery']]
+        k = options['k']
+
+        queries = index.sample(options['queries'], seed=options['seed'])
+        if len(queries) == 0:
+            raise CommandError(f"Gallery '{index.name}' is empty")
+
+        # Galeriden alınan vektörlere gürültü ekleyerek gerçekçi sorgular üret
+        rng = np.random.default_rng(options['seed'])
+        queries = queries + rng.normal(0, options['noise'], queries.shape).astype(np.float32)
+
+        self.stdout.write(f"Gallery '{index.name}': {len(index)} vectors, {len(queries)} queries, k={k}")
+        min_rows = getattr(settings, 'FACE_INDEX_IVF_MIN_ROWS', 2000)
+        if len(index) < min_rows:
+            self.stdout.write(self.style.WARNING(
+                f"Gallery is smaller than FACE_INDEX_IVF_MIN_ROWS={min_rows}; ivf falls back to exact search"
+            ))
+
+        exact_results = []
+        start = time.perf_counter()
+        for query in queries:
+            exact_results.append({pk for pk, _ in index.search(query, -1.0, k, backend='exact')})
+        exact_ms = (time.perf_counter() - start) * 1000 / len(queries)
+        self.stdout.write(f"  exact          latency={exact_ms:.3f} ms/query")
+
+        for nprobe in options['nprobe']:
+            hits = 0
+            start = time.perf_counter()
+            ivf_results = [
+                {pk for pk, _ in index.search(query, -1.0, k, backend='ivf', nprobe=nprobe)}
+                for query in queries
+            ]
+            ivf_ms = (time.perf_counter() - start) * 1000 / len(queries)
+            for exact, approx in zip(exact_results, ivf_results):
+                hits += len(exact & approx)
+            total = sum(len(exact) for exact in exact_results)
+            recall = hits / total if total else 1.0
+            self.stdout.write(
+                f"  ivf nprobe={nprobe:<4d} latency={ivf_ms:.3f} ms/query "
+                f"recall@{k}={recall:.4f} speedup={exact_ms / ivf_ms if ivf_ms else 0:.1f}x"
+            )
+
+        self.stdout.write(self.style.SUCCESS('Recall check completed'))
@@ -0,0 +1,110 @@
+import glob
+import os
+import time
+
+import cv2
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from api.face_models import load_package, load_recognizer, session_options
+
+
+class Command(BaseCommand):
+    help = 'Compare accuracy and latency of the float32 ArcFace model and an INT8-quantized copy'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--int8', default=getattr(settings, 'FACE_RECOGNITION_MODEL_PATH', None),
+                            help='INT8 ArcFace .onnx file (default: FACE_RECOGNITION_MODEL_PATH)')
+        parser.add_argument('--quantize', action='store_true',
+                            help='Create the INT8 model from the float32 model first (dynamic quantization)')
+        parser.add_argument('--images', default=os.path.join(settings.MEDIA_ROOT, 'face_images'),
+                            help='Directory searched recursively for aligned 112x112 face crops')
+        parser.add_argument('--limit', type=int, default=200, help='Number of face crops to use')
+        parser.add_argument('--batch', type=int, default=8, help='Crops per get_feat call')
+        parser.add_argument('--repeat', type=int, default=3, help='Timed passes over the crops')
+
+    def handle(self, *args, **options):
+        int8_path = options['int8']
+        if not int8_path:
+            raise CommandError('Pass --int8 or set FACE_RECOGNITION_MODEL_PATH')
+
+        # Paketteki float32 tanıma modeli
+        session = session_options()
+        model_name = getattr(settings, 'FACE_ANALYSIS_MODEL', 'buffalo_l')
+        float_model = load_package(model_name, ('recognition',), session)['recognition']
+        float_path = float_model.model_file
+
+        if options['quantize']:
+            from onnxruntime.quantization import QuantType, quantize_dynamic
+            quantize_dynamic(float_path, int8_path, weight_type=QuantType.QInt8)
+            self.stdout.write(f"Quantized {float_path} -> {int8_path}")
+        if not os.path.exists(int8_path):
+            raise CommandError(f"{int8_path} does not exist (use --quantize to create it)")
+
+        crops = self.load_crops(options['images'], options['limit'])
+        if len(crops) < 2:
+            raise CommandError(f"At least 2 aligned face crops are needed under {options['images']}")
+
+        int8_model = load_recognizer(int8_path, reference=float_model, options=session)
+
+        results = {}
+        for label, model in (('float32', float_model), ('int8', int8_model)):
+            embeddings, latencies = self.embed(model, crops, options['batch'], options['repeat'])
+            results[label] = embeddings
+            size_mb = os.path.getsize(model.model_file) / 1024 / 1024
+            self.stdout.write(
+                f"{label:<8s} model={size_mb:.1f} MB "
+                f"latency_mean={np.mean(latencies):.2f} ms/face p95={np.percentile(latencies, 95):.2f} ms/face"
+            )
+
+        float_embeddings, int8_embeddings = results['float32'], results['int8']
+        # Aynı yüz için iki modelin embedding'leri arasındaki kosinüs benzerliği
+        agreement = np.sum(float_embeddings * int8_embeddings, axis=1)
+
+        # Örnekteki en yakın komşu ve eşik kararlarının modeller arasında tutarlılığı
+        float_scores = float_embeddings @ float_embeddings.T
+        int8_scores = int8_embeddings @ int8_embeddings.T
+        np.fill_diagonal(float_scores, -np.inf)
+        np.fill_diagonal(int8_scores, -np.inf)
+        top1_agreement = np.mean(np.argmax(float_scores, axis=1) == np.argmax(int8_scores, axis=1))
+        threshold = getattr(settings, 'FACE_RECOGNITION_THRESHOLD', 0.5)
+        pairs = np.triu_indices(len(crops), k=1)
+        decision_agreement = np.mean((float_scores[pairs] > threshold) == (int8_scores[pairs] > threshold))
+        score_error = np.abs(float_scores[pairs] - int8_scores[pairs])
+
+        self.stdout.write(
+            f"{len(crops)} crops: embedding_cosine_mean={agreement.mean():.5f} min={agreement.min():.5f} "
+            f"score_err_mean={score_error.mean():.5f} max={score_error.max():.5f} "
+            f"top1_agreement={top1_agreement:.4f} decision_agreement@{threshold}={decision_agreement:.4f}"
+        )
+        self.stdout.write(self.style.SUCCESS('Recognition model comparison completed'))
+
+    def load_crops(self, directory, limit):
+        """Dizindeki hizalanmış yüz kırpıntılarını RGB 112x112 dizileri olarak oku"""
+        paths = sorted(glob.glob(os.path.join(directory, '**', '*_aligned.jpg'), recursive=True))[:limit]
+        crops = []
+        for path in paths:
+            image = cv2.imread(path)
+            if image is None:
+                continue
+            if image.shape[:2] != (112, 112):
+                image = cv2.resize(image, (112, 112))
+            crops.append(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
+        return crops
+
+    def embed(self, model, crops, batch_size, repeat):
+        """Kırpıntıların normalize embedding'leri ve yüz başına gecikmeler (ms)"""
+        model.get_feat(crops[:1])  # Isınma
+        latencies = []
+        embeddings = None
+        for _ in range(max(repeat, 1)):
+            batches = []
+            for start in range(0, len(crops), batch_size):
+                batch = crops[start:start + batch_size]
+                started_at = time.perf_counter()
+                batches.append(model.get_feat(batch))
+                latencies.append((time.perf_counter() - started_at) * 1000 / len(batch))
+            embeddings = np.vstack(batches).astype(np.float32)
+        embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+        return embeddings, latencies
@@ -0,0 +1,71 @@
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from api.face_index import galleries, quantized_scores, INDEX_PRECISIONS
+
+
+class Command(BaseCommand):
+    help = 'Report memory savings and accuracy loss of float16/int8 face index storage'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--gallery', choices=sorted(galleries), default='face_vectors',
+                            help='Gallery to measure')
+        parser.add_argument('--queries', type=int, default=200, help='Number of sampled queries')
+        parser.add_argument('--k', type=int, default=10, help='Top-k used for recall')
+        parser.add_argument('--rerank', type=int,
+                            default=getattr(settings, 'FACE_INDEX_RERANK_CANDIDATES', 50),
+                            help='Candidates re-ranked in float32')
+        parser.add_argument('--noise', type=float, default=0.05,
+                            help='Gaussian noise added to sampled gallery vectors')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        index = galleries[options['gallery']]
+        k = options['k']
+        rerank_k = max(options['rerank'], k)
+
+        groups = index.fetch_vectors()
+        if not groups:
+            raise CommandError(f"Gallery '{index.name}' is empty")
+
+        rng = np.random.default_rng(options['seed'])
+        for size, (ids, matrix) in sorted(groups.items()):
+            # Galeriden alınan vektörlere gürültü ekleyerek sorgular üret
+            chosen = rng.choice(len(matrix), min(options['queries'], len(matrix)), replace=False)
+            queries = matrix[chosen] + rng.normal(0, options['noise'], (len(chosen), size)).astype(np.float32)
+            queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+
+            exact = matrix @ queries.T
+            top_k = min(k, len(matrix))
+            exact_top = np.argsort(-exact, axis=0)[:top_k]
+
+            self.stdout.write(f"Gallery '{index.name}' size={size}: {len(matrix)} vectors, {len(chosen)} queries")
+            for precision in INDEX_PRECISIONS:
+                scores, nbytes = quantized_scores(matrix, queries, precision)
+                coarse_top = np.argsort(-scores, axis=0)[:rerank_k]
+
+                coarse_hits = 0
+                rerank_hits = 0
+                top1_agree = 0
+                for q in range(len(chosen)):
+                    truth = set(exact_top[:, q])
+                    coarse_hits += len(truth & set(coarse_top[:top_k, q]))
+                    # Adayları float32 skorlarıyla yeniden sırala
+                    candidates = coarse_top[:, q]
+                    reranked = candidates[np.argsort(-exact[candidates, q])][:top_k]
+                    rerank_hits += len(truth & set(reranked))
+                    top1_agree += int(reranked[0] == exact_top[0, q])
+
+                error = np.abs(scores - exact)
+                total = top_k * len(chosen)
+                self.stdout.write(
+                    f"  {precision:<8s} memory={nbytes / 1024 / 1024:.2f} MB "
+                    f"({nbytes / len(matrix):.0f} B/vector) "
+                    f"score_err_mean={error.mean():.5f} score_err_max={error.max():.5f} "
+                    f"recall@{top_k}_coarse={coarse_hits / total:.4f} "
+                    f"recall@{top_k}_reranked={rerank_hits / total:.4f} "
+                    f"top1_agreement={top1_agree / len(chosen):.4f}"
+                )
+
+        self.stdout.write(self.style.SUCCESS('Quantization report completed'))
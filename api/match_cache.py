@@ -0,0 +1,91 @@
+# api/match_cache.py
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+
+
+class MatchCache:
+    """
+    Aynı kapı ve cihazdan kısa sürede gelen neredeyse aynı sorgular için eşleşme kararı önbelleği.
+
+    Sorgu vektörü rastgele hiperdüzlemlerle (SimHash LSH) bir kovaya düşürülür;
+    kovadaki süresi dolmamış kayıtlardan kosinüs benzerliği
+    FACE_MATCH_CACHE_SIMILARITY değerini aşan varsa onun kararı döndürülür.
+    Kapsam (scope) galeri sürümünü de içerdiği için galeri değişince kayıtlar
+    kendiliğinden geçersiz olur.
+    """
+
+    def __init__(self, seed=0):
+        self._seed = seed
+        self._planes = {}  # {(vektör boyutu, bit sayısı): hiperdüzlemler}
+        self._buckets = {}  # {(scope..., boyut, lsh): [(probe, karar, bitiş zamanı)]}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self):
+        return getattr(settings, 'FACE_MATCH_CACHE_TTL', 5) > 0
+
+    def _key(self, scope, probe):
+        bits = getattr(settings, 'FACE_MATCH_CACHE_LSH_BITS', 16)
+        planes = self._planes.get((len(probe), bits))
+        if planes is None:
+            rng = np.random.default_rng(self._seed)
+            planes = rng.standard_normal((bits, len(probe))).astype(np.float32)
+            self._planes[(len(probe), bits)] = planes
+        return (*scope, len(probe), np.packbits(planes @ probe > 0).tobytes())
+
+    @staticmethod
+    def _normalize(probe):
+        probe = np.asarray(probe, dtype=np.float32).ravel()
+        norm = np.linalg.norm(probe)
+        return probe / norm if norm else None
+
+    def get(self, scope, probe):
+        """Önbellekteki kararı döndür; yoksa None"""
+        probe = self._normalize(probe)
+        if probe is None or not self.enabled:
+            return None
+        key = self._key(scope, probe)
+        bound = getattr(settings, 'FACE_MATCH_CACHE_SIMILARITY', 0.95)
+        now = time.monotonic()
+        with self._lock:
+            for cached_probe, decision, expires_at in self._buckets.get(key, ()):
+                if expires_at > now and float(cached_probe @ probe) >= bound:
+                    self.hits += 1
+                    return decision
+            self.misses += 1
+        return None
+
+    def put(self, scope, probe, decision):
+        probe = self._normalize(probe)
+        if probe is None or not self.enabled:
+            return
+        key = self._key(scope, probe)
+        now = time.monotonic()
+        with self._lock:
+            entries = [entry for entry in self._buckets.get(key, ()) if entry[2] > now]
+            entries.append((probe, decision, now + getattr(settings, 'FACE_MATCH_CACHE_TTL', 5)))
+            self._buckets[key] = entries[-getattr(settings, 'FACE_MATCH_CACHE_BUCKET_SIZE', 8):]
+            if len(self._buckets) > getattr(settings, 'FACE_MATCH_CACHE_MAX_BUCKETS', 10000):
+                self._buckets = {
+                    bucket_key: bucket for bucket_key, bucket in self._buckets.items()
+                    if any(entry[2] > now for entry in bucket)
+                }
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'buckets': len(self._buckets),
+            }
+
+
+# Süreç düzeyinde doğrulama kararı önbelleği
+verification_cache = MatchCache()
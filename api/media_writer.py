@@ -0,0 +1,207 @@
+# api/media_writer.py
+import atexit
+import io
+import logging
+import os
+import queue
+import threading
+from functools import partial
+
+import cv2
+from django.conf import settings
+from django.db import transaction
+from PIL import Image
+
+from .metrics import stage_metrics
+
+logger = logging.getLogger(__name__)
+
+JPEG_MAGIC = b'\xff\xd8\xff'
+
+
+def is_jpeg(data):
+    return data[:3] == JPEG_MAGIC
+
+
+def jpeg_bytes(data):
+    """Görüntü baytlarını JPEG olarak döndür; zaten JPEG ise yeniden sıkıştırmadan aynen"""
+    if is_jpeg(data):
+        return data
+    return encode_image(Image.open(io.BytesIO(data)))
+
+
+def encode_image(image, quality=95):
+    """PIL görüntüsünü JPEG baytlarına kodla"""
+    buffer = io.BytesIO()
+    image.convert('RGB').save(buffer, format='JPEG', quality=quality)
+    return buffer.getvalue()
+
+
+def encode_array(array, quality=95):
+    """RGB numpy dizisini JPEG baytlarına kodla"""
+    ok, encoded = cv2.imencode('.jpg', cv2.cvtColor(array, cv2.COLOR_RGB2BGR), [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not ok:
+        raise ValueError("JPEG encoding failed")
+    return encoded.tobytes()
+
+
+class MediaWriter:
+    """
+    Yüz görüntülerini MEDIA_ROOT altına istek iş parçacığı dışında yazan arka plan yazıcısı.
+
+    submit() veritabanı işlemi commit edildikten sonra yazımı kuyruğa alır; veri
+    bayt ya da baytları üreten bir çağrılabilir olabilir (kodlama da arka planda
+    yapılır). Dosyalar geçici ada yazılıp atomik olarak taşınır. Kuyruk doluysa
+    ya da FACE_MEDIA_WRITER_ASYNC kapalıysa yazım çağıran iş parçacığında yapılır.
+    Silmeler ve run() ile verilen diğer dosya işleri de aynı kuyruktan sırayla geçer.
+    """
+
+    def __init__(self):
+        self._queue = None
+        self._thread = None
+        self._lock = threading.Lock()
+        self.written = 0
+        self.failed = 0
+        self.inline = 0
+        self.skipped = 0  # Zaten var olduğu için yazılmayan dosyalar
+        self.deleted = 0
+        self.bytes_written = 0
+
+    @property
+    def enabled(self):
+        return getattr(settings, 'FACE_MEDIA_WRITER_ASYNC', True)
+
+    @staticmethod
+    def path(relative_path):
+        return os.path.join(settings.MEDIA_ROOT, relative_path)
+
+    @staticmethod
+    def url(relative_path):
+        return os.path.join(settings.MEDIA_URL, relative_path.replace('\\', '/'))
+
+    def submit(self, relative_path, data, overwrite=True):
+        """
+        Dosyayı yazılmak üzere kuyruğa al.
+        :param relative_path: MEDIA_ROOT'a göre yol
+        :param data: bayt ya da bayt döndüren çağrılabilir (ör. partial(encode_array, dizi))
+        :param overwrite: False ise dosya zaten varsa yazım (ve kodlama) atlanır
+        """
+        transaction.on_commit(lambda: self._enqueue(relative_path, data, overwrite))
+
+    def delete(self, relative_path):
+        """Dosyayı commit sonrasında arka planda sil"""
+        transaction.on_commit(lambda: self._enqueue(relative_path, None, True))
+
+    def run(self, task):
+        """
+        Medya dışı bir dosya işini (ör. embedding önbelleği yazımı) commit beklemeden
+        arka plan iş parçacığında çalıştır. Kuyruk doluysa iş atlanır.
+        :return: iş kuyruğa alındıysa (arka plan kapalıysa hemen çalıştırıldıysa) True
+        """
+        if not self.enabled:
+            task()
+            return True
+        return self._put(task)
+
+    def _put(self, task):
+        self._start()
+        try:
+            self._queue.put_nowait(task)
+            return True
+        except queue.Full:
+            return False
+
+    def _enqueue(self, relative_path, data, overwrite):
+        task = partial(self._write, relative_path, data, overwrite)
+        if self.enabled:
+            if self._put(task):
+                return
+            logger.warning(f"Media writer queue is full, writing {relative_path} inline")
+        with self._lock:
+            self.inline += 1
+        task()
+
+    def _start(self):
+        with self._lock:
+            if self._queue is None:
+                self._queue = queue.Queue(maxsize=getattr(settings, 'FACE_MEDIA_WRITER_QUEUE_SIZE', 256))
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='face-media-writer', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            task = self._queue.get()
+            try:
+                task()
+            except Exception as e:
+                logger.error(f"Media writer task failed: {e}")
+            finally:
+                self._queue.task_done()
+
+    def _write(self, relative_path, data, overwrite=True):
+        path = self.path(relative_path)
+        if data is None:
+            return self._remove(relative_path, path)
+        if not overwrite and os.path.exists(path):
+            with self._lock:
+                self.skipped += 1
+            return True
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with stage_metrics.span('media.write'):
+                if callable(data):
+                    data = data()
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(tmp_path, 'wb') as media_file:
+                    media_file.write(data)
+                os.replace(tmp_path, path)
+        except Exception as e:
+            with self._lock:
+                self.failed += 1
+            logger.error(f"Media write failed for {relative_path}: {e}")
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            return False
+        with self._lock:
+            self.written += 1
+            self.bytes_written += len(data)
+        return True
+
+    def _remove(self, relative_path, path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            return True
+        except OSError as e:
+            with self._lock:
+                self.failed += 1
+            logger.error(f"Media delete failed for {relative_path}: {e}")
+            return False
+        with self._lock:
+            self.deleted += 1
+        return True
+
+    def flush(self):
+        """Kuyruktaki tüm yazımların bitmesini bekle"""
+        if self._queue is not None and self._thread is not None and self._thread.is_alive():
+            self._queue.join()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'queued': self._queue.qsize() if self._queue is not None else 0,
+                'written': self.written,
+                'failed': self.failed,
+                'inline': self.inline,
+                'skipped': self.skipped,
+                'deleted': self.deleted,
+                'bytes_written': self.bytes_written,
+            }
+
+
+media_writer = MediaWriter()
+# Süreç kapanırken bekleyen görüntüler kaybolmasın
+atexit.register(media_writer.flush)
@@ -0,0 +1,123 @@
+# api/metrics.py
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+# Gecikme histogramı kova üst sınırları (milisaniye); son kova sınırsız
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+class LatencyHistogram:
+    """Sabit kovalı gecikme histogramı (iş parçacığı güvenli)"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS_MS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, milliseconds):
+        with self._lock:
+            self.counts[bisect.bisect_left(self.buckets, milliseconds)] += 1
+            self.count += 1
+            self.total_ms += milliseconds
+            self.max_ms = max(self.max_ms, milliseconds)
+
+    def quantile(self, q):
+        """Yüzdeliği kova üst sınırı olarak yaklaşıkla"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if seen >= rank:
+                return float(self.buckets[index]) if index < len(self.buckets) else self.max_ms
+        return self.max_ms
+
+    def snapshot(self):
+        with self._lock:
+            labels = [f"le_{bound}" for bound in self.buckets] + ['le_inf']
+            return {
+                'count': self.count,
+                'mean_ms': self.total_ms / self.count if self.count else 0.0,
+                'max_ms': self.max_ms,
+                'p50_ms': self.quantile(0.5),
+                'p95_ms': self.quantile(0.95),
+                'p99_ms': self.quantile(0.99),
+                'buckets': dict(zip(labels, self.counts)),
+            }
+
+
+class StageMetrics:
+    """
+    İşlem hattı aşamalarının (ör. 'registration.detection') süre histogramları.
+
+        with stage_metrics.span('registration.image_decode'):
+            ...
+
+    Değerler süreç içinde tutulur; /api/metrics/ üzerinden okunur.
+    """
+
+    def __init__(self):
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def histogram(self, stage):
+        histogram = self._histograms.get(stage)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(stage, LatencyHistogram())
+        return histogram
+
+    def observe(self, stage, seconds):
+        self.histogram(stage).observe(seconds * 1000)
+
+    @contextmanager
+    def span(self, stage):
+        """Bloğun süresini aşama histogramına ekle (hata olsa da)"""
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - started_at)
+
+    def snapshot(self):
+        with self._lock:
+            stages = dict(self._histograms)
+        return {stage: histogram.snapshot() for stage, histogram in sorted(stages.items())}
+
+    def reset(self):
+        with self._lock:
+            self._histograms = {}
+
+
+stage_metrics = StageMetrics()
+
+
+class HitCounters:
+    """Anahtar başına deneme/isabet sayaçları (ör. dedektör boyutu başına yüz bulma oranı)"""
+
+    def __init__(self):
+        self._counts = {}  # {anahtar: [deneme, isabet]}
+        self._lock = threading.Lock()
+
+    def record(self, key, hit):
+        with self._lock:
+            counts = self._counts.setdefault(key, [0, 0])
+            counts[0] += 1
+            counts[1] += int(bool(hit))
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                key: {'attempts': attempts, 'hits': hits, 'hit_rate': hits / attempts if attempts else 0.0}
+                for key, (attempts, hits) in sorted(self._counts.items())
+            }
+
+    def reset(self):
+        with self._lock:
+            self._counts = {}
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:31
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_door_accesslog_door'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='door',
+            name='access_restricted',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.CreateModel(
+            name='DoorAccess',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('door', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='accesses', to='api.door')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='door_accesses', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('door', 'user')},
+            },
+        ),
+    ]
@@ -0,0 +1,95 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:43
+
+import base64
+import hashlib
+import io
+import logging
+import os
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F
+
+logger = logging.getLogger(__name__)
+
+
+def _image_path(sha256):
+    return os.path.join(settings.MEDIA_ROOT, 'face_images', 'sha256', sha256[:2], sha256[2:4], f"{sha256}.jpg")
+
+
+def _jpeg_bytes(data):
+    if data[:3] == b'\xff\xd8\xff':
+        return data
+    from PIL import Image
+    buffer = io.BytesIO()
+    Image.open(io.BytesIO(data)).convert('RGB').save(buffer, format='JPEG', quality=95)
+    return buffer.getvalue()
+
+
+def move_images_to_store(apps, schema_editor):
+    """Satırlardaki base64 görüntüleri içerik adresli depoya (FaceImage + dosya) taşı"""
+    FaceImage = apps.get_model('api', 'FaceImage')
+    for model_name in ('FaceVector', 'AnonymousFaceVector'):
+        model = apps.get_model('api', model_name)
+        rows = (
+            model.objects.filter(face_image_base64__isnull=False).exclude(face_image_base64='')
+            .values_list('pk', 'face_image_base64', 'image_id')
+        )
+        for pk, face_image_base64, image_id in rows.iterator(chunk_size=200):
+            if image_id:
+                # Depoya zaten eklenmiş (binary yükleme); yalnızca sütun kaldırılır
+                continue
+            if ';base64,' in face_image_base64:
+                face_image_base64 = face_image_base64.split(';base64,')[1]
+            try:
+                data = base64.b64decode(face_image_base64)
+                sha256 = hashlib.sha256(data).hexdigest()
+                path = _image_path(sha256)
+                if not os.path.exists(path):
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    with open(path, 'wb') as image_file:
+                        image_file.write(_jpeg_bytes(data))
+            except Exception as e:
+                logger.warning(f"Skipping unreadable face image on {model_name} {pk}: {e}")
+                continue
+            FaceImage.objects.get_or_create(sha256=sha256, defaults={'size': len(data)})
+            FaceImage.objects.filter(pk=sha256).update(ref_count=F('ref_count') + 1)
+            model.objects.filter(pk=pk).update(image_id=sha256)
+
+
+def restore_images_to_rows(apps, schema_editor):
+    """Geri alma: depodaki görüntüleri base64 olarak satırlara yaz"""
+    for model_name in ('FaceVector', 'AnonymousFaceVector'):
+        model = apps.get_model('api', model_name)
+        for pk, image_id in model.objects.filter(image__isnull=False).values_list('pk', 'image_id').iterator():
+            try:
+                with open(_image_path(image_id), 'rb') as image_file:
+                    face_image_base64 = base64.b64encode(image_file.read()).decode()
+            except FileNotFoundError:
+                continue
+            model.objects.filter(pk=pk).update(face_image_base64=face_image_base64)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_faceimage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='anonymousfacevector',
+            name='image',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='anonymous_face_vectors', to='api.faceimage'),
+        ),
+        migrations.RunPython(move_images_to_store, restore_images_to_rows),
+        migrations.RemoveField(
+            model_name='anonymousfacevector',
+            name='face_image_base64',
+        ),
+        migrations.RemoveField(
+            model_name='facevector',
+            name='face_image_base64',
+        ),
+    ]
@@ -1,9 +1,61 @@
 from django.db import models
 from django.contrib.auth.models import AbstractUser
+from django.dispatch import Signal
 from django.utils import timezone
 import uuid
 
 
+# Yüz vektörleri silindiğinde (tekil ya da toplu) gönderilir; alıcılar 'pks' ve
+# serbest kalan görüntülerin 'image_ids' (sha256) listesini alır.
+# post_delete alıcısı bağlamak toplu silmeyi satır satır silmeye çevireceği için kullanılmıyor.
+face_vectors_deleted = Signal()
+# QuerySet.update() ile galeriyi etkileyen alanlar (is_active, vector_data) toplu
+# değiştiğinde gönderilir; update() post_save göndermez. Alıcılar 'pks' listesini alır.
+face_vectors_updated = Signal()
+# Bu alanlardan biri güncellenirse vektör galeride eklenir ya da çıkarılır
+_GALLERY_FIELDS = {'is_active', 'vector_data'}
+
+
+class FaceVectorQuerySet(models.QuerySet):
+    """Toplu silme ve güncellemede galeri sinyallerini gönderen QuerySet"""
+
+    def delete(self):
+        # Görüntü referansı olan modellerde serbest bırakılacak içerik hash'leri de gönderilir
+        if hasattr(self.model, 'image'):
+            rows = list(self.values_list('pk', 'image_id'))
+        else:
+            rows = [(pk, None) for pk in self.values_list('pk', flat=True)]
+        result = super().delete()
+        if rows:
+            face_vectors_deleted.send(
+                sender=self.model,
+                pks=[pk for pk, _ in rows],
+                image_ids=[image_id for _, image_id in rows if image_id],
+            )
+        return result
+
+    def update(self, **kwargs):
+        if not _GALLERY_FIELDS & set(kwargs):
+            return super().update(**kwargs)
+        pks = list(self.values_list('pk', flat=True))
+        # update() auto_now alanlarını güncellemez; diğer süreçlerin updated_at yoklaması için
+        kwargs.setdefault('updated_at', timezone.now())
+        result = super().update(**kwargs)
+        if pks:
+            face_vectors_updated.send(sender=self.model, pks=pks)
+        return result
+
+
+class FaceVectorDeleteMixin:
+    """Tekil silmede face_vectors_deleted sinyalini gönder"""
+
+    def delete(self, *args, **kwargs):
+        pk = self.pk
+        image_id = getattr(self, 'image_id', None)
+        result = super().delete(*args, **kwargs)
+        face_vectors_deleted.send(sender=type(self), pks=[pk], image_ids=[image_id] if image_id else [])
+        return result
+
 
 class User(AbstractUser):
     """Sistem kullanıcıları için model"""
@@ -32,19 +84,36 @@ class User(AbstractUser):
     def __str__(self):
         return self.username
 
-class FaceVector(models.Model):
+class FaceImage(models.Model):
+    """
+    İçerik adresli yüz görüntüsü: aynı baytlar bir kez saklanır.
+    Dosya yolu görüntü baytlarının SHA-256 hash'inden türetilir; ref_count
+    görüntüye bağlı (anonim ya da kullanıcı) yüz vektörü sayısıdır ve sıfıra düşünce dosya silinir.
+    """
+    sha256 = models.CharField(max_length=64, primary_key=True)
+    size = models.PositiveIntegerField()  # Yüklenen görüntünün bayt boyutu
+    ref_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Face Image {self.sha256[:12]} ({self.ref_count} ref)"
+
+
+class FaceVector(FaceVectorDeleteMixin, models.Model):
     """Yüz vektörlerini saklayan model"""
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='face_vectors', null=True, blank=True)
     name = models.CharField(max_length=100, blank=True)
     vector_data = models.BinaryField()
     vector_size = models.IntegerField()
-    # Yeni alan: Base64 kodlanmış görsel verisi
-    face_image_base64 = models.TextField(null=True, blank=True)
+    # İçerik adresli görüntü deposundaki kayıt (media/face_images/sha256/...); görüntü satırda tutulmaz
+    image = models.ForeignKey(FaceImage, on_delete=models.SET_NULL, related_name='face_vectors', null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     is_active = models.BooleanField(default=True)
     metadata = models.JSONField(null=True, blank=True)
+
+    objects = FaceVectorQuerySet.as_manager()
     
     def __str__(self):
         return f"Face Vector {self.id} - {self.name or 'Unnamed'}"
@@ -52,18 +121,20 @@ class FaceVector(models.Model):
     class Meta:
         ordering = ['-created_at']
 
-class AnonymousFaceVector(models.Model):
+class AnonymousFaceVector(FaceVectorDeleteMixin, models.Model):
     """Anonim yüz vektörlerini saklayan model"""
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     name = models.CharField(max_length=100, blank=True)
     vector_data = models.BinaryField()
     vector_size = models.IntegerField()
-    face_image_base64 = models.TextField(null=True, blank=True)
+    image = models.ForeignKey(FaceImage, on_delete=models.SET_NULL, related_name='anonymous_face_vectors', null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     is_active = models.BooleanField(default=True)
     metadata = models.JSONField(null=True, blank=True)
     source_ip = models.GenericIPAddressField(null=True, blank=True)  # İsteğin geldiği IP adresi
+
+    objects = FaceVectorQuerySet.as_manager()
     
     def __str__(self):
         return f"Anonymous Face Vector {self.id} - {self.name or 'Unnamed'}"
@@ -98,6 +169,8 @@ class Door(models.Model):
         ],
         default='CLOSED'
     )
+    # True ise yalnızca DoorAccess ile yetki verilmiş kullanıcılar doğrulanır
+    access_restricted = models.BooleanField(default=False)
     updated_at = models.DateTimeField(auto_now=True)
     
     def __str__(self):
@@ -107,6 +180,19 @@ class Door(models.Model):
         ordering = ['name']
 
 
+class DoorAccess(models.Model):
+    """Bir kullanıcının bir kapıdan geçme yetkisi"""
+    door = models.ForeignKey(Door, on_delete=models.CASCADE, related_name='accesses')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='door_accesses')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.user.username} -> {self.door.name}"
+
+    class Meta:
+        unique_together = ('door', 'user')
+
+
 class AccessLog(models.Model):
     """Kapıya erişim denemelerini kaydeden model"""
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
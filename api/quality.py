@@ -0,0 +1,109 @@
+# api/quality.py
+import threading
+
+import cv2
+from django.conf import settings
+
+# Red nedenleri; istemciye ve /api/metrics/ sayaçlarına aynı adlarla döner
+REJECTION_REASONS = ('face_too_small', 'low_detection_score', 'blurry', 'too_dark', 'too_bright')
+
+
+def quality_gate_enabled():
+    return getattr(settings, 'FACE_QUALITY_GATE', True)
+
+
+def blur_score(crop):
+    """Hizalanmış yüz kırpıntısının Laplacian varyansı; düşük değer bulanık görüntü demektir"""
+    gray = cv2.cvtColor(crop, cv2.COLOR_RGB2GRAY)
+    return float(cv2.Laplacian(gray, cv2.CV_64F).var())
+
+
+def brightness(crop):
+    """Kırpıntının ortalama gri seviyesi (0-255)"""
+    return float(cv2.cvtColor(crop, cv2.COLOR_RGB2GRAY).mean())
+
+
+def assess_face(face, crop):
+    """
+    Tespit edilen yüzü embedding'den önce ucuz ölçütlerle değerlendir.
+
+    Yüz boyutu dedektör girişindeki bbox'ın kısa kenarıdır; ArcFace kırpıntısı
+    da bu girişten alındığı için embedding'in gördüğü çözünürlük budur. Bulanıklık
+    ve parlaklık tanıma modeline girecek 112x112 kırpıntıda ölçülür, böylece
+    kaynak çözünürlüğünden bağımsızdır. İstemcide tespit edilmiş kırpıntılarda
+    (detected=False) boyut ve tespit skoru denetlenmez.
+    :return: {'face_size', 'det_score', 'blur', 'brightness', 'reasons': [...]}
+    """
+    reasons = []
+    quality = {
+        'blur': blur_score(crop),
+        'brightness': brightness(crop),
+    }
+
+    if face.get('detected', True):
+        x1, y1, x2, y2 = face['bbox'][:4]
+        quality['face_size'] = float(min(x2 - x1, y2 - y1))
+        quality['det_score'] = face['det_score']
+        if quality['face_size'] < getattr(settings, 'FACE_QUALITY_MIN_FACE_SIZE', 40):
+            reasons.append('face_too_small')
+        if quality['det_score'] < getattr(settings, 'FACE_QUALITY_MIN_DET_SCORE', 0.6):
+            reasons.append('low_detection_score')
+
+    if quality['blur'] < getattr(settings, 'FACE_QUALITY_MIN_BLUR', 35.0):
+        reasons.append('blurry')
+    min_brightness, max_brightness = getattr(settings, 'FACE_QUALITY_BRIGHTNESS_RANGE', (40, 220))
+    if quality['brightness'] < min_brightness:
+        reasons.append('too_dark')
+    elif quality['brightness'] > max_brightness:
+        reasons.append('too_bright')
+
+    quality['reasons'] = reasons
+    return quality
+
+
+class QualityGateStats:
+    """
+    Kalite kapısının sayaçları (süreç içi, iş parçacığı güvenli).
+    'rejected' embedding'i atlanan yüz sayısıdır; kazanılan işlem süresinin göstergesi.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def record(self, quality):
+        with self._lock:
+            self._checked += 1
+            if quality['reasons']:
+                self._rejected += 1
+            for reason in quality['reasons']:
+                self._reasons[reason] = self._reasons.get(reason, 0) + 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                'checked': self._checked,
+                'rejected': self._rejected,
+                'reasons': {reason: self._reasons.get(reason, 0) for reason in REJECTION_REASONS},
+            }
+
+    def reset(self):
+        with self._lock:
+            self._checked = 0
+            self._rejected = 0
+            self._reasons = {}
+
+
+quality_stats = QualityGateStats()
+
+
+def rejection_message(reasons):
+    """İstemciye dönecek kısa açıklama"""
+    labels = {
+        'face_too_small': 'face is too small',
+        'low_detection_score': 'face detection confidence is too low',
+        'blurry': 'image is too blurry',
+        'too_dark': 'image is too dark',
+        'too_bright': 'image is too bright',
+    }
+    return 'Face image rejected: ' + ', '.join(labels.get(reason, reason) for reason in reasons)
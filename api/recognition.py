@@ -0,0 +1,73 @@
+# api/recognition.py
+import base64
+
+from django.conf import settings
+
+from .embedding_cache import embedding_cache_key
+from .face_index import face_vector_index
+from .image_decode import CropInput, DetectorInput, detection_size, open_image
+from .image_store import content_hash
+from .inference import FaceCrop, inference_engine
+from .models import FaceVector
+
+
+def base64_image_bytes(face_image_base64):
+    """Base64 (data URI önekli olabilir) görüntünün baytları"""
+    if ';base64,' in face_image_base64:
+        face_image_base64 = face_image_base64.split(';base64,')[1]
+    return base64.b64decode(face_image_base64)
+
+
+def decode_image(data, crop_mode=False, landmarks=None):
+    """
+    Görüntü baytlarını kayıtla aynı analiz girdisine çevir: dedektör boyutunda
+    letterbox uygulanmış dizi ya da crop_mode'da (istemcide tespit edilmiş
+    kırpıntı) tespiti atlayan bir FaceCrop. Kayıt aynı görüntüyü aynı çerçevede
+    analiz ettiği için önbellek kayıtları iki yol arasında paylaşılabilir.
+    :return: (analiz girdisi, önbellek anahtarı)
+    """
+    image, original_size = open_image(data, None if crop_mode else detection_size())
+    if crop_mode:
+        decoded = CropInput(image, original_size, landmarks)
+        analysis_input = FaceCrop(decoded.array, landmarks)
+    else:
+        decoded = DetectorInput(image, original_size)
+        analysis_input = decoded.array
+    return analysis_input, embedding_cache_key(content_hash(data), crop_mode, landmarks, frame=decoded.frame)
+
+
+def best_face(faces):
+    """Güven skoru ve alanı en büyük yüzü seç"""
+    return max(
+        faces,
+        key=lambda face: (face['det_score'], (face['bbox'][2] - face['bbox'][0]) * (face['bbox'][3] - face['bbox'][1])),
+    )
+
+
+def recognize_image(image, cache_key=None):
+    """
+    Görüntüdeki en belirgin yüzü kayıtlı yüz vektörleriyle eşleştir (sunucu tarafı tanıma).
+    :param cache_key: decode_image'ın döndürdüğü anahtar; verilmişse tespit ve embedding önbellekten alınabilir
+    :return: {'result': 'recognized' | 'unknown' | 'no_face', 'confidence', ...}
+    """
+    faces = inference_engine.analyze(image, pipeline='recognition', cache_key=cache_key)
+    if not faces:
+        return {'result': 'no_face', 'confidence': 0.0}
+
+    face = best_face(faces)
+    face_vector_id, similarity = face_vector_index.best_match(face['embedding'])
+    threshold = getattr(settings, 'FACE_RECOGNITION_THRESHOLD', 0.5)
+    face_vector = None
+    if face_vector_id is not None and similarity > threshold:
+        face_vector = FaceVector.objects.select_related('user').filter(pk=face_vector_id).first()
+    if face_vector is None:
+        return {'result': 'unknown', 'confidence': float(similarity)}
+
+    return {
+        'result': 'recognized',
+        'confidence': float(similarity),
+        'face_vector_id': str(face_vector.id),
+        'matched_name': face_vector.name,
+        'user_id': face_vector.user.id if face_vector.user else None,
+        'username': face_vector.user.username if face_vector.user else None,
+    }
@@ -5,19 +5,117 @@ import base64
 from django.contrib.auth import authenticate
 from rest_framework_simplejwt.tokens import RefreshToken
 from .models import FaceVector, AnonymousFaceVector
-from PIL import Image
-import io
-import os
-from django.conf import settings
-import uuid
+from functools import partial
+from django.db import transaction
+from rest_framework.fields import empty
+from rest_framework.utils import html
+from .image_store import image_store, image_path, image_url
+from .uploads import vector_from_text
 
-class FaceVectorSerializer(serializers.ModelSerializer):
-    vector_data = serializers.ListField(child=serializers.FloatField(), write_only=True)
-    face_image_base64 = serializers.CharField(required=False, allow_null=True, allow_blank=True)
+
+def pop_face_image(validated_data):
+    """Multipart 'face_image' dosyasını ya da face_image_base64 alanını görüntü baytlarına çevir"""
+    upload = validated_data.pop('face_image', None)
+    face_image_base64 = validated_data.pop('face_image_base64', None)
+    if upload is not None:
+        return upload.read()
+    if face_image_base64:
+        if ';base64,' in face_image_base64:
+            face_image_base64 = face_image_base64.split(';base64,')[1]
+        return base64.b64decode(face_image_base64)
+    return None
+
+
+def include_image(context):
+    """İstek ?include=image ile görüntünün kendisini istiyor mu"""
+    request = (context or {}).get('request')
+    if request is None:
+        return False
+    return 'image' in request.query_params.get('include', '').split(',')
+
+
+class VectorField(serializers.ListField):
+    """
+    Float listesi. Multipart ve ham görüntü gövdeli isteklerde vector_data tek bir
+    metin olarak da gelebilir: JSON liste ya da base64 kodlu float32 baytları.
+    """
+
+    def __init__(self, **kwargs):
+        kwargs.setdefault('child', serializers.FloatField())
+        super().__init__(**kwargs)
+
+    def get_value(self, dictionary):
+        if html.is_html_input(dictionary) and len(dictionary.getlist(self.field_name)) == 1:
+            return dictionary.get(self.field_name, empty)
+        return super().get_value(dictionary)
+
+    def to_internal_value(self, data):
+        if isinstance(data, str):
+            try:
+                data = vector_from_text(data)
+            except ValueError as e:
+                raise serializers.ValidationError(f"Invalid vector text (JSON list or base64 float32 expected): {e}")
+        return super().to_internal_value(data)
+
+
+class FaceImageWriteMixin:
+    """
+    Yazma serializer'ları için ortak görüntü işleme: görüntü satıra değil
+    içerik adresli depoya (FaceImage) yazılır, satırda yalnızca referansı tutulur.
+    """
+
+    def attach_face_image(self, validated_data, metadata=None):
+        """Görüntü gönderildiyse depoya ekle; validated_data'ya image ve metadata yollarını koy"""
+        image_data = pop_face_image(validated_data)
+        if not image_data:
+            return None
+        face_image = image_store.store(image_data)
+        validated_data['image'] = face_image
+        
+        # Metadata'ya görüntü yolunu ekle
+        metadata = dict(validated_data.get('metadata') or metadata or {})
+        metadata['face_image_path'] = image_path(face_image.sha256)
+        metadata['face_image_url'] = image_url(face_image.sha256)
+        validated_data['metadata'] = metadata
+        return face_image
+
+    def update(self, instance, validated_data):
+        vector_list = validated_data.pop('vector_data', None)
+        if vector_list:
+            validated_data['vector_data'] = np.array(vector_list, dtype=np.float32).tobytes()
+            validated_data['vector_size'] = len(vector_list)
+        with transaction.atomic():
+            previous_image_id = instance.image_id
+            if self.attach_face_image(validated_data, instance.metadata) and previous_image_id:
+                transaction.on_commit(partial(image_store.release, [previous_image_id]))
+            return super().update(instance, validated_data)
+
+
+class FaceImageReadMixin(serializers.Serializer):
+    """
+    Yanıt serializer'ları için görüntü alanları: image_url her zaman döner,
+    face_image_base64 yalnızca ?include=image ile depodan okunarak eklenir.
+    """
+    image_url = serializers.SerializerMethodField()
+
+    def get_image_url(self, obj):
+        return image_url(obj.image_id) if obj.image_id else None
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        if include_image(self.context):
+            image_data = image_store.read(instance.image_id) if instance.image_id else None
+            data['face_image_base64'] = base64.b64encode(image_data).decode() if image_data else None
+        return data
+
+class FaceVectorSerializer(FaceImageWriteMixin, serializers.ModelSerializer):
+    vector_data = VectorField(write_only=True)
+    face_image_base64 = serializers.CharField(required=False, allow_null=True, allow_blank=True, write_only=True)
+    face_image = serializers.FileField(required=False, write_only=True)  # multipart ya da ham görüntü gövdesi
     
     class Meta:
         model = FaceVector
-        fields = ['id', 'user', 'name', 'vector_data', 'vector_size', 'face_image_base64', 'created_at', 'is_active', 'metadata']
+        fields = ['id', 'user', 'name', 'vector_data', 'vector_size', 'face_image_base64', 'face_image', 'created_at', 'is_active', 'metadata']
         read_only_fields = ['id', 'created_at', 'vector_size']
         extra_kwargs = {
             'user': {'required': False},
@@ -46,77 +144,37 @@ class FaceVectorSerializer(serializers.ModelSerializer):
         if not vector_list:
             raise serializers.ValidationError({"vector_data": "This field is required."})
         
-        # Base64 görüntüsünü media klasörüne kaydet
-        face_image_path = None
-        if 'face_image_base64' in validated_data and validated_data['face_image_base64']:
+        # Vektör kaydedilemezse görüntü referansı da geri alınır
+        with transaction.atomic():
+            # Görüntü içerik adresli depoya eklenir; aynı baytlar tekrar yazılmaz
+            self.attach_face_image(validated_data)
+            
             try:
-                # Base64 görüntüsünü al
-                face_image_base64 = validated_data['face_image_base64']
-                
-                # Base64'ü görüntüye dönüştür
-                image_data = base64.b64decode(face_image_base64)
-                image = Image.open(io.BytesIO(image_data))
-                
-                # Media klasörü ve yüz görüntüleri için alt klasör oluştur
-                media_root = settings.MEDIA_ROOT
-                face_images_dir = os.path.join(media_root, 'face_images')
-                os.makedirs(face_images_dir, exist_ok=True)
-                
-                # Kullanıcı bazlı klasör oluştur (isteğe bağlı)
-                user_id = validated_data.get('user', None)
-                user_dir = os.path.join(face_images_dir, f"user_{user_id.id if user_id else 'anonymous'}")
-                os.makedirs(user_dir, exist_ok=True)
-                
-                # Görüntü dosyası adı oluştur
-                image_filename = f"face_{uuid.uuid4()}.jpg"
-                image_path = os.path.join(user_dir, image_filename)
-                
-                # Görüntüyü kaydet
-                image.save(image_path, format='JPEG', quality=95)
-                
-                # Relatif URL oluştur (MEDIA_URL + path)
-                relative_path = os.path.join('face_images', f"user_{user_id.id if user_id else 'anonymous'}", image_filename)
-                face_image_path = relative_path
-                
-                # Metadata'ya görüntü yolunu ekle
-                if 'metadata' not in validated_data or validated_data['metadata'] is None:
-                    validated_data['metadata'] = {}
-                
-                validated_data['metadata']['face_image_path'] = face_image_path
-                validated_data['metadata']['face_image_url'] = os.path.join(settings.MEDIA_URL, relative_path.replace('\\', '/'))
+                # Listeden numpy dizisine dönüştürme
+                vector_np = np.array(vector_list, dtype=np.float32)
+                vector_size = len(vector_np)
                 
-                print(f"Face image saved to: {image_path}")
+                # Binary veriye dönüştür
+                vector_bytes = vector_np.tobytes()
                 
+                # FaceVector modelini oluştur
+                face_vector = FaceVector.objects.create(
+                    vector_data=vector_bytes,
+                    vector_size=vector_size,
+                    **validated_data
+                )
+                return face_vector
             except Exception as e:
-                print(f"Error saving face image: {str(e)}")
-                # Hata durumunda işlemi durdurmuyoruz, sadece logluyor ve devam ediyoruz
-        
-        try:
-            # Listeden numpy dizisine dönüştürme
-            vector_np = np.array(vector_list, dtype=np.float32)
-            vector_size = len(vector_np)
-            
-            # Binary veriye dönüştür
-            vector_bytes = vector_np.tobytes()
-            
-            # FaceVector modelini oluştur
-            face_vector = FaceVector.objects.create(
-                vector_data=vector_bytes,
-                vector_size=vector_size,
-                **validated_data
-            )
-            return face_vector
-        except Exception as e:
-            raise serializers.ValidationError({"vector_data": f"Invalid vector data format: {str(e)}"})
+                raise serializers.ValidationError({"vector_data": f"Invalid vector data format: {str(e)}"})
 
-class FaceVectorResponseSerializer(serializers.ModelSerializer):
+class FaceVectorResponseSerializer(FaceImageReadMixin, serializers.ModelSerializer):
     """FaceVector yanıtı için serializer"""
     username = serializers.SerializerMethodField()
     vector_data = serializers.SerializerMethodField()
     
     class Meta:
         model = FaceVector
-        fields = ['id', 'username', 'name', 'vector_data', 'vector_size', 'face_image_base64', 'created_at', 'is_active']
+        fields = ['id', 'username', 'name', 'vector_data', 'vector_size', 'image_url', 'created_at', 'is_active']
         
     def get_username(self, obj):
         if obj.user:
@@ -133,13 +191,14 @@ class FaceVectorResponseSerializer(serializers.ModelSerializer):
         return None
 
 
-class AnonymousFaceVectorSerializer(serializers.ModelSerializer):
-    vector_data = serializers.ListField(child=serializers.FloatField(), write_only=True)
-    face_image_base64 = serializers.CharField(required=False, allow_null=True, allow_blank=True)
+class AnonymousFaceVectorSerializer(FaceImageWriteMixin, serializers.ModelSerializer):
+    vector_data = VectorField(write_only=True)
+    face_image_base64 = serializers.CharField(required=False, allow_null=True, allow_blank=True, write_only=True)
+    face_image = serializers.FileField(required=False, write_only=True)  # multipart ya da ham görüntü gövdesi
     
     class Meta:
         model = AnonymousFaceVector
-        fields = ['id', 'name', 'vector_data', 'vector_size', 'face_image_base64', 'created_at', 'is_active', 'metadata']
+        fields = ['id', 'name', 'vector_data', 'vector_size', 'face_image_base64', 'face_image', 'created_at', 'is_active', 'metadata']
         read_only_fields = ['id', 'created_at', 'vector_size', 'source_ip']
         extra_kwargs = {
             'name': {'required': False},
@@ -167,32 +226,36 @@ class AnonymousFaceVectorSerializer(serializers.ModelSerializer):
         if not vector_list:
             raise serializers.ValidationError({"vector_data": "This field is required."})
         
-        try:
-            # Listeden numpy dizisine dönüştürme
-            vector_np = np.array(vector_list, dtype=np.float32)
-            vector_size = len(vector_np)
-            
-            # Binary veriye dönüştür
-            vector_bytes = vector_np.tobytes()
-            
-            # IP adresini kaydet (eğer request mevcut ise)
-            source_ip = None
-            request = self.context.get('request')
-            if request:
-                source_ip = request.META.get('REMOTE_ADDR')
+        # Vektör kaydedilemezse görüntü referansı da geri alınır
+        with transaction.atomic():
+            self.attach_face_image(validated_data)
             
-            # AnonymousFaceVector modelini oluştur
-            face_vector = AnonymousFaceVector.objects.create(
-                vector_data=vector_bytes,
-                vector_size=vector_size,
-                source_ip=source_ip,
-                **validated_data
-            )
-            return face_vector
-        except Exception as e:
-            raise serializers.ValidationError({"vector_data": f"Invalid vector data format: {str(e)}"})
+            try:
+                # Listeden numpy dizisine dönüştürme
+                vector_np = np.array(vector_list, dtype=np.float32)
+                vector_size = len(vector_np)
+                
+                # Binary veriye dönüştür
+                vector_bytes = vector_np.tobytes()
+                
+                # IP adresini kaydet (eğer request mevcut ise)
+                source_ip = None
+                request = self.context.get('request')
+                if request:
+                    source_ip = request.META.get('REMOTE_ADDR')
+                
+                # AnonymousFaceVector modelini oluştur
+                face_vector = AnonymousFaceVector.objects.create(
+                    vector_data=vector_bytes,
+                    vector_size=vector_size,
+                    source_ip=source_ip,
+                    **validated_data
+                )
+                return face_vector
+            except Exception as e:
+                raise serializers.ValidationError({"vector_data": f"Invalid vector data format: {str(e)}"})
 
-class AnonymousFaceVectorResponseSerializer(serializers.ModelSerializer):
+class AnonymousFaceVectorResponseSerializer(FaceImageReadMixin, serializers.ModelSerializer):
     """AnonymousFaceVector yanıtı için serializer"""
     vector_data = serializers.SerializerMethodField()
     formatted_created_at = serializers.SerializerMethodField()
@@ -200,7 +263,7 @@ class AnonymousFaceVectorResponseSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = AnonymousFaceVector
-        fields = ['id', 'name', 'vector_data', 'vector_size', 'face_image_base64', 
+        fields = ['id', 'name', 'vector_data', 'vector_size', 'image_url', 
                  'created_at', 'updated_at', 'formatted_created_at', 'formatted_updated_at', 
                  'is_active', 'source_ip']
     
@@ -308,7 +371,7 @@ class FaceEmbeddingSerializer(serializers.Serializer):
 class DoorSerializer(serializers.ModelSerializer):
     class Meta:
         model = Door
-        fields = ['id', 'name', 'current_status', 'updated_at']
+        fields = ['id', 'name', 'current_status', 'access_restricted', 'updated_at']
         read_only_fields = ['id', 'updated_at']
 
 
@@ -0,0 +1,95 @@
+# api/signals.py
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, pre_delete
+from django.dispatch import receiver
+
+from .face_index import face_vector_index, anonymous_face_vector_index, user_embedding_index, door_gallery
+from .gallery_sync import delta_bus
+from .image_store import image_store
+from .models import User, FaceVector, AnonymousFaceVector, DoorAccess, face_vectors_deleted, face_vectors_updated
+
+_VECTOR_INDEXES = {
+    FaceVector: face_vector_index,
+    AnonymousFaceVector: anonymous_face_vector_index,
+}
+# Bu alanlar değişmediyse kayıt galeriyi etkilemez (ör. last_login güncellemesi)
+_VECTOR_FIELDS = {'vector_data', 'is_active'}
+_EMBEDDING_FIELDS = {'face_embedding', 'is_face_registered'}
+
+
+def _on_commit(index, added=None, removed=()):
+    """Değişikliği işlem commit edildikten sonra galeriye uygula ve yayınla"""
+    transaction.on_commit(partial(delta_bus.commit, index, added, removed))
+
+
+@receiver(post_save, sender=FaceVector)
+@receiver(post_save, sender=AnonymousFaceVector)
+def face_vector_saved(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and not _VECTOR_FIELDS & set(update_fields):
+        return
+    index = _VECTOR_INDEXES[sender]
+    if instance.is_active and instance.vector_data:
+        _on_commit(index, added={instance.pk: bytes(instance.vector_data)})
+    else:
+        _on_commit(index, removed=[instance.pk])
+
+
+@receiver(face_vectors_deleted, sender=FaceVector)
+@receiver(face_vectors_deleted, sender=AnonymousFaceVector)
+def face_vectors_removed(sender, pks, image_ids=(), **kwargs):
+    _on_commit(_VECTOR_INDEXES[sender], removed=pks)
+    if image_ids:
+        transaction.on_commit(partial(image_store.release, image_ids))
+
+
+@receiver(face_vectors_updated, sender=FaceVector)
+@receiver(face_vectors_updated, sender=AnonymousFaceVector)
+def face_vectors_bulk_updated(sender, pks, **kwargs):
+    # Satırların güncel hali aynı işlem içinde okunur
+    added = {}
+    for pk, is_active, raw in sender.objects.filter(pk__in=pks).values_list('pk', 'is_active', 'vector_data'):
+        if is_active and raw:
+            added[pk] = bytes(raw)
+    _on_commit(_VECTOR_INDEXES[sender], added=added, removed=[pk for pk in pks if pk not in added])
+
+
+def _user_delta(user):
+    """Kullanıcının embedding galerilerindeki yeni hali: (eklenenler, silinenler)"""
+    if user.is_face_registered and user.face_embedding:
+        return {user.pk: bytes(user.face_embedding)}, ()
+    return None, [user.pk]
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and not _EMBEDDING_FIELDS & set(update_fields):
+        return
+    added, removed = _user_delta(instance)
+    _on_commit(user_embedding_index, added, removed)
+    for door_id in DoorAccess.objects.filter(user=instance).values_list('door_id', flat=True):
+        _on_commit(door_gallery(door_id), added, removed)
+
+
+@receiver(pre_delete, sender=User)
+def user_deleting(sender, instance, **kwargs):
+    # Kullanıcının yüz vektörleri CASCADE ile toplu silinir; QuerySet.delete() çağrılmaz
+    rows = list(FaceVector.objects.filter(user=instance).values_list('pk', 'image_id'))
+    if rows:
+        _on_commit(face_vector_index, removed=[pk for pk, _ in rows])
+        transaction.on_commit(partial(image_store.release, [image_id for _, image_id in rows if image_id]))
+    _on_commit(user_embedding_index, removed=[instance.pk])
+
+
+@receiver(post_save, sender=DoorAccess)
+def door_access_granted(sender, instance, created, **kwargs):
+    if created:
+        added, removed = _user_delta(instance.user)
+        _on_commit(door_gallery(instance.door_id), added, removed)
+
+
+@receiver(post_delete, sender=DoorAccess)
+def door_access_revoked(sender, instance, **kwargs):
+    # Kullanıcı ya da kapı silindiğinde CASCADE ile de çağrılır
+    _on_commit(door_gallery(instance.door_id), removed=[instance.user_id])
@@ -1,3 +1,1210 @@
-from django.test import TestCase
+import base64
+import hashlib
+import io
+import logging.handlers
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from PIL import Image
+from rest_framework.test import APIClient
+
+from .embedding_cache import EmbeddingCache, cache_version, embedding_cache, embedding_cache_key
+from .face_index import (
+    FaceGalleryIndex, face_vector_index, anonymous_face_vector_index, user_embedding_index, door_gallery,
+)
+from .image_decode import CropInput, DetectorInput
+from .image_store import image_store, image_path
+from .inference import (
+    FaceCrop, InferenceEngine, InferenceQueueFull, InferenceTimeout, _detect, analyze_faces_batch, detection_size_stats,
+    inference_engine,
+)
+from .match_cache import MatchCache, verification_cache
+from .media_writer import media_writer
+from .models import User, FaceImage, FaceVector, AnonymousFaceVector, Door, DoorAccess, AccessLog
+from .quality import assess_face
+from .recognition import decode_image, recognize_image
+from .routing import websocket_urlpatterns
+
+
+def random_vectors(count, size=512, seed=0):
+    return np.random.default_rng(seed).standard_normal((count, size)).astype(np.float32)
+
+
+def jpeg_image(color=(128, 128, 128), size=(64, 64)):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, color).save(buffer, format='JPEG')
+    return buffer.getvalue()
+
+
+def square_image(size, box, format='JPEG'):
+    """Siyah zemin üzerinde box ([x1, y1, x2, y2]) bölgesi beyaz olan görüntünün baytları"""
+    image = Image.new('RGB', size)
+    image.paste((255, 255, 255), tuple(box))
+    buffer = io.BytesIO()
+    image.save(buffer, format=format)
+    return buffer.getvalue()
+
+
+def bright_box(array):
+    """Dizideki parlak bölgenin [x1, y1, x2, y2] kutusu; yoksa None"""
+    ys, xs = np.nonzero(np.asarray(array).max(axis=2) > 128)
+    if not len(xs):
+        return None
+    return np.array([xs.min(), ys.min(), xs.max() + 1, ys.max() + 1], dtype=np.float32)
+
+
+def embedding_base64(vector):
+    return base64.b64encode(np.asarray(vector, dtype=np.float32).tobytes()).decode()
+
+
+def reset_gallery(index):
+    """Süreç düzeyindeki indeks önceki testlerin satırlarını taşımasın"""
+    index._groups, index._signature = {}, None
+
+
+def temp_media_root(test):
+    """Test süresince MEDIA_ROOT'u geçici bir dizine yönlendir"""
+    media_root = tempfile.mkdtemp()
+    test.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+    media_override = override_settings(MEDIA_ROOT=media_root)
+    media_override.enable()
+    test.addCleanup(media_override.disable)
+
+
+def wait_until(condition, timeout=5):
+    """Arka plan iş parçacığının durumu değiştirmesini bekle"""
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError('Condition was not met in time')
+        time.sleep(0.005)
+
+
+# Yüz noktalarının kutu içindeki göreli konumları (gözler, burun, ağız köşeleri)
+FACE_POINTS = np.array([[0.3, 0.4], [0.7, 0.4], [0.5, 0.6], [0.3, 0.8], [0.7, 0.8]], dtype=np.float32)
+
+
+class FakeDetector:
+    """SCRFD yerine: parlak bölgeyi yüz sayar; found_at verilmişse yalnızca o giriş boyutlarında bulur"""
+
+    def __init__(self, found_at=None):
+        self.found_at = found_at
+        self.calls = []
+
+    def detect(self, image, input_size=None, max_num=0, metric='default'):
+        size = tuple(input_size) if input_size is not None else None
+        self.calls.append(size)
+        box = bright_box(image)
+        if box is None or (self.found_at is not None and size not in self.found_at):
+            return np.zeros((0, 5), dtype=np.float32), np.zeros((0, 5, 2), dtype=np.float32)
+        kps = box[:2] + FACE_POINTS * (box[2:] - box[:2])
+        return np.append(box, 0.99)[None].astype(np.float32), kps[None]
+
+
+class FakeRecognizer:
+    """ArcFace yerine: kırpıntının ilk piksel değerini one-hot embedding'e çevirir"""
+    input_size = (112, 112)
+
+    def __init__(self):
+        self.batches = []
+        self.called = threading.Event()
+        self.proceed = None  # verilirse get_feat bu olayı bekler
+
+    def get_feat(self, crops):
+        values = [int(crop[0, 0, 0]) for crop in crops]
+        self.batches.append(values)
+        self.called.set()
+        if self.proceed is not None:
+            self.proceed.wait(5)
+        return np.eye(512, dtype=np.float32)[values]
+
+
+class FakeFaceModels:
+    """face_models yerine; ONNX modelleri yüklenmeden analyze_faces_batch çalışır"""
+
+    def __init__(self, detector=None, sizes=((640, 640),)):
+        self.detector = detector or FakeDetector()
+        self.recognizer = FakeRecognizer()
+        self.analyzer = SimpleNamespace(det_model=self.detector, models={'recognition': self.recognizer})
+        self.sizes = sizes
+
+    def get(self):
+        return self.analyzer
+
+    def detection_sizes(self):
+        return self.sizes
+
+
+class PendingExecutor:
+    """İşleri çalıştırmayan havuz; Future'ları test tamamlar (started ise işler çalışıyor sayılır)"""
+
+    def __init__(self, started=False):
+        self.started = started
+        self.futures = []
+
+    def submit(self, function, *args):
+        future = Future()
+        if self.started:
+            future.set_running_or_notify_cancel()
+        self.futures.append(future)
+        return future
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        pass
+
+
+# Testlerde anlık görüntü, paylaşılan bellek ve disk önbelleği kapalı; dosyalar eşzamanlı yazılır
+TEST_SETTINGS = dict(
+    FACE_GALLERY_SNAPSHOT_DIR=None,
+    FACE_GALLERY_SHARED_MEMORY=False,
+    FACE_EMBEDDING_CACHE_DIR=None,
+    FACE_MEDIA_WRITER_ASYNC=False,
+    FACE_INFERENCE_WORKERS=0,
+)
+
+
+@override_settings(**TEST_SETTINGS)
+class FaceGalleryIndexTests(TestCase):
+    """Galeri indeksinin kaba kuvvet aramayla aynı sonuçları verdiği"""
+
+    def setUp(self):
+        self.vectors = random_vectors(300)
+        self.rows = [
+            FaceVector.objects.create(name=f"v{i}", vector_data=vector.tobytes(), vector_size=len(vector))
+            for i, vector in enumerate(self.vectors)
+        ]
+        self.index = FaceGalleryIndex('test', lambda: FaceVector.objects.filter(is_active=True))
+
+    def brute_force(self, query, k):
+        rows = list(FaceVector.objects.filter(is_active=True).values_list('pk', 'vector_data'))
+        matrix = np.vstack([np.frombuffer(raw, dtype=np.float32) for _, raw in rows])
+        matrix = matrix / np.linalg.norm(matrix, axis=1, keepdims=True)
+        scores = matrix @ (query / np.linalg.norm(query))
+        return [(rows[i][0], float(scores[i])) for i in np.argsort(-scores)[:k]]
+
+    def assertSameResults(self, results, expected):
+        self.assertEqual([pk for pk, _ in results], [pk for pk, _ in expected])
+        np.testing.assert_allclose([s for _, s in results], [s for _, s in expected], atol=1e-5)
+
+    def queries(self, count=5):
+        noise = random_vectors(count, seed=1) * 0.5
+        return [self.vectors[i * 7] + noise[i] for i in range(count)]
+
+    def test_exact_search_matches_brute_force(self):
+        for query in self.queries():
+            self.assertSameResults(self.index.search(query, -1.0, 10), self.brute_force(query, 10))
+
+    def test_search_batch_matches_single_search(self):
+        queries = self.queries()
+        batch = self.index.search_batch(queries, -1.0, 5)
+        for query, results in zip(queries, batch):
+            self.assertSameResults(results, self.index.search(query, -1.0, 5))
+
+    def test_best_match(self):
+        pk, similarity = self.index.best_match(self.vectors[42])
+        self.assertEqual(pk, self.rows[42].pk)
+        self.assertAlmostEqual(similarity, 1.0, places=5)
+
+    def test_threshold_and_max_results(self):
+        query = self.queries(1)[0]
+        results = self.index.search(query, 0.5, 3)
+        self.assertLessEqual(len(results), 3)
+        self.assertTrue(all(score >= 0.5 for _, score in results))
+
+    def test_incremental_add_and_remove(self):
+        self.index.refresh()
+        self.index.poll_interval = 3600  # yalnızca artımlı değişiklikler görülsün
+        vector = random_vectors(1, seed=5)[0]
+        added = FaceVector.objects.create(name='added', vector_data=vector.tobytes(), vector_size=512)
+        self.index.add(added.pk, vector.tobytes())
+        self.assertEqual(self.index.best_match(vector)[0], added.pk)
+
+        self.index.remove(self.rows[42].pk)
+        self.assertNotEqual(self.index.best_match(self.vectors[42])[0], self.rows[42].pk)
+
+    def test_refresh_picks_up_database_changes(self):
+        self.index.refresh()
+        self.rows[10].delete()
+        vector = random_vectors(1, seed=6)[0]
+        created = FaceVector.objects.create(name='new', vector_data=vector.tobytes(), vector_size=512)
+        self.assertEqual(self.index.best_match(vector)[0], created.pk)
+        self.assertNotEqual(self.index.best_match(self.vectors[10])[0], self.rows[10].pk)
+        query = self.queries(1)[0]
+        self.assertSameResults(self.index.search(query, -1.0, 10), self.brute_force(query, 10))
+
+    @override_settings(FACE_INDEX_IVF_MIN_ROWS=0, FACE_INDEX_IVF_NLIST=8)
+    def test_ivf_with_all_lists_matches_brute_force(self):
+        for query in self.queries():
+            results = self.index.search(query, -1.0, 10, backend='ivf', nprobe=8)
+            self.assertSameResults(results, self.brute_force(query, 10))
+
+    def test_quantized_search_reranks_without_queries(self):
+        for precision in ('float16', 'int8'):
+            with self.subTest(precision=precision), override_settings(FACE_INDEX_PRECISION=precision):
+                index = FaceGalleryIndex(precision, lambda: FaceVector.objects.filter(is_active=True))
+                index.refresh()
+                index.poll_interval = 3600
+                # Kuyruktaki satırlar da float32 ile yeniden sıralanır
+                vector = random_vectors(1, seed=7)[0]
+                tail = FaceVector.objects.create(name='tail', vector_data=vector.tobytes(), vector_size=512)
+                index.add(tail.pk, vector.tobytes())
+                for query in self.queries() + [vector]:
+                    with CaptureQueriesContext(connection) as queries:
+                        results = index.search(query, -1.0, 5)
+                    self.assertEqual(len(queries), 0)
+                    self.assertSameResults(results, self.brute_force(query, 5))
+                tail.delete()
+
+
+@override_settings(**TEST_SETTINGS)
+class BatchEndpointTests(TestCase):
+    """Toplu benzer vektör arama ve toplu doğrulama uç noktaları"""
+
+    def setUp(self):
+        self.vectors = random_vectors(3, seed=11)
+        self.users = [
+            User.objects.create_user(
+                f"batch{i}", password='secret', is_face_registered=True, face_embedding=vector.tobytes(),
+            )
+            for i, vector in enumerate(self.vectors)
+        ]
+        self.rows = [
+            FaceVector.objects.create(user=user, name=f"v{i}", vector_data=vector.tobytes(), vector_size=512)
+            for i, (user, vector) in enumerate(zip(self.users, self.vectors))
+        ]
+        for index in (face_vector_index, user_embedding_index):
+            reset_gallery(index)
+        self.client = APIClient()
+
+    def test_find_similar_batch_keeps_query_order(self):
+        stranger = random_vectors(1, seed=12)[0]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post('/api/face-vectors/find-similar/batch/', {
+                'vectors': [self.vectors[2].tolist(), stranger.tolist(), self.vectors[0].tolist()],
+                'threshold': 0.9,
+                'max_results': 1,
+            }, format='json')
+        self.assertEqual(response.status_code, 200)
+        results = response.data['results']
+        self.assertEqual(
+            [[item['id'] for item in items] for items in results], [[str(self.rows[2].pk)], [], [str(self.rows[0].pk)]],
+        )
+        self.assertEqual([items[0]['username'] for items in results if items], ['batch2', 'batch0'])
+        self.assertAlmostEqual(results[2][0]['similarity'], 1.0, places=5)
+        # Tüm sorguların satırları tek sorguda çekilir
+        selects = [query['sql'] for query in queries.captured_queries if query['sql'].startswith('SELECT')]
+        self.assertEqual(len([sql for sql in selects if '"api_facevector"."id" IN' in sql]), 1)
+
+    def test_verify_batch_logs_every_embedding(self):
+        door = Door.objects.create(name='Batch')
+        stranger = random_vectors(1, seed=12)[0]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post('/api/face/verify/batch/', {
+                'embeddings': [embedding_base64(v) for v in (self.vectors[1], stranger, self.vectors[0])],
+                'door_id': str(door.id),
+            }, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.data['success'])
+        results = response.data['results']
+        self.assertEqual([item['success'] for item in results], [True, False, True])
+        self.assertEqual([item.get('user_id') for item in results], [self.users[1].pk, None, self.users[0].pk])
+        self.assertEqual(results[0]['username'], 'batch1')
+
+        # Erişim logları tek INSERT ile, istek sırasıyla yazılır
+        inserts = [query['sql'] for query in queries.captured_queries if query['sql'].startswith('INSERT INTO "api_accesslog"')]
+        self.assertEqual(len(inserts), 1)
+        logs = {log.id: log for log in AccessLog.objects.all()}
+        self.assertEqual(len(logs), 3)
+        for item in results:
+            log = logs[item['access_log_id']]
+            self.assertEqual(log.was_successful, item['success'])
+            self.assertEqual(log.user_id, item.get('user_id'))
+            self.assertEqual(log.door_id, door.id)
+            self.assertAlmostEqual(log.similarity_score, item['similarity'], places=5)
+        door.refresh_from_db()
+        self.assertEqual(door.current_status, 'OPEN')
+
+
+@override_settings(**TEST_SETTINGS)
+class GallerySignalTests(TestCase):
+    """Silme ve güncellemelerin veritabanı yoklanmadan sinyallerle galeriye yansıdığı"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('gallery', password='secret')
+        self.vectors = random_vectors(4, seed=3)
+        self.rows = [
+            FaceVector.objects.create(user=self.user, name=f"v{i}", vector_data=vector.tobytes(), vector_size=512)
+            for i, vector in enumerate(self.vectors)
+        ]
+        self.anonymous = AnonymousFaceVector.objects.create(vector_data=self.vectors[0].tobytes(), vector_size=512)
+        # delete() örneğin pk'sını None yapar; karşılaştırma için önceden saklanır
+        self.pks = [row.pk for row in self.rows]
+        self.anonymous_pk = self.anonymous.pk
+        for index in (face_vector_index, anonymous_face_vector_index):
+            reset_gallery(index)
+            index.poll_interval = 0
+            index.refresh()
+            index.poll_interval = 3600
+            self.addCleanup(setattr, index, 'poll_interval', 0)
+
+    def indexed(self, i):
+        return face_vector_index.best_match(self.vectors[i])[0] == self.pks[i]
+
+    def anonymous_indexed(self):
+        return anonymous_face_vector_index.best_match(self.vectors[0])[0] == self.anonymous_pk
+
+    def test_single_delete(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.rows[0].delete()
+            self.anonymous.delete()
+        self.assertFalse(self.indexed(0))
+        self.assertFalse(self.anonymous_indexed())
+        self.assertTrue(self.indexed(1))
+
+    def test_bulk_delete(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            FaceVector.objects.filter(pk__in=[self.rows[0].pk, self.rows[1].pk]).delete()
+        self.assertFalse(self.indexed(0))
+        self.assertFalse(self.indexed(1))
+        self.assertTrue(self.indexed(2))
+
+    def test_cascade_delete(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.delete()
+        self.assertEqual(len(face_vector_index), 0)
+        self.assertTrue(self.anonymous_indexed())
+
+    def test_deactivate_with_save(self):
+        self.rows[0].is_active = False
+        with self.captureOnCommitCallbacks(execute=True):
+            self.rows[0].save()
+        self.assertFalse(self.indexed(0))
+        self.assertTrue(self.indexed(1))
+
+    def test_bulk_update(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            FaceVector.objects.filter(pk__in=[self.rows[0].pk, self.rows[1].pk]).update(is_active=False)
+        self.assertFalse(self.indexed(0))
+        self.assertFalse(self.indexed(1))
+        self.assertTrue(self.indexed(2))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            FaceVector.objects.filter(pk=self.rows[0].pk).update(is_active=True)
+        self.assertTrue(self.indexed(0))
+
+    def test_bulk_update_of_other_fields_sends_nothing(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            FaceVector.objects.update(name='renamed')
+        self.assertEqual(callbacks, [])
+
+
+@override_settings(**TEST_SETTINGS)
+class DoorAccessTests(TestCase):
+    """Kapı bazlı yetki galerisi, yetki uç noktası ve erişimi kısıtlı kapıda doğrulama"""
+
+    def setUp(self):
+        self.vectors = random_vectors(2, seed=9)
+        self.users = [
+            User.objects.create_user(
+                f"door{i}", password='secret', is_face_registered=True, face_embedding=vector.tobytes(),
+            )
+            for i, vector in enumerate(self.vectors)
+        ]
+        self.door = Door.objects.create(name='Lab', access_restricted=True)
+        self.url = f'/api/doors/{self.door.id}/access/'
+        self.client = APIClient()
+        self.client.force_authenticate(self.users[0])
+        reset_gallery(user_embedding_index)
+
+    def verify(self, i):
+        return APIClient().post('/api/face/verify/', {
+            'embedding': embedding_base64(self.vectors[i]),
+            'door_id': str(self.door.id),
+        }, format='json')
+
+    def test_granting_access_changes_the_gallery_signature(self):
+        gallery = door_gallery(self.door.id)
+        self.assertIs(door_gallery(self.door.id), gallery)
+        self.assertIsNone(gallery.best_match(self.vectors[0])[0])
+        signature = gallery._db_signature()
+
+        DoorAccess.objects.create(door=self.door, user=self.users[0])
+        self.assertNotEqual(gallery._db_signature(), signature)
+        self.assertEqual(gallery.best_match(self.vectors[0])[0], self.users[0].pk)
+        self.assertNotEqual(gallery.best_match(self.vectors[1])[0], self.users[1].pk)
+
+    def test_access_endpoint(self):
+        user_ids = [user.pk for user in self.users]
+        response = self.client.post(self.url, {'user_ids': user_ids}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertCountEqual(response.data['user_ids'], user_ids)
+
+        # Var olan yetki yeniden verilince çoğalmaz
+        self.client.post(self.url, {'user_ids': user_ids[:1]}, format='json')
+        response = self.client.get(self.url)
+        self.assertTrue(response.data['access_restricted'])
+        self.assertCountEqual(response.data['user_ids'], user_ids)
+        self.assertEqual(DoorAccess.objects.filter(door=self.door).count(), 2)
+
+        response = self.client.delete(self.url, {'user_ids': user_ids[1:]}, format='json')
+        self.assertEqual(response.data['user_ids'], user_ids[:1])
+
+        self.assertEqual(self.client.post(self.url, {'user_ids': []}, format='json').status_code, 400)
+
+    def test_access_endpoint_requires_authentication(self):
+        client = APIClient()
+        self.assertIn(client.get(self.url).status_code, (401, 403))
+        self.assertIn(client.post(self.url, {'user_ids': [self.users[0].pk]}, format='json').status_code, (401, 403))
+        self.assertFalse(DoorAccess.objects.exists())
+
+    def test_restricted_door_rejects_users_without_access(self):
+        DoorAccess.objects.create(door=self.door, user=self.users[0])
+        self.assertEqual(self.verify(0).status_code, 200)
+
+        response = self.verify(1)
+        self.assertEqual(response.status_code, 401)
+        self.assertFalse(AccessLog.objects.get(pk=response.data['access_log_id']).was_successful)
+
+        # Kısıtlanmamış kapıda tüm kayıtlı kullanıcılar doğrulanır
+        self.door.access_restricted = False
+        self.door.save()
+        self.assertEqual(self.verify(1).status_code, 200)
+
+    def test_grant_revoke_verify(self):
+        self.assertEqual(self.verify(0).status_code, 401)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(self.url, {'user_ids': [self.users[0].pk]}, format='json')
+        self.assertEqual(self.verify(0).status_code, 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(self.url, {'user_ids': [self.users[0].pk]}, format='json')
+        self.assertEqual(self.verify(0).status_code, 401)
+
+
+class MatchCacheTests(TestCase):
+    """Doğrulama kararı önbelleğinin benzerlik sınırı, süre aşımı ve kapsamı"""
+
+    scope = ('door', '10.0.0.1', 'user_embeddings', 1)
+
+    def setUp(self):
+        self.cache = MatchCache()
+        self.probe = random_vectors(1, seed=13)[0]
+
+    def near(self, cosine):
+        """probe ile kosinüs benzerliği tam olarak cosine olan vektör"""
+        unit = self.probe / np.linalg.norm(self.probe)
+        other = random_vectors(1, seed=14)[0]
+        other -= (other @ unit) * unit
+        other /= np.linalg.norm(other)
+        return cosine * unit + np.sqrt(1 - cosine ** 2) * other
+
+    def test_hit_and_miss(self):
+        self.assertIsNone(self.cache.get(self.scope, self.probe))
+        self.cache.put(self.scope, self.probe, 'decision')
+        self.assertEqual(self.cache.get(self.scope, self.probe * 3), 'decision')
+        self.assertIsNone(self.cache.get(self.scope, random_vectors(1, seed=15)[0]))
+        self.assertEqual(self.cache.stats()['hits'], 1)
+        self.assertEqual(self.cache.stats()['misses'], 2)
+
+    @override_settings(FACE_MATCH_CACHE_LSH_BITS=0, FACE_MATCH_CACHE_SIMILARITY=0.95)
+    def test_similarity_bound(self):
+        # Tek kova: yalnızca benzerlik sınırı karar verir
+        self.cache.put(self.scope, self.probe, 'decision')
+        self.assertEqual(self.cache.get(self.scope, self.near(0.99)), 'decision')
+        self.assertIsNone(self.cache.get(self.scope, self.near(0.9)))
+
+    @override_settings(FACE_MATCH_CACHE_TTL=5)
+    def test_entries_expire(self):
+        with mock.patch('api.match_cache.time.monotonic', return_value=100.0):
+            self.cache.put(self.scope, self.probe, 'decision')
+        with mock.patch('api.match_cache.time.monotonic', return_value=104.0):
+            self.assertEqual(self.cache.get(self.scope, self.probe), 'decision')
+        with mock.patch('api.match_cache.time.monotonic', return_value=105.5):
+            self.assertIsNone(self.cache.get(self.scope, self.probe))
+
+    def test_gallery_version_bump_invalidates(self):
+        self.cache.put(self.scope, self.probe, 'decision')
+        bumped = self.scope[:-1] + (self.scope[-1] + 1,)
+        self.assertIsNone(self.cache.get(bumped, self.probe))
+        self.assertIsNone(self.cache.get(('other door',) + self.scope[1:], self.probe))
+
+    @override_settings(FACE_MATCH_CACHE_TTL=0)
+    def test_disabled_with_zero_ttl(self):
+        self.cache.put(self.scope, self.probe, 'decision')
+        self.assertIsNone(self.cache.get(self.scope, self.probe))
+
+
+@override_settings(**TEST_SETTINGS)
+class VerificationCacheTests(TestCase):
+    """Doğrulama uç noktasında önbellek kapsamı: istemcinin device_id'si değil bağlantı adresi"""
+
+    def setUp(self):
+        self.vector = random_vectors(1, seed=16)[0]
+        self.user = User.objects.create_user(
+            'cached', password='secret', is_face_registered=True, face_embedding=self.vector.tobytes(),
+        )
+        reset_gallery(user_embedding_index)
+        verification_cache._buckets.clear()
+
+    def verify(self, device_id='door-1', address='10.0.0.1'):
+        return APIClient().post('/api/face/verify/', {
+            'embedding': embedding_base64(self.vector),
+            'device_id': device_id,
+        }, format='json', REMOTE_ADDR=address)
+
+    def test_scope_uses_the_connection_address(self):
+        self.assertNotIn('cached', self.verify().data)
+        # Gövdedeki device_id değiştirilerek kapsam seçilemez
+        response = self.verify(device_id='door-2')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.data['cached'])
+        self.assertNotIn('cached', self.verify(address='10.0.0.2').data)
+        # Her istek yine loglanır
+        self.assertEqual(AccessLog.objects.filter(user=self.user, was_successful=True).count(), 3)
+
+    def test_gallery_change_invalidates(self):
+        self.verify()
+        self.assertTrue(self.verify().data['cached'])
+        User.objects.create_user(
+            'other', password='secret', is_face_registered=True,
+            face_embedding=random_vectors(1, seed=17)[0].tobytes(),
+        )
+        self.assertNotIn('cached', self.verify().data)
+
+
+@override_settings(
+    **TEST_SETTINGS,
+    FACE_INFERENCE_QUEUE_SIZE=4,
+    FACE_INFERENCE_TIMEOUT=0.05,
+    FACE_EMBEDDING_CACHE_MAX_BYTES=0,  # her istek çıkarıma gitsin
+)
+class InferenceQueueTests(TestCase):
+    """Çıkarım kuyruğu sınırı, zaman aşımı ve kuyruk yerinin bırakılması (havuz çalıştırılmaz)"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('queue', password='secret')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def register(self):
+        return self.client.post(f'/api/users/{self.user.pk}/register-face/', {
+            'face_image_base64': base64.b64encode(jpeg_image()).decode(),
+        }, format='json')
+
+    @override_settings(FACE_INFERENCE_WORKERS=1, FACE_INFERENCE_QUEUE_SIZE=0, FACE_INFERENCE_RETRY_AFTER=7)
+    def test_full_queue_returns_503_with_retry_after(self):
+        executor = PendingExecutor()
+        with mock.patch.object(inference_engine, '_executor', executor):
+            response = self.register()
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '7')
+        self.assertEqual(executor.futures, [])
+        self.assertEqual(inference_engine.pending, 0)
+
+    @override_settings(FACE_INFERENCE_WORKERS=1)
+    def test_timeout_returns_504(self):
+        executor = PendingExecutor()
+        with mock.patch.object(inference_engine, '_executor', executor):
+            response = self.register()
+            self.assertEqual(response.status_code, 504)
+            wait_until(lambda: executor.futures)
+            job = executor.futures[0]
+            if not job.done():
+                job.set_result(([[]], {'detection': [0.0], 'embedding': 0.0, 'detection_attempts': [[]]}))
+        # Kuyruk yeri iş bittiğinde (ya da iptal edildiğinde) bırakılmış olmalı
+        wait_until(lambda: inference_engine.pending == 0)
+        self.assertFalse(FaceVector.objects.exists())
+
+    @override_settings(FACE_INFERENCE_WORKERS=1, FACE_INFERENCE_QUEUE_SIZE=1)
+    def test_run_releases_the_slot_after_timeout_or_cancellation(self):
+        engine = InferenceEngine()
+        engine._executor = PendingExecutor()
+        # Havuzda başlamamış iş zaman aşımında iptal edilir; yer hemen bırakılır
+        with self.assertRaises(InferenceTimeout):
+            engine.run(len, 'job')
+        self.assertTrue(engine._executor.futures[0].cancelled())
+        self.assertEqual(engine.pending, 0)
+
+        # Çalışmaya başlamış iş iptal edilemez; yer iş bitince bırakılır
+        engine._executor = PendingExecutor(started=True)
+        with self.assertRaises(InferenceTimeout):
+            engine.run(len, 'job')
+        self.assertEqual(engine.pending, 1)
+        with self.assertRaises(InferenceQueueFull):
+            engine.run(len, 'job')
+        engine._executor.futures[0].set_result(3)
+        self.assertEqual(engine.pending, 0)
+
+
+@override_settings(
+    FACE_INFERENCE_WORKERS=1,
+    FACE_INFERENCE_QUEUE_SIZE=16,
+    FACE_INFERENCE_BATCH_SIZE=8,
+    FACE_INFERENCE_BATCH_WAIT_MS=50,
+    FACE_INFERENCE_TIMEOUT=5,
+)
+class MicroBatcherTests(TestCase):
+    """Mikro yığında her çağıranın kendi satırını alması ve iptal edilen isteklerin atlanması"""
+
+    def setUp(self):
+        self.models = FakeFaceModels()
+        for patcher in (
+            mock.patch('api.inference.face_models', self.models),
+            # Kırpıntı görüntünün sol üst köşesidir; sahte tanıyıcı değerini embedding satırına yazar
+            mock.patch('api.inference.face_align.norm_crop', lambda image, **kwargs: image[:112, :112]),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        # Süreç havuzu yerine aynı süreçte çalışan tek worker'lı havuz
+        self.engine = InferenceEngine()
+        self.engine._executor = ThreadPoolExecutor(max_workers=1)
+        self.addCleanup(self.engine._executor.shutdown)
+
+    def crop(self, value):
+        # Tamamı parlak görüntü: sahte dedektör tüm kareyi yüz sayar
+        return np.full((160, 160, 3), value, dtype=np.uint8)
+
+    def row(self, faces):
+        return int(np.argmax(faces[0]['embedding']))
+
+    def test_concurrent_callers_get_their_own_rows(self):
+        values = list(range(200, 208))
+        barrier = threading.Barrier(len(values))
+
+        def analyze(value):
+            barrier.wait()
+            return self.engine.analyze(self.crop(value))
+
+        with ThreadPoolExecutor(len(values)) as callers:
+            results = list(callers.map(analyze, values))
+        self.assertEqual([self.row(faces) for faces in results], values)
+        batches = self.models.recognizer.batches
+        self.assertCountEqual(sum(batches, []), values)
+        self.assertLess(len(batches), len(values))
+        self.assertEqual(self.engine.pending, 0)
+
+    def test_cancelled_request_is_skipped_without_leaking_a_slot(self):
+        recognizer = self.models.recognizer
+        recognizer.proceed = threading.Event()
+        # Tek worker ilk yığınla meşgulken ikinci istek kuyrukta zaman aşımına uğrar
+        self.engine._acquire()
+        first = self.engine._batcher.submit(self.crop(201))
+        self.assertTrue(recognizer.called.wait(5))
+        with override_settings(FACE_INFERENCE_TIMEOUT=0.05), self.assertRaises(InferenceTimeout):
+            self.engine.analyze(self.crop(202))
+
+        recognizer.proceed.set()
+        self.assertEqual(self.row(first.result(timeout=5)[0]), 201)
+        # Sızan yığın yeri olsaydı bu istek zaman aşımına uğrardı
+        self.assertEqual(self.row(self.engine.analyze(self.crop(203))), 203)
+        self.assertEqual(recognizer.batches, [[201], [203]])
+        self.assertEqual(self.engine.pending, 0)
+
+
+@override_settings(**TEST_SETTINGS)
+class ServerSideRecognitionTests(TestCase):
+    """WebSocket üzerinden sunucu tarafı tanıma: sonuç yalnızca isteği gönderene döner"""
+
+    async def connect(self, door_id):
+        communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), f'/ws/doors/{door_id}/')
+        communicator.scope['client'] = ('127.0.0.1', 50000)
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        self.assertEqual((await communicator.receive_json_from())['type'], 'connection_established')
+        return communicator
+
+    async def test_result_is_sent_only_to_the_requester(self):
+        door_id = str(uuid.uuid4())
+        requester = await self.connect(door_id)
+        other = await self.connect(door_id)
+        image = base64.b64encode(jpeg_image()).decode()
+        results = [
+            {'result': 'no_face', 'confidence': 0.0},
+            {'result': 'unknown', 'confidence': 0.31},
+            {
+                'result': 'recognized',
+                'confidence': 0.87,
+                'face_vector_id': str(uuid.uuid4()),
+                'matched_name': 'Ayşe',
+                'user_id': 3,
+                'username': 'ayse',
+            },
+        ]
+        try:
+            for i, result in enumerate(results):
+                with mock.patch('api.recognition.recognize_image', return_value=result) as recognize:
+                    await requester.send_json_to({
+                        'type': 'face_recognition_request',
+                        'server_side': True,
+                        'request_id': f'request-{i}',
+                        'name': 'front',
+                        'face_image_base64': f'data:image/jpeg;base64,{image}',
+                    })
+                    response = await requester.receive_json_from(timeout=5)
+                recognize.assert_called_once()
+                self.assertEqual(response['type'], 'face_recognition_result')
+                self.assertTrue(response['server_side'])
+                self.assertEqual(response['request_id'], f'request-{i}')
+                self.assertEqual(response['name'], 'front')
+                for key, value in result.items():
+                    self.assertEqual(response[key], value)
+            # Görüntü kapı grubuna yayınlanmaz
+            self.assertTrue(await other.receive_nothing())
+            self.assertTrue(await requester.receive_nothing())
+        finally:
+            await requester.disconnect()
+            await other.disconnect()
+
+
+@override_settings(FACE_DETECTION_SIZE=(640, 640))
+class DetectorInputTests(TestCase):
+    """Letterbox girişindeki koordinatların çözülen ve kaynak görüntüye geri taşınması"""
+
+    def assertRoundTrip(self, data, image_size, box):
+        detector_input = DetectorInput.from_bytes(data)
+        self.assertEqual(detector_input.array.shape, (640, 640, 3))
+        self.assertEqual(detector_input.original_size, image_size)
+        detected = bright_box(detector_input.array).reshape(2, 2)
+        # Dedektör pikseli çözülen ve kaynak görüntüde birkaç piksele karşılık gelir
+        decoded_scale = detector_input.scale
+        original_scale = decoded_scale * detector_input.image.width / image_size[0]
+        np.testing.assert_allclose(
+            detector_input.to_decoded(detected).ravel(), bright_box(detector_input.decoded), atol=2 / decoded_scale,
+        )
+        np.testing.assert_allclose(detector_input.to_original(detected).ravel(), box, atol=2 / original_scale)
+        return detector_input
+
+    def test_landscape(self):
+        box = (400, 200, 560, 440)
+        detector_input = self.assertRoundTrip(square_image((1280, 720), box, format='PNG'), (1280, 720), box)
+        self.assertEqual((detector_input.pad_x, detector_input.pad_y), (0, 140))
+
+    def test_portrait(self):
+        box = (100, 500, 260, 700)
+        detector_input = self.assertRoundTrip(square_image((480, 960), box, format='PNG'), (480, 960), box)
+        self.assertEqual((detector_input.pad_x, detector_input.pad_y), (160, 0))
+
+    def test_jpeg_draft(self):
+        box = (1000, 400, 1480, 1000)
+        detector_input = self.assertRoundTrip(square_image((2560, 1440), box), (2560, 1440), box)
+        # Kaynak tam çözünürlükte çözülmeden küçültüldü
+        self.assertLess(detector_input.image.width, 2560)
+        self.assertEqual(detector_input.image.width * 1440, detector_input.image.height * 2560)
+
+
+@override_settings(**TEST_SETTINGS)
+class ImageStoreTests(TestCase):
+    """İçerik adresli görüntü deposunun referans sayımı ve dosya silme"""
+
+    def setUp(self):
+        temp_media_root(self)
+        self.data = jpeg_image()
+        self.vector = random_vectors(1)[0].tobytes()
+
+    def store_vector(self, **kwargs):
+        with self.captureOnCommitCallbacks(execute=True):
+            image = image_store.store(self.data)
+            return FaceVector.objects.create(vector_data=self.vector, vector_size=512, image=image, **kwargs)
+
+    def file_exists(self, sha256):
+        return os.path.exists(media_writer.path(image_path(sha256)))
+
+    def test_same_bytes_are_stored_once(self):
+        first = self.store_vector()
+        second = self.store_vector()
+        self.assertEqual(first.image_id, second.image_id)
+        self.assertEqual(FaceImage.objects.count(), 1)
+        self.assertEqual(FaceImage.objects.get().ref_count, 2)
+        self.assertTrue(self.file_exists(first.image_id))
+        with open(media_writer.path(image_path(first.image_id)), 'rb') as image_file:
+            self.assertEqual(image_file.read(), self.data)
+
+    def test_file_is_deleted_with_last_reference(self):
+        first = self.store_vector()
+        second = self.store_vector()
+        sha256 = first.image_id
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertEqual(FaceImage.objects.get(pk=sha256).ref_count, 1)
+        self.assertTrue(self.file_exists(sha256))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(FaceImage.objects.filter(pk=sha256).exists())
+        self.assertFalse(self.file_exists(sha256))
+
+    def test_bulk_and_cascade_delete_release_references(self):
+        user = User.objects.create_user('images', password='secret')
+        self.store_vector(user=user)
+        self.store_vector(user=user)
+        kept = self.store_vector(name='kept')
+        sha256 = kept.image_id
+
+        with self.captureOnCommitCallbacks(execute=True):
+            user.delete()
+        self.assertEqual(FaceImage.objects.get(pk=sha256).ref_count, 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            FaceVector.objects.filter(name='kept').delete()
+        self.assertFalse(FaceImage.objects.filter(pk=sha256).exists())
+        self.assertFalse(self.file_exists(sha256))
+
+    def test_release_never_goes_negative(self):
+        vector = self.store_vector()
+        image_store.release([vector.image_id, vector.image_id])
+        self.assertFalse(FaceImage.objects.filter(pk=vector.image_id).exists())
+
+
+@override_settings(**TEST_SETTINGS)
+class MoveFaceImagesMigrationTests(TransactionTestCase):
+    """0008: satırlardaki base64 görüntülerin içerik adresli depoya taşınması"""
+
+    migrate_from = [('api', '0007_faceimage')]
+    migrate_to = [('api', '0008_move_face_images_to_store')]
+
+    def setUp(self):
+        temp_media_root(self)
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.migrate_from)
+        self.addCleanup(self.migrate_to_latest)
+        old_apps = executor.loader.project_state(self.migrate_from).apps
+        OldFaceVector = old_apps.get_model('api', 'FaceVector')
+        OldAnonymousFaceVector = old_apps.get_model('api', 'AnonymousFaceVector')
+
+        self.jpeg = jpeg_image((200, 10, 10))
+        encoded = base64.b64encode(self.jpeg).decode()
+        vector = random_vectors(1)[0].tobytes()
+        OldFaceVector.objects.create(vector_data=vector, vector_size=512, face_image_base64=encoded)
+        # Aynı görüntü data URI önekiyle ve anonim tabloda; tek dosyada birleşmeli
+        OldFaceVector.objects.create(vector_data=vector, vector_size=512, face_image_base64=f"data:image/jpeg;base64,{encoded}")
+        OldAnonymousFaceVector.objects.create(vector_data=vector, vector_size=512, face_image_base64=encoded)
+        self.unreadable = OldFaceVector.objects.create(
+            vector_data=vector, vector_size=512, face_image_base64=base64.b64encode(b'not an image').decode(),
+        ).pk
+        OldFaceVector.objects.create(vector_data=vector, vector_size=512, face_image_base64='')
+
+        # Atlanan satırların uyarıları toplanır
+        handler = logging.handlers.BufferingHandler(capacity=100)
+        logger = logging.getLogger('api.migrations.0008_move_face_images_to_store')
+        logger.addHandler(handler)
+        self.addCleanup(logger.removeHandler, handler)
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.migrate_to)
+        self.logs = [record for record in handler.buffer if record.levelno >= logging.WARNING]
+        self.apps = executor.loader.project_state(self.migrate_to).apps
+
+    def migrate_to_latest(self):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def test_images_are_moved_to_the_store(self):
+        sha256 = hashlib.sha256(self.jpeg).hexdigest()
+        FaceImage = self.apps.get_model('api', 'FaceImage')
+        FaceVector = self.apps.get_model('api', 'FaceVector')
+        AnonymousFaceVector = self.apps.get_model('api', 'AnonymousFaceVector')
+
+        self.assertEqual(list(FaceImage.objects.values_list('sha256', 'size', 'ref_count')), [(sha256, len(self.jpeg), 3)])
+        self.assertEqual(FaceVector.objects.filter(image_id=sha256).count(), 2)
+        self.assertEqual(AnonymousFaceVector.objects.get().image_id, sha256)
+        with open(media_writer.path(image_path(sha256)), 'rb') as image_file:
+            self.assertEqual(image_file.read(), self.jpeg)
+
+    def test_unreadable_images_are_skipped_and_logged(self):
+        FaceVector = self.apps.get_model('api', 'FaceVector')
+        self.assertIsNone(FaceVector.objects.get(pk=self.unreadable).image_id)
+        self.assertEqual(FaceVector.objects.filter(image__isnull=True).count(), 2)
+        self.assertEqual(len(self.logs), 1)
+        self.assertIn(str(self.unreadable), self.logs[0].getMessage())
+
+
+@override_settings(**TEST_SETTINGS, FACE_QUALITY_GATE=False, FACE_EMBEDDING_CACHE_MAX_BYTES=0)
+class CropPathTests(TestCase):
+    """İstemcide tespit edilmiş kırpıntılarda SCRFD'nin atlanması ve landmarks doğrulaması"""
+
+    def setUp(self):
+        self.models = FakeFaceModels()
+        patcher = mock.patch('api.inference.face_models', self.models)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.user = User.objects.create_user('crop', password='secret')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.landmarks = [[60, 80], [140, 80], [100, 120], [70, 160], [130, 160]]
+
+    def register(self, **data):
+        return self.client.post(f'/api/users/{self.user.pk}/register-face/', {
+            'face_image_base64': base64.b64encode(jpeg_image(size=(200, 240))).decode(), **data,
+        }, format='json')
+
+    def test_face_crops_skip_detection(self):
+        aligned = np.full((112, 112, 3), 7, dtype=np.uint8)
+        landmarked = np.full((240, 200, 3), 9, dtype=np.uint8)
+        with mock.patch('api.inference.face_align.norm_crop', return_value=np.full((112, 112, 3), 9, np.uint8)) as norm_crop:
+            (aligned_faces, landmarked_faces), _ = analyze_faces_batch([
+                FaceCrop(aligned, None), FaceCrop(landmarked, self.landmarks),
+            ])
+        self.assertEqual(self.models.detector.calls, [])
+        self.assertFalse(aligned_faces[0]['detected'])
+        self.assertEqual(aligned_faces[0]['det_score'], 1.0)
+        self.assertEqual(aligned_faces[0]['bbox'].tolist(), [0, 0, 112, 112])
+        self.assertEqual(int(np.argmax(aligned_faces[0]['embedding'])), 7)
+        # Landmarks verilen kırpıntı bu noktalarla hizalanır
+        np.testing.assert_array_equal(norm_crop.call_args.kwargs['landmark'], self.landmarks)
+        self.assertEqual(landmarked_faces[0]['bbox'].tolist(), [0, 0, 200, 240])
+        self.assertEqual(int(np.argmax(landmarked_faces[0]['embedding'])), 9)
+
+    def test_crop_input(self):
+        image = Image.new('RGB', (200, 240))
+        crop = CropInput(image, (200, 240), self.landmarks)
+        self.assertEqual(crop.array.shape, (240, 200, 3))
+        self.assertEqual(crop.to_original(self.landmarks).tolist(), self.landmarks)
+
+        # Hizalanmış kare kırpıntı 112'ye ölçeklenir; koordinatlar kaynağa geri taşınır
+        aligned = CropInput(Image.new('RGB', (224, 224)), (224, 224))
+        self.assertEqual(aligned.array.shape, (112, 112, 3))
+        self.assertEqual(aligned.to_original([[56, 56]]).tolist(), [[112, 112]])
+        with self.assertRaises(ValueError):
+            CropInput(image, (200, 240))
+
+    def test_registration_with_landmarks_skips_detection(self):
+        temp_media_root(self)
+        response = self.register(landmarks=self.landmarks)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.models.detector.calls, [])
+        metadata = FaceVector.objects.get(pk=response.data['id']).metadata
+        self.assertEqual(metadata['face_detection'], 'client')
+        self.assertEqual(metadata['bbox'], [0, 0, 200, 240])
+        np.testing.assert_allclose(metadata['landmarks'], self.landmarks)
+
+    def test_invalid_landmarks_return_400(self):
+        for landmarks in ([[1, 2]] * 4, [['a', 'b']] * 5, [1, 2, 3, 4, 5]):
+            with self.subTest(landmarks=landmarks):
+                response = self.register(landmarks=landmarks)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('landmarks', response.data['error'])
+        self.assertEqual(self.models.recognizer.batches, [])
+
+
+def textured_crop(mean=128, seed=0):
+    """Keskin ve orta parlaklıkta 112x112 yüz kırpıntısı yerine geçen gürültü"""
+    noise = np.random.default_rng(seed).integers(-60, 60, (112, 112, 3))
+    return np.clip(mean + noise, 0, 255).astype(np.uint8)
+
+
+def detected_face(size=100, det_score=0.9):
+    return {'bbox': np.array([10, 10, 10 + size, 10 + size], dtype=np.float32), 'det_score': det_score}
+
+
+@override_settings(
+    FACE_QUALITY_MIN_FACE_SIZE=40,
+    FACE_QUALITY_MIN_DET_SCORE=0.6,
+    FACE_QUALITY_MIN_BLUR=35.0,
+    FACE_QUALITY_BRIGHTNESS_RANGE=(40, 220),
+)
+class QualityGateTests(TestCase):
+    """Kalite kapısı red nedenleri ve kayıt uç noktasının 422 yanıtı"""
+
+    def test_good_face_passes(self):
+        self.assertEqual(assess_face(detected_face(), textured_crop())['reasons'], [])
+
+    def test_rejection_reasons(self):
+        cases = {
+            'face_too_small': (detected_face(size=20), textured_crop()),
+            'low_detection_score': (detected_face(det_score=0.3), textured_crop()),
+            'blurry': (detected_face(), np.full((112, 112, 3), 128, dtype=np.uint8)),
+            'too_dark': (detected_face(), textured_crop(mean=10)),
+            'too_bright': (detected_face(), textured_crop(mean=245)),
+        }
+        for reason, (face, crop) in cases.items():
+            with self.subTest(reason=reason):
+                self.assertEqual(assess_face(face, crop)['reasons'], [reason])
+
+    def test_client_crops_skip_size_and_score_checks(self):
+        face = dict(detected_face(size=20, det_score=0.1), detected=False)
+        quality = assess_face(face, textured_crop())
+        self.assertEqual(quality['reasons'], [])
+        self.assertNotIn('face_size', quality)
+
+    @override_settings(**TEST_SETTINGS, FACE_QUALITY_GATE=True)
+    def test_registration_returns_422_with_reasons(self):
+        user = User.objects.create_user('quality', password='secret')
+        client = APIClient()
+        client.force_authenticate(user)
+        face = dict(detected_face(size=20), kps=None, embedding=None)
+        face['quality'] = assess_face(face, textured_crop(mean=10))
+
+        with mock.patch('api.views.inference_engine.analyze', return_value=[face]) as analyze:
+            response = client.post(
+                f'/api/users/{user.pk}/register-face/', data=jpeg_image(), content_type='image/jpeg',
+            )
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(response.data['reasons'], ['face_too_small', 'too_dark'])
+        self.assertIn('face is too small', response.data['error'])
+        self.assertTrue(analyze.call_args.kwargs['quality_gate'])
+        self.assertFalse(FaceVector.objects.exists())
+        self.assertFalse(FaceImage.objects.exists())
+
+
+@override_settings(**TEST_SETTINGS)
+class DetectionFallbackTests(TestCase):
+    """Uyarlanabilir tespitte küçük boyutta yüz bulunamazsa sonraki boyuta geçilmesi"""
+
+    def setUp(self):
+        detection_size_stats.reset()
+        self.addCleanup(detection_size_stats.reset)
+        self.image = DetectorInput(Image.open(io.BytesIO(square_image((640, 640), (200, 200, 360, 380)))), (640, 640)).array
+
+    def test_falls_back_to_larger_sizes(self):
+        models = FakeFaceModels(FakeDetector(found_at={(640, 640)}), sizes=((320, 320), (640, 640)))
+        bboxes, _, attempts = _detect(models.analyzer, self.image, models.sizes)
+        self.assertEqual(attempts, [((320, 320), False), ((640, 640), True)])
+        self.assertEqual(bboxes.shape[0], 1)
+
+        with mock.patch('api.inference.face_models', models):
+            faces = inference_engine.analyze(self.image)
+        self.assertEqual(len(faces), 1)
+        self.assertEqual(detection_size_stats.snapshot(), {
+            '320x320': {'attempts': 1, 'hits': 0, 'hit_rate': 0.0},
+            '640x640': {'attempts': 1, 'hits': 1, 'hit_rate': 1.0},
+        })
+
+    def test_stops_at_the_first_size_with_a_face(self):
+        models = FakeFaceModels(sizes=((320, 320), (640, 640)))
+        with mock.patch('api.inference.face_models', models):
+            self.assertEqual(len(inference_engine.analyze(self.image)), 1)
+        self.assertEqual(models.detector.calls, [(320, 320)])
+        self.assertEqual(detection_size_stats.snapshot(), {
+            '320x320': {'attempts': 1, 'hits': 1, 'hit_rate': 1.0},
+        })
+
+    def test_no_face_at_any_size(self):
+        models = FakeFaceModels(FakeDetector(found_at=set()), sizes=((320, 320), (640, 640)))
+        with mock.patch('api.inference.face_models', models):
+            self.assertEqual(inference_engine.analyze(self.image), [])
+        self.assertEqual(models.detector.calls, [(320, 320), (640, 640)])
+        self.assertEqual(detection_size_stats.snapshot()['640x640']['hits'], 0)
+
+
+@override_settings(**TEST_SETTINGS)
+class EmbeddingCacheTests(TestCase):
+    """Analiz sonucu önbelleğinin sürüm anahtarı ve disk katmanı"""
+
+    def setUp(self):
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir, ignore_errors=True)
+        cache_override = override_settings(FACE_EMBEDDING_CACHE_DIR=cache_dir)
+        cache_override.enable()
+        self.addCleanup(cache_override.disable)
+        self.cache_dir = cache_dir
+        self.faces = [{
+            'bbox': np.array([1, 2, 30, 40], dtype=np.float32),
+            'kps': np.zeros((5, 2), dtype=np.float32),
+            'det_score': 0.9,
+            'detected': True,
+            'embedding': random_vectors(1)[0],
+        }]
+
+    def disk_files(self):
+        return [
+            os.path.join(root, file_name)
+            for root, _, file_names in os.walk(self.cache_dir) for file_name in file_names
+        ]
+
+    def test_memory_and_disk_round_trip(self):
+        cache = EmbeddingCache()
+        cache.put('key', self.faces)
+        np.testing.assert_array_equal(cache.get('key')[0]['embedding'], self.faces[0]['embedding'])
+
+        # Yeni süreç yalnızca disk katmanını görür
+        restarted = EmbeddingCache()
+        faces = restarted.get('key')
+        np.testing.assert_array_equal(faces[0]['embedding'], self.faces[0]['embedding'])
+        np.testing.assert_array_equal(faces[0]['bbox'], self.faces[0]['bbox'])
+        self.assertEqual(restarted.stats()['disk_hits'], 1)
+
+    def test_model_change_invalidates_keys(self):
+        cache = EmbeddingCache()
+        cache.put('key', self.faces)
+        version = cache_version()
+
+        with override_settings(FACE_ANALYSIS_MODEL='antelopev2'):
+            self.assertNotEqual(cache_version(), version)
+            self.assertIsNone(cache.get('key'))
+            self.assertIsNone(EmbeddingCache().get('key'))
+
+        recognition_model = os.path.join(self.cache_dir, 'recognition.onnx')
+        with open(recognition_model, 'wb') as model_file:
+            model_file.write(b'onnx')
+        with override_settings(FACE_RECOGNITION_MODEL_PATH=recognition_model):
+            self.assertIsNone(cache.get('key'))
+
+        with override_settings(FACE_DETECTION_SIZE=(320, 320)):
+            self.assertIsNone(cache.get('key'))
+
+        self.assertEqual(cache_version(), version)
+        self.assertIsNotNone(cache.get('key'))
+
+    def test_quality_thresholds_change_the_key(self):
+        key = embedding_cache_key('hash', quality_gate=True)
+        self.assertNotEqual(key, embedding_cache_key('hash'))
+        with override_settings(FACE_QUALITY_MIN_BLUR=80.0):
+            self.assertNotEqual(embedding_cache_key('hash', quality_gate=True), key)
+
+    def test_disk_counters_and_pruning(self):
+        cache = EmbeddingCache()
+        cache.put('first', self.faces)
+        entry_size = os.path.getsize(self.disk_files()[0])
+        with override_settings(FACE_EMBEDDING_CACHE_DISK_MAX_BYTES=int(entry_size * 3.5)):
+            for i in range(5):
+                cache.put(f"key{i}", self.faces)
+            cache.put('key4', self.faces)  # üzerine yazım sayacı büyütmez
+
+            files = self.disk_files()
+            stats = cache.stats()
+            self.assertEqual(stats['disk_entries'], len(files))
+            self.assertEqual(stats['disk_bytes'], sum(os.path.getsize(path) for path in files))
+            self.assertLessEqual(stats['disk_bytes'], entry_size * 3.5)
+
+    @override_settings(FACE_QUALITY_GATE=False, FACE_DETECTION_SIZE=(640, 640))
+    def test_recognition_and_registration_share_entries(self):
+        temp_media_root(self)
+        embedding_cache.clear()
+        self.addCleanup(embedding_cache.clear)
+        user = User.objects.create_user('shared', password='secret')
+        client = APIClient()
+        client.force_authenticate(user)
+        box = (250, 50, 330, 130)
+        data = square_image((400, 200), box)
+        models = FakeFaceModels()
+        hits = embedding_cache.stats()['hits']
+
+        with mock.patch('api.inference.face_models', models):
+            # WebSocket tanıma yolu önbelleği doldurur, kayıt aynı kaydı kullanır
+            image, cache_key = decode_image(data)
+            recognize_image(image, cache_key=cache_key)
+            response = client.post(f'/api/users/{user.pk}/register-face/', data=data, content_type='image/jpeg')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(models.detector.calls), 1)
+        self.assertEqual(embedding_cache.stats()['hits'], hits + 1)
+        # Önbellekteki kutu kaydın letterbox çerçevesindedir
+        metadata = FaceVector.objects.get(pk=response.data['id']).metadata
+        np.testing.assert_allclose(metadata['bbox'], box, atol=2)
+
+        # Farklı dedektör çerçevesi aynı anahtarı paylaşmaz
+        with override_settings(FACE_DETECTION_SIZE=(320, 320)):
+            self.assertNotEqual(decode_image(data)[1], cache_key)
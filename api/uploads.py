@@ -0,0 +1,82 @@
+# api/uploads.py
+import base64
+import json
+
+import numpy as np
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.utils.datastructures import MultiValueDict
+from rest_framework.parsers import BaseParser, DataAndFiles
+
+
+class RawImageParser(BaseParser):
+    """
+    Gövdesi doğrudan görüntü olan istekler için parser (Content-Type: image/jpeg, image/png...).
+    Görüntü 'face_image' dosyası olur; diğer alanlar sorgu parametrelerinden okunur.
+    """
+    media_type = 'image/*'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        request = parser_context['request']
+        content_type = (media_type or 'image/jpeg').split(';')[0]
+        extension = content_type.split('/')[-1]
+        upload = SimpleUploadedFile(f"face.{extension}", stream.read() if stream else b'', content_type=content_type)
+        return DataAndFiles(request.query_params.copy(), MultiValueDict({'face_image': [upload]}))
+
+
+def image_bytes_from_request(data):
+    """
+    İstekteki görüntü baytlarını döndür: önce 'face_image' dosyası (multipart/ham gövde),
+    yoksa 'face_image_base64' alanı (JSON). İkisi de yoksa None.
+    :return: (baytlar, base64 metni ya da None)
+    """
+    upload = data.get('face_image')
+    if upload is not None and hasattr(upload, 'read'):
+        return upload.read(), None
+
+    face_image_base64 = data.get('face_image_base64')
+    if not face_image_base64:
+        return None, None
+    if ';base64,' in face_image_base64:
+        face_image_base64 = face_image_base64.split(';base64,')[1]
+    return base64.b64decode(face_image_base64), face_image_base64
+
+
+def vector_from_text(text):
+    """
+    Metin olarak gelen vektörü float listesine çevir (multipart form alanı ya da
+    ham görüntü gövdeli isteklerde sorgu parametresi): JSON liste ya da
+    FaceVerificationView'daki gibi base64 kodlu float32 baytları.
+    :raises ValueError: metin ikisine de uymuyorsa
+    """
+    text = text.strip()
+    if text.startswith('['):
+        return json.loads(text)
+    data = base64.b64decode(text, validate=True)
+    if not data or len(data) % 4:
+        raise ValueError('base64 vector length must be a multiple of 4 bytes')
+    return np.frombuffer(data, dtype=np.float32).tolist()
+
+
+def face_crop_options(data):
+    """
+    Tespiti atlayan kırpıntı modu seçenekleri: 'aligned' (hizalanmış 112x112 yüz)
+    ya da 'landmarks' (kırpıntıdaki 5 [x, y] noktası; multipart'ta JSON metni).
+    :return: (kırpıntı modu mu, landmarks ya da None)
+    :raises ValueError: landmarks 5 noktadan oluşmuyorsa
+    """
+    landmarks = data.get('landmarks')
+    if isinstance(landmarks, str):
+        landmarks = json.loads(landmarks) if landmarks.strip() else None
+    if landmarks is not None:
+        try:
+            landmarks = [[float(x), float(y)] for x, y in landmarks]
+        except (TypeError, ValueError):
+            raise ValueError('landmarks must be a list of 5 [x, y] points')
+        if len(landmarks) != 5:
+            raise ValueError('landmarks must be a list of 5 [x, y] points')
+        return True, landmarks
+
+    aligned = data.get('aligned', False)
+    if isinstance(aligned, str):
+        aligned = aligned.lower() in ('1', 'true', 'yes')
+    return bool(aligned), None
@@ -14,6 +14,10 @@ urlpatterns = [
      
      # Diğer URL'ler
      path('api/face/verify/', views.FaceVerificationView.as_view(), name='face-verify'),
+     path('api/face/verify/batch/', views.FaceVerificationBatchView.as_view(), name='face-verify-batch'),
+     path('api/face/verify/cache-stats/', views.FaceVerificationCacheStatsView.as_view(), name='face-verify-cache-stats'),
+    path('api/media/writer-stats/', views.MediaWriterStatsView.as_view(), name='media-writer-stats'),
+    path('api/metrics/', views.MetricsView.as_view(), name='metrics'),
      
      path('api/access-logs/', views.AccessLogListView.as_view(), name='access-log-list'),
      path('api/access-logs/<uuid:pk>/', views.AccessLogDetailView.as_view(), name='access-log-detail'),
@@ -31,6 +35,11 @@ urlpatterns = [
           views.FaceVectorViewSet.as_view({'post': 'find_similar'}),
           name='face-vector-find-similar'),
      
+     # Toplu benzer yüz vektörü arama endpoint'i
+     path('api/face-vectors/find-similar/batch/',
+          views.FaceVectorViewSet.as_view({'post': 'find_similar_batch'}),
+          name='face-vector-find-similar-batch'),
+     
      # Sonra genel CRUD URL'leri
      path('api/face-vectors/', views.FaceVectorViewSet.as_view({
           'get': 'list',
@@ -85,6 +94,10 @@ urlpatterns = [
      path('api/doors/<uuid:pk>/set-status/', 
           views.DoorViewSet.as_view({'post': 'set_status'}),
           name='door-set-status'),
+
+     path('api/doors/<uuid:pk>/access/', 
+          views.DoorViewSet.as_view({'get': 'access', 'post': 'access', 'delete': 'access'}),
+          name='door-access'),
      
      path('api/doors/open-doors/', views.OpenDoorsView.as_view(), name='open-doors'),
      path('api/doors/close-doors/', views.CloseDoorsView.as_view(), name='close-doors'),
@@ -16,8 +16,6 @@ import face_recognition
 import cv2
 import os
 from django.conf import settings
-import insightface
-from insightface.app import FaceAnalysis
 
 # Tüm serializer importları tek satırda
 from .serializers import (
@@ -34,13 +32,27 @@ from .serializers import (
     DoorSerializer
 )
 # Hata veren Door modelini ekliyoruz
-from .models import User, AccessLog, Device, FaceVector, AnonymousFaceVector, Door
+from .models import User, AccessLog, Device, FaceVector, AnonymousFaceVector, Door, DoorAccess
+from .face_index import face_vector_index, anonymous_face_vector_index, user_embedding_index, door_gallery
+from .match_cache import verification_cache
+from .inference import inference_engine, detection_size_stats, FaceCrop, InferenceQueueFull, InferenceTimeout
+from .image_decode import CropInput, DetectorInput, detection_size, open_image
+from .metrics import stage_metrics
+from .embedding_cache import embedding_cache, embedding_cache_key
+from .quality import quality_gate_enabled, quality_stats, rejection_message
+from .media_writer import media_writer, encode_array
+from .image_store import image_store, content_hash, image_path as stored_image_path, image_url as stored_image_url
+from .uploads import RawImageParser, face_crop_options, image_bytes_from_request
+from rest_framework.parsers import JSONParser, FormParser, MultiPartParser
+from django.core.files.base import ContentFile
 from channels.layers import get_channel_layer
 from asgiref.sync import async_to_sync
 import logging
+from functools import partial
 import json
 logger = logging.getLogger('django.request')
 websocket_logger = logging.getLogger('websocket')
+registration_logger = logging.getLogger('api.registration')
 
 class AnonymousFaceVectorViewSet(viewsets.ModelViewSet):
     """
@@ -48,6 +60,8 @@ class AnonymousFaceVectorViewSet(viewsets.ModelViewSet):
     """
     queryset = AnonymousFaceVector.objects.all()
     permission_classes = [permissions.AllowAny]
+    # Görüntü JSON'da base64, multipart dosya ya da ham image/* gövde olarak gelebilir
+    parser_classes = [JSONParser, MultiPartParser, FormParser, RawImageParser]
     
     def get_serializer_class(self):
         if self.action in ['create', 'update', 'partial_update']:
@@ -60,7 +74,7 @@ class AnonymousFaceVectorViewSet(viewsets.ModelViewSet):
         face_vector = serializer.save()
         
         # Yanıt için response serializerı kullan
-        response_serializer = AnonymousFaceVectorResponseSerializer(face_vector)
+        response_serializer = AnonymousFaceVectorResponseSerializer(face_vector, context={'request': request})
         return Response(response_serializer.data, status=status.HTTP_201_CREATED)
     
     @action(detail=False, methods=['post'])
@@ -88,36 +102,28 @@ class AnonymousFaceVectorViewSet(viewsets.ModelViewSet):
             # En fazla dönecek sonuç sayısı (opsiyonel parametre)
             max_results = int(request.data.get('max_results', 5))
             
-            # Benzer vektörleri bul
-            similar_vectors = []
+            # Arama arka ucu (opsiyonel parametre): 'exact' veya 'ivf'
+            backend = request.data.get('index')
+            nprobe = request.data.get('nprobe')
+            nprobe = int(nprobe) if nprobe is not None else None
             
-            for face_vector in AnonymousFaceVector.objects.filter(is_active=True):
-                db_vector = np.frombuffer(face_vector.vector_data, dtype=np.float32)
-                
-                # Vektör boyutları uyuşmazsa atla
-                if len(db_vector) != len(query_vector):
-                    continue
-                
-                # Kosinüs benzerliği hesapla
-                similarity = np.dot(query_vector, db_vector) / (
-                    np.linalg.norm(query_vector) * np.linalg.norm(db_vector)
-                )
-                
-                if similarity >= threshold:
-                    similar_vectors.append({
-                        'face_vector': face_vector,
-                        'similarity': float(similarity)
-                    })
+            # Bellekteki galeri indeksinde benzer vektörleri bul
+            matches = anonymous_face_vector_index.search(
+                query_vector, threshold, max_results, backend=backend, nprobe=nprobe
+            )
             
-            # Benzerliğe göre sırala ve max_results kadar döndür
-            similar_vectors.sort(key=lambda x: x['similarity'], reverse=True)
-            similar_vectors = similar_vectors[:max_results]
+            # Yalnızca eşleşen satırları veritabanından çek
+            face_vectors = AnonymousFaceVector.objects.in_bulk([pk for pk, _ in matches])
             
-            # Yanıt hazırla
+            # Yanıt hazırla (benzerlik sırası korunur)
             results = []
-            for item in similar_vectors:
-                vector_data = AnonymousFaceVectorResponseSerializer(item['face_vector']).data
-                vector_data['similarity'] = item['similarity']
+            for pk, similarity in matches:
+                face_vector = face_vectors.get(pk)
+                if face_vector is None:
+                    # İndeks yenilendikten sonra silinmiş olabilir
+                    continue
+                vector_data = AnonymousFaceVectorResponseSerializer(face_vector, context={'request': request}).data
+                vector_data['similarity'] = similarity
                 results.append(vector_data)
                 
             return Response(results)
@@ -129,9 +135,12 @@ class FaceVectorViewSet(viewsets.ModelViewSet):
     """
     Yüz vektörlerini yönetmek için API endpoint
     """
-    queryset = FaceVector.objects.all()
+    # Kullanıcı adı yanıtta olduğu için kullanıcı aynı sorguda çekilir
+    queryset = FaceVector.objects.select_related('user')
     
     permission_classes = [permissions.AllowAny]
+    # Görüntü JSON'da base64, multipart dosya ya da ham image/* gövde olarak gelebilir
+    parser_classes = [JSONParser, MultiPartParser, FormParser, RawImageParser]
     
     def get_serializer_class(self):
         if self.action in ['create', 'update', 'partial_update']:
@@ -144,7 +153,7 @@ class FaceVectorViewSet(viewsets.ModelViewSet):
         face_vector = serializer.save()
         
         # Yanıt için response serializerı kullan
-        response_serializer = FaceVectorResponseSerializer(face_vector)
+        response_serializer = FaceVectorResponseSerializer(face_vector, context={'request': request})
         return Response(response_serializer.data, status=status.HTTP_201_CREATED)
     
     @action(detail=False, methods=['post'], permission_classes=[permissions.AllowAny])
@@ -156,7 +165,7 @@ class FaceVectorViewSet(viewsets.ModelViewSet):
         serializer.is_valid(raise_exception=True)
         face_vector = serializer.save()
         
-        response_serializer = FaceVectorResponseSerializer(face_vector)
+        response_serializer = FaceVectorResponseSerializer(face_vector, context={'request': request})
         return Response(response_serializer.data, status=status.HTTP_201_CREATED)
     
     @action(detail=False, methods=['post'])
@@ -184,36 +193,28 @@ class FaceVectorViewSet(viewsets.ModelViewSet):
             # En fazla dönecek sonuç sayısı (opsiyonel parametre)
             max_results = int(request.data.get('max_results', 5))
             
-            # Benzer vektörleri bul
-            similar_vectors = []
+            # Arama arka ucu (opsiyonel parametre): 'exact' veya 'ivf'
+            backend = request.data.get('index')
+            nprobe = request.data.get('nprobe')
+            nprobe = int(nprobe) if nprobe is not None else None
             
-            for face_vector in FaceVector.objects.filter(is_active=True):
-                db_vector = np.frombuffer(face_vector.vector_data, dtype=np.float32)
-                
-                # Vektör boyutları uyuşmazsa atla
-                if len(db_vector) != len(query_vector):
-                    continue
-                
-                # Kosinüs benzerliği hesapla
-                similarity = np.dot(query_vector, db_vector) / (
-                    np.linalg.norm(query_vector) * np.linalg.norm(db_vector)
-                )
-                
-                if similarity >= threshold:
-                    similar_vectors.append({
-                        'face_vector': face_vector,
-                        'similarity': float(similarity)
-                    })
+            # Bellekteki galeri indeksinde benzer vektörleri bul
+            matches = face_vector_index.search(
+                query_vector, threshold, max_results, backend=backend, nprobe=nprobe
+            )
             
-            # Benzerliğe göre sırala ve max_results kadar döndür
-            similar_vectors.sort(key=lambda x: x['similarity'], reverse=True)
-            similar_vectors = similar_vectors[:max_results]
+            # Yalnızca eşleşen satırları veritabanından çek
+            face_vectors = FaceVector.objects.select_related('user').in_bulk([pk for pk, _ in matches])
             
-            # Yanıt hazırla
+            # Yanıt hazırla (benzerlik sırası korunur)
             results = []
-            for item in similar_vectors:
-                vector_data = FaceVectorResponseSerializer(item['face_vector']).data
-                vector_data['similarity'] = item['similarity']
+            for pk, similarity in matches:
+                face_vector = face_vectors.get(pk)
+                if face_vector is None:
+                    # İndeks yenilendikten sonra silinmiş olabilir
+                    continue
+                vector_data = FaceVectorResponseSerializer(face_vector, context={'request': request}).data
+                vector_data['similarity'] = similarity
                 results.append(vector_data)
                 
             return Response(results)
@@ -221,6 +222,61 @@ class FaceVectorViewSet(viewsets.ModelViewSet):
         except Exception as e:
             return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
+    @action(detail=False, methods=['post'])
+    def find_similar_batch(self, request):
+        """
+        Birden çok sorgu vektörü için benzer yüz vektörlerini tek istekte bul
+        """
+        vectors = request.data.get('vectors')
+        if not isinstance(vectors, list) or not vectors:
+            return Response({'error': 'vectors must be a non-empty list of float lists'}, 
+                        status=status.HTTP_400_BAD_REQUEST)
+        
+        max_batch_size = getattr(settings, 'FACE_BATCH_MAX_SIZE', 64)
+        if len(vectors) > max_batch_size:
+            return Response({'error': f'At most {max_batch_size} vectors can be sent in one batch'}, 
+                        status=status.HTTP_400_BAD_REQUEST)
+        
+        try:
+            if not all(isinstance(vector_list, list) for vector_list in vectors):
+                return Response({'error': 'vectors must be a non-empty list of float lists'}, 
+                            status=status.HTTP_400_BAD_REQUEST)
+            query_vectors = [np.array(vector_list, dtype=np.float32) for vector_list in vectors]
+            
+            # Opsiyonel parametreler find_similar ile aynı
+            threshold = float(request.data.get('threshold', 0.6))
+            max_results = int(request.data.get('max_results', 5))
+            backend = request.data.get('index')
+            nprobe = request.data.get('nprobe')
+            nprobe = int(nprobe) if nprobe is not None else None
+            
+            # Aynı boyuttaki tüm sorgular tek matris-matris çarpımıyla puanlanır
+            match_lists = face_vector_index.search_batch(
+                query_vectors, threshold, max_results, backend=backend, nprobe=nprobe
+            )
+            
+            # Tüm sorguların eşleşen satırlarını tek sorguda çek
+            face_vectors = FaceVector.objects.select_related('user').in_bulk(
+                {pk for matches in match_lists for pk, _ in matches}
+            )
+            
+            results = []
+            for matches in match_lists:
+                query_results = []
+                for pk, similarity in matches:
+                    face_vector = face_vectors.get(pk)
+                    if face_vector is None:
+                        continue
+                    vector_data = FaceVectorResponseSerializer(face_vector, context={'request': request}).data
+                    vector_data['similarity'] = similarity
+                    query_results.append(vector_data)
+                results.append(query_results)
+            
+            return Response({'results': results})
+            
+        except Exception as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
 class UserRegisterView(generics.GenericAPIView):
     serializer_class = UserRegisterSerializer
     permission_classes = [permissions.AllowAny]
@@ -323,8 +379,15 @@ class DeviceHeartbeatView(APIView):
         device.save()
         return Response({'status': 'heartbeat received'})
 
+def verification_gallery(door):
+    """Erişimi kısıtlı kapılarda yalnızca yetkili kullanıcıların galerisi taranır"""
+    if door is not None and door.access_restricted:
+        return door_gallery(door.id)
+    return user_embedding_index
+
 class FaceVerificationView(APIView):
     permission_classes = [permissions.AllowAny]
+    threshold = 0.5  # Benzerlik eşiği, ayarlanabilir
     
     def post(self, request):
         if 'embedding' not in request.data:
@@ -346,34 +409,39 @@ class FaceVerificationView(APIView):
         embedding_bytes = base64.b64decode(embedding_base64)
         test_embedding = np.frombuffer(embedding_bytes, dtype=np.float32)
         
-        # En yüksek benzerlik skoruna sahip kullanıcıyı bul
-        max_similarity = 0
-        matched_user = None
-        
-        for user in User.objects.filter(is_face_registered=True):
-            if user.face_embedding:
-                # Veritabanından embedding'i al ve numpy dizisine dönüştür
-                db_embedding = np.frombuffer(user.face_embedding, dtype=np.float32)
-                
-                # Kosinüs benzerliği hesapla
-                similarity = np.dot(test_embedding, db_embedding) / (
-                    np.linalg.norm(test_embedding) * np.linalg.norm(db_embedding)
-                )
-                
-                if similarity > max_similarity:
-                    max_similarity = similarity
-                    matched_user = user
+        # Aynı cihazın birkaç saniye içindeki neredeyse aynı sorgularında eşleşme sonucu önbellekten
+        # alınır (erişim logu ve kapı açma yine her istekte yapılır); galeri sürümü kapsamda
+        # olduğu için galeri değişince önbellek kendiliğinden geçersizleşir. Cihaz kimlik
+        # doğrulaması olmadığından kapsam istemcinin gönderdiği device_id'den değil bağlantı
+        # adresinden alınır; başka bir cihazın kapsamı seçilip önbelleği okunamaz.
+        gallery = verification_gallery(door)
+        # Sürüm kapsama girmeden önce galeri veritabanıyla eşitlenir (önbellek isabeti aramayı atlar)
+        gallery.refresh()
+        device_ip = request.META.get('REMOTE_ADDR')
+        cache_scope = (door.id if door else None, device_ip, gallery.name, gallery.version)
+        cached = verification_cache.get(cache_scope, test_embedding)
+        if cached is not None:
+            matched_user, max_similarity = cached
+        else:
+            # Bellekteki kullanıcı galerisinde en yüksek benzerlik skoruna sahip kullanıcıyı bul
+            matched_user_id, max_similarity = gallery.best_match(test_embedding)
+            
+            # Yalnızca eşik üstü eşleşmede kullanıcının gerekli alanlarını çek
+            # (galeri yenilendikten sonra kullanıcı silinmiş olabilir)
+            matched_user = None
+            if max_similarity > self.threshold:
+                matched_user = User.objects.only('id', 'username').filter(pk=matched_user_id).first()
+            verification_cache.put(cache_scope, test_embedding, (matched_user, max_similarity))
         
         # Erişim logu oluştur
-        threshold = 0.5  # Benzerlik eşiği, ayarlanabilir
-        success = max_similarity > threshold
+        success = matched_user is not None and max_similarity > self.threshold
         
         log = AccessLog.objects.create(
             user=matched_user if success else None,
             door=door,
             was_successful=success,
             similarity_score=float(max_similarity),
-            device_ip=request.META.get('REMOTE_ADDR')
+            device_ip=device_ip
         )
         
         # Eğer başarılıysa ve kapı belirtilmişse, kapıyı aç
@@ -395,7 +463,7 @@ class FaceVerificationView(APIView):
                     'door_name': door.name,
                     'door_status': door.current_status
                 })
-            return Response(response_data)
+            response_status = status.HTTP_200_OK
         else:
             response_data = {
                 'success': False,
@@ -407,7 +475,132 @@ class FaceVerificationView(APIView):
                     'door_id': door.id,
                     'door_name': door.name
                 })
-            return Response(response_data, status=status.HTTP_401_UNAUTHORIZED)
+            response_status = status.HTTP_401_UNAUTHORIZED
+        
+        if cached is not None:
+            response_data['cached'] = True
+        return Response(response_data, status=response_status)
+
+class FaceVerificationCacheStatsView(APIView):
+    """Doğrulama sonuç önbelleğinin isabet/ıskalama sayaçları"""
+    permission_classes = [permissions.IsAuthenticated]
+    
+    def get(self, request):
+        return Response(verification_cache.stats())
+
+class MetricsView(APIView):
+    """Aşama gecikme histogramları ve arka plan bileşenlerinin sayaçları"""
+    permission_classes = [permissions.IsAuthenticated]
+    
+    def get(self, request):
+        return Response({
+            'stages': stage_metrics.snapshot(),
+            'inference': {'pending': inference_engine.pending},
+            'detection_sizes': detection_size_stats.snapshot(),
+            'media_writer': media_writer.stats(),
+            'verification_cache': verification_cache.stats(),
+            'quality_gate': quality_stats.stats(),
+            'embedding_cache': embedding_cache.stats(),
+        })
+
+class MediaWriterStatsView(APIView):
+    """Arka plan görüntü yazıcısının kuyruk ve hata sayaçları"""
+    permission_classes = [permissions.IsAuthenticated]
+    
+    def get(self, request):
+        return Response(media_writer.stats())
+
+class FaceVerificationBatchView(APIView):
+    """
+    Birden çok embedding'i tek istekte doğrula (ör. kapı cihazının kuyruktaki kareleri)
+    """
+    permission_classes = [permissions.AllowAny]
+    
+    def post(self, request):
+        embeddings = request.data.get('embeddings')
+        if not isinstance(embeddings, list) or not embeddings:
+            return Response({'error': 'embeddings must be a non-empty list of base64 strings'},
+                          status=status.HTTP_400_BAD_REQUEST)
+        
+        max_batch_size = getattr(settings, 'FACE_BATCH_MAX_SIZE', 64)
+        if len(embeddings) > max_batch_size:
+            return Response({'error': f'At most {max_batch_size} embeddings can be sent in one batch'},
+                          status=status.HTTP_400_BAD_REQUEST)
+        
+        # Kapı ID'sini al (opsiyonel)
+        door_id = request.data.get('door_id')
+        door = None
+        
+        if door_id:
+            try:
+                door = Door.objects.get(id=door_id)
+            except Door.DoesNotExist:
+                return Response({'error': 'Kapı bulunamadı'}, status=status.HTTP_404_NOT_FOUND)
+        
+        # Base64 kodlu embedding'leri numpy dizilerine dönüştür
+        try:
+            test_embeddings = [
+                np.frombuffer(base64.b64decode(embedding_base64), dtype=np.float32)
+                for embedding_base64 in embeddings
+            ]
+        except Exception as e:
+            return Response({'error': f'Invalid embedding: {str(e)}'},
+                          status=status.HTTP_400_BAD_REQUEST)
+        
+        # Tüm embedding'ler için tek matris-matris çarpımıyla en iyi eşleşmeler
+        matches = verification_gallery(door).best_match_batch(test_embeddings)
+        
+        # Eşleşen kullanıcıları tek sorguda çek
+        threshold = FaceVerificationView.threshold
+        matched_ids = {user_id for user_id, similarity in matches if similarity > threshold}
+        users = User.objects.only('id', 'username').in_bulk(matched_ids)
+        
+        # Tüm erişim loglarını tek bulk_create ile yaz
+        device_ip = request.META.get('REMOTE_ADDR')
+        logs = []
+        for user_id, similarity in matches:
+            matched_user = users.get(user_id) if similarity > threshold else None
+            logs.append(AccessLog(
+                user=matched_user,
+                door=door,
+                was_successful=matched_user is not None,
+                similarity_score=float(similarity),
+                device_ip=device_ip
+            ))
+        AccessLog.objects.bulk_create(logs)
+        
+        any_success = any(log.was_successful for log in logs)
+        
+        # En az bir başarılı eşleşme varsa ve kapı belirtilmişse, kapıyı bir kez aç
+        if any_success and door:
+            door.current_status = 'OPEN'
+            door.save()
+        
+        results = []
+        for log in logs:
+            item = {
+                'success': log.was_successful,
+                'similarity': log.similarity_score,
+                'access_log_id': log.id
+            }
+            if log.was_successful:
+                item.update({
+                    'user_id': log.user.id,
+                    'username': log.user.username
+                })
+            results.append(item)
+        
+        response_data = {
+            'success': any_success,
+            'results': results
+        }
+        if door:
+            response_data.update({
+                'door_id': door.id,
+                'door_name': door.name,
+                'door_status': door.current_status
+            })
+        return Response(response_data)
 
 class DoorViewSet(viewsets.ModelViewSet):
     """
@@ -417,6 +610,12 @@ class DoorViewSet(viewsets.ModelViewSet):
     serializer_class = DoorSerializer
     permission_classes = [permissions.AllowAny]
     
+    def get_permissions(self):
+        # urls.py eylemleri as_view ile eşlediği için @action'daki permission_classes kendiliğinden uygulanmaz
+        if self.action == 'access':
+            return [permissions.IsAuthenticated()]
+        return super().get_permissions()
+    
     @action(detail=True, methods=['post'])
     def set_status(self, request, pk=None):
         """Kapı durumunu ayarla (açık/kapalı)"""
@@ -502,6 +701,33 @@ class DoorViewSet(viewsets.ModelViewSet):
         logger.info(f"Door status change completed for door {door.id}: {status_value}")
         
         return Response(response_data)
+    
+    @action(detail=True, methods=['get', 'post', 'delete'], permission_classes=[permissions.IsAuthenticated])
+    def access(self, request, pk=None):
+        """Kapıdan geçme yetkisi olan kullanıcıları listele, yetki ver (POST) veya geri al (DELETE)"""
+        door = self.get_object()
+        
+        if request.method != 'GET':
+            user_ids = request.data.get('user_ids')
+            if not isinstance(user_ids, list) or not user_ids:
+                return Response({'error': 'user_ids must be a non-empty list'},
+                              status=status.HTTP_400_BAD_REQUEST)
+            
+            if request.method == 'POST':
+                users = User.objects.filter(pk__in=user_ids)
+                existing = set(door.accesses.values_list('user_id', flat=True))
+                # Sinyallerin galeriyi güncellemesi için tek tek oluşturulur (bulk_create sinyal göndermez)
+                for user in users:
+                    if user.pk not in existing:
+                        DoorAccess.objects.create(door=door, user=user)
+            else:
+                door.accesses.filter(user_id__in=user_ids).delete()
+        
+        return Response({
+            'door_id': door.id,
+            'access_restricted': door.access_restricted,
+            'user_ids': list(door.accesses.values_list('user_id', flat=True))
+        })
 
 class OpenDoorsView(APIView):
     """
@@ -750,26 +976,15 @@ class DoorControlView(APIView):
 
 
 class UserRegisterFaceView(APIView):
+    """
+    Kullanıcı yüz kaydı. Görüntü JSON içinde face_image_base64 olarak, multipart
+    'face_image' dosyası olarak ya da ham image/jpeg gövdesi olarak gönderilebilir.
+    'aligned': true (hizalanmış 112x112 yüz) ya da 'landmarks' (5 nokta) ile
+    gönderilen kırpıntılarda yüz tespiti atlanır.
+    """
 
     permission_classes = [permissions.IsAuthenticated]
-    
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        # Face Analysis modelini yükle
-        try:
-            # FaceAnalysis sınıfını oluştur ve yapılandır
-            # SCRFD yüz dedektörü ve ArcFace MobileFaceNet kullanacak şekilde ayarla
-            self.face_analyzer = FaceAnalysis(
-                name='buffalo_l',  # SCRFD + ArcFace modeli
-                providers=['CPUExecutionProvider'],  # CPU kullan
-                allowed_modules=['detection', 'recognition']  # Tespit ve tanıma modülleri
-            )
-            # Modeli başlat ve yükle (640x640 boyutunda)
-            self.face_analyzer.prepare(ctx_id=-1, det_size=(640, 640))
-            print("SCRFD ve ArcFace modelleri başarıyla yüklendi")
-        except Exception as e:
-            print(f"Model yükleme hatası: {e}")
-            self.face_analyzer = None
+    parser_classes = [JSONParser, MultiPartParser, FormParser, RawImageParser]
     
     def align_and_crop(self, img: np.ndarray, landmarks: list[list[float]], size: int = 112) -> np.ndarray:
         """
@@ -793,103 +1008,137 @@ class UserRegisterFaceView(APIView):
         return aligned
     
     def post(self, request, pk):
+        # Aşama süreleri 'registration.*' histogramlarına yazılır (/api/metrics/)
+        with stage_metrics.span('registration.total'):
+            return self.register(request, pk)
+    
+    def register(self, request, pk):
         user = get_object_or_404(User, pk=pk)
         
-        if not hasattr(self, 'face_analyzer') or self.face_analyzer is None:
+        if 'face_image_base64' not in request.data and 'face_image' not in request.data:
             return Response({
-                'error': 'Face analysis models could not be loaded'
-            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-        
-        if 'face_image_base64' not in request.data:
-            return Response({
-                'error': 'face_image_base64 field is required'
+                'error': 'face_image_base64 field or a face_image upload is required'
             }, status=status.HTTP_400_BAD_REQUEST)
         
         try:
-            # Base64 verisini al
-            face_image_base64 = request.data['face_image_base64']
             name = request.data.get('name', f"Face of {user.username}")
             
             # Expo ImageManipulator'dan gelen metadata'yı kaydet
-            client_metadata = request.data.get('metadata', {})
+            # (multipart ve ham gövdede JSON metni olarak gelir)
+            client_metadata = request.data.get('metadata') or {}
+            if isinstance(client_metadata, str):
+                client_metadata = json.loads(client_metadata)
             device_info = client_metadata.get('device_id', 'unknown')
             source_info = client_metadata.get('source', 'unknown')
             original_width = client_metadata.get('original_width', 0)
             original_height = client_metadata.get('original_height', 0)
             user_agent = client_metadata.get('user_agent', 'unknown')
             
-            print(f"[DEBUG] Alınan görüntü: Kaynak={source_info}, Cihaz={device_info}, "
-                  f"Orijinal Boyut={original_width}x{original_height}, User-Agent={user_agent}")
+            registration_logger.debug(
+                f"Received image: source={source_info}, device={device_info}, "
+                f"original size={original_width}x{original_height}, user agent={user_agent}"
+            )
             
-            # Base64 önekini kaldır
-            if ';base64,' in face_image_base64:
-                base64_data = face_image_base64.split(';base64,')[1]
-            else:
-                base64_data = face_image_base64
+            # Cihazda tespit edilmiş kırpıntılarda (aligned / landmarks) SCRFD atlanır
+            try:
+                crop_mode, client_landmarks = face_crop_options(request.data)
+            except ValueError as e:
+                return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
             
-            # Base64'ü direkt olarak görüntü verisine dönüştür
+            # Görüntü baytları: yüklenen dosyadan doğrudan ya da base64'ten çözülerek
             try:
-                image_data = base64.b64decode(base64_data)
-                image = Image.open(io.BytesIO(image_data)).convert('RGB')
-                print(f"[DEBUG] Görüntü başarıyla yüklendi: {image.size}")
-                
-                # Görüntüyü media klasörüne kaydet
-                file_ext = 'jpg'
-                file_uuid = uuid.uuid4()
-                media_dir = os.path.join(settings.MEDIA_ROOT, 'face_images')
-                
-                # Dizin yoksa oluştur
-                os.makedirs(media_dir, exist_ok=True)
+                with stage_metrics.span('registration.base64_decode'):
+                    image_data, base64_data = image_bytes_from_request(request.data)
+                # Büyük JPEG'ler dedektör boyutuna yakın ölçekte çözülür, sonra letterbox uygulanır
+                with stage_metrics.span('registration.image_decode'):
+                    image, original_size = open_image(image_data, None if crop_mode else detection_size())
+                with stage_metrics.span('registration.resize'):
+                    if crop_mode:
+                        detector_input = CropInput(image, original_size, client_landmarks)
+                    else:
+                        detector_input = DetectorInput(image, original_size)
+                registration_logger.debug(f"Image loaded: {original_size} (decoded at {image.size})")
                 
-                # Dosya yolu oluştur
-                file_name = f"user_{user.id}_face_{file_uuid}.{file_ext}"
-                file_path = os.path.join(media_dir, file_name)
-                
-                # Görüntüyü kaydet
-                image.save(file_path, format='JPEG', quality=95)
-                print(f"[DEBUG] Görüntü kaydedildi: {file_path}")
-                
-                # Görüntü URL'si oluştur
-                image_url = os.path.join(settings.MEDIA_URL, 'face_images', file_name)
+                # İçerik adresli depo yolları; aynı görüntü yeniden yüklenirse aynı dosya kullanılır
+                # (dosyalar kayıt tamamlanınca arka planda yazılır)
+                image_hash = content_hash(image_data)
+                file_path = media_writer.path(stored_image_path(image_hash))
+                image_url = stored_image_url(image_hash)
                 
             except Exception as img_error:
-                print(f"[ERROR] Görüntü yükleme/kaydetme hatası: {img_error}")
+                registration_logger.warning(f"Image could not be decoded: {img_error}")
                 return Response({
                     'error': f'Image processing error: {str(img_error)}'
                 }, status=status.HTTP_400_BAD_REQUEST)
             
-            # Eğer resim boyutu 640x640 değilse, yeniden boyutlandır
-            img_np = np.array(image)
-            if img_np.shape[0] != 640 or img_np.shape[1] != 640:
-                img_np = cv2.resize(img_np, (640, 640))
-                print(f"[DEBUG] Görüntü 640x640 boyutuna yeniden boyutlandırıldı")
+            if crop_mode:
+                registration_logger.debug(f"Client face crop ({'landmarks' if client_landmarks else 'aligned'}), detection skipped")
+                analysis_input = FaceCrop(detector_input.array, client_landmarks)
+            else:
+                registration_logger.debug(
+                    f"Image letterboxed into {detector_input.size[0]}x{detector_input.size[1]} "
+                    f"detector input (scale {detector_input.scale:.3f})"
+                )
+                analysis_input = detector_input.array
             
-            # SCRFD ile yüz tespiti ve yüz landmarkları
-            faces = self.face_analyzer.get(img_np)
+            # SCRFD ile yüz tespiti ve ArcFace embedding'i ayrı çıkarım süreçlerinde yapılır;
+            # aynı görüntünün yeniden gönderiminde sonuç içerik hash'iyle önbellekten döner
+            quality_gate = quality_gate_enabled()
+            try:
+                faces = inference_engine.analyze(
+                    analysis_input, pipeline='registration', quality_gate=quality_gate,
+                    cache_key=embedding_cache_key(
+                        image_hash, crop_mode, client_landmarks, quality_gate, frame=detector_input.frame,
+                    ),
+                )
+            except InferenceQueueFull:
+                return Response({
+                    'error': 'Face analysis is busy, please retry shortly'
+                }, status=status.HTTP_503_SERVICE_UNAVAILABLE,
+                   headers={'Retry-After': str(getattr(settings, 'FACE_INFERENCE_RETRY_AFTER', 2))})
+            except InferenceTimeout:
+                return Response({
+                    'error': 'Face analysis timed out'
+                }, status=status.HTTP_504_GATEWAY_TIMEOUT)
+            except Exception as e:
+                logger.error(f"Face analysis failed: {e}")
+                return Response({
+                    'error': 'Face analysis models could not be loaded'
+                }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
             
             if not faces:
-                print("[ERROR] Görüntüde yüz tespit edilemedi!")
+                registration_logger.info(f"No face detected in registration image for user {user.id}")
                 return Response({
                     'error': 'No face detected in the image'
                 }, status=status.HTTP_400_BAD_REQUEST)
             
-            print(f"[DEBUG] Tespit edilen yüz sayısı: {len(faces)}")
+            registration_logger.debug(f"Detected {len(faces)} face(s)")
             
             # Yüzleri güven skoru (detection score) ve büyüklüğüne göre sırala
-            faces.sort(key=lambda x: (x.det_score, (x.bbox[2]-x.bbox[0])*(x.bbox[3]-x.bbox[1])), reverse=True)
+            faces.sort(key=lambda x: (x['det_score'], (x['bbox'][2]-x['bbox'][0])*(x['bbox'][3]-x['bbox'][1])), reverse=True)
             
             # İlk (en güvenilir/büyük) yüzü al
             best_face = faces[0]
-            print(f"[DEBUG] Seçilen yüzün güven skoru: {best_face.det_score}")
+            registration_logger.debug(f"Selected face detection score: {best_face['det_score']}")
             
-            # Yüz koordinatları
-            bbox = best_face.bbox.astype(int)
-            x1, y1, x2, y2 = bbox
-            bbox_list = [int(x1), int(y1), int(x2), int(y2)]
-            print(f"[DEBUG] Yüz koordinatları (x1, y1, x2, y2): {bbox_list}")
+            # Kalite kapısından geçemeyen yüzün embedding'i çıkarılmadı; kayıt ve dosya yazımı yapılmaz
+            quality = best_face.get('quality')
+            if quality and quality['reasons']:
+                registration_logger.info(f"Registration image rejected for user {user.id}: {quality['reasons']}")
+                return Response({
+                    'error': rejection_message(quality['reasons']),
+                    'reasons': quality['reasons'],
+                    'quality': quality,
+                }, status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+            
+            # Yüz koordinatları (dedektör girişinde)
+            x1, y1, x2, y2 = best_face['bbox'][:4]
+            # Metadata'daki koordinatlar kaynak görüntüye göredir
+            bbox_list = [int(value) for value in detector_input.to_original([[x1, y1], [x2, y2]]).ravel()]
+            registration_logger.debug(f"Face bbox (x1, y1, x2, y2): {bbox_list}")
             
             # Landmarkları al (5 nokta: sol göz, sağ göz, burun, sol ağız, sağ ağız)
-            landmarks = best_face.landmark
+            landmarks = best_face['kps']
             if landmarks is None or len(landmarks) == 0:
                 # Eğer landmark yoksa, bbox'tan hesapla
                 w, h = x2 - x1, y2 - y1
@@ -900,54 +1149,46 @@ class UserRegisterFaceView(APIView):
                     [x1 + w * 0.3, y1 + h * 0.8],  # Sol ağız köşesi
                     [x1 + w * 0.7, y1 + h * 0.8],  # Sağ ağız köşesi
                 ])
-                print("[DEBUG] Landmarklar bbox'tan hesaplandı")
+                registration_logger.debug("Landmarks estimated from bbox")
             else:
                 # Landmark formatı değişmiş olabilir, uyumlu hale getir
                 landmarks = np.array(landmarks)
                 if landmarks.shape != (5, 2):
                     landmarks = landmarks.reshape(5, 2)
-                print("[DEBUG] Landmarklar modelden alındı")
             
-            print(f"[DEBUG] Landmark koordinatları:\n{landmarks}")
+            # Yüzü letterbox girişinden değil çözülen görüntüden hizala ve kırp (112x112 boyut)
+            with stage_metrics.span('registration.alignment'):
+                aligned_face = self.align_and_crop(detector_input.decoded, detector_input.to_decoded(landmarks), size=112)
+            landmarks = detector_input.to_original(landmarks)
+            registration_logger.debug(f"Face aligned: {aligned_face.shape}, landmarks: {landmarks.tolist()}")
             
-            # Yüzü hizala ve kırp (112x112 boyut)
-            aligned_face = self.align_and_crop(img_np, landmarks, size=112)
-            print(f"[DEBUG] Yüz hizalama ve kırpma tamamlandı. Boyut: {aligned_face.shape}")
-            
-            # Tespit edilen ve hizalanan yüzü kaydet
-            face_file_name = f"user_{user.id}_face_{file_uuid}_aligned.{file_ext}"
-            face_file_path = os.path.join(media_dir, face_file_name)
-            cv2.imwrite(face_file_path, cv2.cvtColor(aligned_face, cv2.COLOR_RGB2BGR))
-            face_image_url = os.path.join(settings.MEDIA_URL, 'face_images', face_file_name)
-            print(f"[DEBUG] Hizalanmış yüz kaydedildi: {face_file_path}")
+            # Hizalanan yüzün yolu
+            face_image_url = stored_image_url(image_hash, '_aligned')
             
             # Yüz tanıma ile vektörü çıkar (MobileFaceNet vektörü döndürür)
             # Hizalanmış yüzü 112x112'de işleyerek vektör çıkarabilirsiniz
             # Alternatif: aligned_face ile direkt vektör çıkarma işlemi yapabilirsiniz
-            face_vector_np = best_face.embedding
-            original_vector_size = len(face_vector_np)
-            print(f"[DEBUG] Orijinal vektör boyutu: {original_vector_size}")
+            face_vector_np = best_face['embedding']
             
             # 512 boyutlu vektör için boyut ayarlaması
             if len(face_vector_np) != 512:
                 if len(face_vector_np) > 512:
                     face_vector_np = face_vector_np[:512]  # İlk 512 değeri al
-                    print(f"[DEBUG] Vektör 512 boyuta kırpıldı")
+                    registration_logger.warning(f"Embedding truncated from {len(best_face['embedding'])} to 512 values")
                 else:
                     # Eksik boyutları sıfırla doldur
                     padding = np.zeros(512 - len(face_vector_np))
                     face_vector_np = np.concatenate([face_vector_np, padding])
-                    print(f"[DEBUG] Vektör 512 boyuta genişletildi (sıfır dolgu)")
+                    registration_logger.warning(f"Embedding zero-padded from {len(best_face['embedding'])} to 512 values")
             
             # NORMALİZASYON KALDIRILDI - İSTEĞE GÖRE
-            # Sadece vektör istatistiklerini yazdır
-            print(f"[DEBUG] Vektör boyutu: {len(face_vector_np)}")
-            print(f"[DEBUG] Vektör min: {np.min(face_vector_np)}, max: {np.max(face_vector_np)}")
-            print(f"[DEBUG] Vektör ortalama: {np.mean(face_vector_np)}, std: {np.std(face_vector_np)}")
-            print(f"[DEBUG] Vektör norm: {np.linalg.norm(face_vector_np)}")
-            
-            # TÜM VEKTÖRÜ YAZDIR
-            print(f"[DEBUG] TÜM VEKTÖR: {face_vector_np.tolist()}")
+            # Vektör istatistikleri yalnızca DEBUG seviyesinde hesaplanır (vektörün kendisi loglanmaz)
+            if registration_logger.isEnabledFor(logging.DEBUG):
+                registration_logger.debug(
+                    f"Embedding size={len(face_vector_np)}, min={np.min(face_vector_np):.4f}, "
+                    f"max={np.max(face_vector_np):.4f}, mean={np.mean(face_vector_np):.4f}, "
+                    f"std={np.std(face_vector_np):.4f}, norm={np.linalg.norm(face_vector_np):.4f}"
+                )
             
             # FaceVectorSerializer'ın beklediği formatta veri oluştur
             vector_list = face_vector_np.tolist()  # Numpy dizisini Python listesine dönüştür
@@ -962,11 +1203,12 @@ class UserRegisterFaceView(APIView):
                 'extractor': 'scrfd_mobilefacenet',
                 'model_info': 'ArcFace MobileFaceNet 512-dim Vector',  # Vektör boyutunu belirt
                 'source_ip': request.META.get('REMOTE_ADDR'),
-                'image_dimensions': f"{image.size[0]}x{image.size[1]}",
+                'image_dimensions': f"{detector_input.original_size[0]}x{detector_input.original_size[1]}",
                 'image_path': file_path,
                 'image_url': image_url,
                 'face_image_url': face_image_url,
-                'detection_score': float(best_face.det_score),
+                'detection_score': best_face['det_score'],
+                'face_detection': 'scrfd' if best_face.get('detected', True) else 'client',
                 'bbox': bbox_list,
                 'landmarks': landmarks.tolist(),
                 'vector_size': vector_size,
@@ -988,27 +1230,35 @@ class UserRegisterFaceView(APIView):
                 'user': user.id,
                 'name': name,
                 'vector_data': vector_list,  # Listeye dönüştürülmüş vektör
-                'face_image_base64': base64_data,
                 'is_active': True,
                 'metadata': combined_metadata
             }
             
+            # İkili yüklemede görüntü base64'e çevrilmeden serializer'a dosya olarak verilir
+            if base64_data is not None:
+                serializer_data['face_image_base64'] = base64_data
+            else:
+                serializer_data['face_image'] = ContentFile(image_data, name=f"{image_hash}.jpg")
+            
             serializer = FaceVectorSerializer(data=serializer_data)
             if not serializer.is_valid():
-                print(f"[ERROR] Serializer hataları: {serializer.errors}")
+                registration_logger.warning(f"Face vector validation failed: {serializer.errors}")
                 return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
             
-            face_vector = serializer.save()
-            print(f"[DEBUG] Yüz vektörü başarıyla veritabanına kaydedildi. Vector ID: {face_vector.id}")
+            with stage_metrics.span('registration.db_persist'):
+                face_vector = serializer.save()
+                
+                # Kullanıcının yüz kaydı yapıldığını belirt
+                user.is_face_registered = True
+                user.save()
+            registration_logger.info(f"Face vector {face_vector.id} registered for user {user.username}")
             
-            # Kullanıcının yüz kaydı yapıldığını belirt
-            user.is_face_registered = True
-            user.save()
-            print(f"[DEBUG] Kullanıcı {user.username} için yüz kaydı yapıldı")
+            # Orijinal görüntüyü serializer depoya ekledi; hizalanmış yüz yoksa istek dışında yazılır
+            image_store.store_derivative(image_hash, '_aligned', partial(encode_array, aligned_face))
             
             # Yanıt için response serializer kullan
             from .serializers import FaceVectorResponseSerializer
-            response_serializer = FaceVectorResponseSerializer(face_vector)
+            response_serializer = FaceVectorResponseSerializer(face_vector, context={'request': request})
             
             # API yanıtına sadece gerekli bilgileri ekle (debug bilgileri terminalde)
             response_data = response_serializer.data
@@ -1022,9 +1272,7 @@ class UserRegisterFaceView(APIView):
             return Response(response_data, status=status.HTTP_201_CREATED)
             
         except Exception as e:
-            import traceback
-            print(f"[ERROR] İşlem sırasında hata oluştu:")
-            traceback.print_exc()
+            registration_logger.exception(f"Face registration failed for user {user.id}")
             return Response({
                 'error': str(e)
             }, status=status.HTTP_400_BAD_REQUEST)
@@ -273,6 +273,81 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Yüz galerisi indeks ayarları (api/face_index.py)
+# 'exact': tüm galeriyi tarayan kaba kuvvet arama, 'ivf': yaklaşık en yakın komşu
+FACE_INDEX_BACKEND = 'exact'
+FACE_INDEX_IVF_NLIST = 0  # Küme sayısı, 0 ise galeri boyutuna göre otomatik (~sqrt(N))
+FACE_INDEX_IVF_NPROBE = 8  # Sorgu başına taranan küme sayısı (recall/gecikme dengesi)
+FACE_INDEX_IVF_MIN_ROWS = 2000  # Bu boyutun altındaki galerilerde her zaman tam arama yapılır
+# Bellekteki matrislerin hassasiyeti: 'float32', 'float16' (2x) veya 'int8' (~4x daha az bellek)
+FACE_INDEX_PRECISION = 'float32'
+FACE_INDEX_RERANK_CANDIDATES = 50  # Nicemli taramadan sonra float32 ile yeniden sıralanan aday sayısı
+FACE_BATCH_MAX_SIZE = 64  # Toplu doğrulama/arama isteklerindeki en fazla embedding sayısı
+
+# Worker'ların hızlı açılması için galerinin bellek eşlemeli (.npy) anlık görüntüleri
+# None yapılırsa anlık görüntü okuma/yazma kapanır
+FACE_GALLERY_SNAPSHOT_DIR = os.path.join(BASE_DIR, 'gallery_snapshots')
+FACE_GALLERY_SNAPSHOT_INTERVAL = 30  # Değişikliklerden sonra arka plan yazımı için bekleme (saniye)
+
+# Galeri taban matrislerini host başına tek bir multiprocessing.shared_memory segmentinde tut
+FACE_GALLERY_SHARED_MEMORY = True
+FACE_GALLERY_SHARED_REPUBLISH_ROWS = 256  # Yazıcı bu kadar değişiklik birikince yeni nesil yayınlar
+
+# Değişiklikler kanal katmanı üzerinden dağıtılırken veritabanı yoklama aralığı (saniye);
+# yalnızca süreçler arası bir kanal katmanında (ör. Redis) etkilidir
+FACE_GALLERY_POLL_INTERVAL = 30
+
+# Aynı kapı/cihazdan gelen tekrar eden doğrulama sorguları için sonuç önbelleği
+FACE_MATCH_CACHE_TTL = 5  # Saniye; 0 önbelleği kapatır
+FACE_MATCH_CACHE_SIMILARITY = 0.95  # Önbellekteki sorguyla en az bu kosinüs benzerliği gerekir
+FACE_MATCH_CACHE_LSH_BITS = 16  # LSH kova anahtarındaki hiperdüzlem sayısı
+
+# Yüz analiz modeli (insightface model paketi) ve SCRFD dedektör giriş boyutu
+FACE_ANALYSIS_MODEL = 'buffalo_l'
+FACE_DETECTION_SIZE = (640, 640)
+# SCRFD sırayla bu giriş boyutlarında çalıştırılır; küçük boyutta yüz bulunamazsa bir sonrakine geçilir.
+# İstemcinin yüz ortalı ~500 px görüntülerinde 320 çoğunlukla yeterlidir (640'ın ~1/4'ü FLOP).
+FACE_DETECTION_SIZES = ((320, 320), (640, 640))
+
+# Yüz tespiti/embedding çıkarımı için ayrı süreç havuzu (0: istek iş parçacığında çalıştır)
+FACE_INFERENCE_WORKERS = 2
+FACE_INFERENCE_QUEUE_SIZE = 16  # Bekleyen + çalışan en fazla iş; doluysa 503 döner
+FACE_INFERENCE_TIMEOUT = 10  # İş başına bekleme süresi (saniye); aşılırsa 504 döner
+FACE_INFERENCE_RETRY_AFTER = 2  # 503 yanıtındaki Retry-After (saniye)
+FACE_INFERENCE_BATCH_SIZE = 8  # Tek çıkarım işinde birleştirilecek en fazla görüntü
+FACE_INFERENCE_BATCH_WAIT_MS = 5  # Yığın için eşzamanlı istekleri bekleme süresi (ms)
+
+# WebSocket face_recognition_request mesajlarında tanımayı sunucuda yap (mesajdaki server_side ile de seçilebilir)
+FACE_RECOGNITION_SERVER_SIDE = False
+FACE_RECOGNITION_THRESHOLD = 0.5  # Sunucu tarafı tanımada eşleşme için benzerlik eşiği
+
+# ONNX Runtime oturum ayarları (SCRFD ve ArcFace)
+FACE_ONNX_INTRA_OP_THREADS = None  # None: çekirdek sayısı / FACE_INFERENCE_WORKERS; 0: ONNX Runtime varsayılanı
+FACE_ONNX_INTER_OP_THREADS = 1
+FACE_ONNX_GRAPH_OPTIMIZATION = 'all'  # 'disable', 'basic', 'extended' veya 'all'
+FACE_ONNX_EXECUTION_MODE = 'sequential'  # 'sequential' veya 'parallel'
+FACE_ONNX_ALLOW_SPINNING = False  # Boşta bekleyen iş parçacıkları CPU harcamasın
+# Paketteki ArcFace yerine kullanılacak tanıma modeli (ör. compare_recognition_models --quantize ile üretilen INT8 model).
+# Embedding'ler değişeceği için galeri yeniden kayıt ya da karşılaştırma sonrası açılmalı.
+FACE_RECOGNITION_MODEL_PATH = os.environ.get('FACE_RECOGNITION_MODEL_PATH') or None
+
+# Kayıtta embedding'den önce çalışan kalite kapısı; reddedilen görüntüler 422 ve nedenlerle döner
+FACE_QUALITY_GATE = True
+FACE_QUALITY_MIN_FACE_SIZE = 40  # Dedektör girişinde bbox'ın kısa kenarı (piksel)
+FACE_QUALITY_MIN_DET_SCORE = 0.6
+FACE_QUALITY_MIN_BLUR = 35.0  # 112x112 hizalanmış kırpıntının Laplacian varyansı
+FACE_QUALITY_BRIGHTNESS_RANGE = (40, 220)  # Kırpıntının ortalama gri seviyesi
+
+# Görüntü içerik hash'inden tespit/embedding sonucuna önbellek (yeniden gönderilen görüntüler için).
+# Bellek katmanı süreç başına; disk katmanı süreçler arasında paylaşılır (boş dizin: kapalı)
+FACE_EMBEDDING_CACHE_MAX_BYTES = 64 * 1024 * 1024  # 0: önbellek kapalı
+FACE_EMBEDDING_CACHE_DIR = os.path.join(BASE_DIR, 'embedding_cache')
+FACE_EMBEDDING_CACHE_DISK_MAX_BYTES = 512 * 1024 * 1024
+
+# Yüz görüntüleri istek dışında arka plan iş parçacığında yazılır
+FACE_MEDIA_WRITER_ASYNC = True
+FACE_MEDIA_WRITER_QUEUE_SIZE = 256  # Kuyruk doluysa yazım istek iş parçacığında yapılır
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -302,5 +377,9 @@ LOGGING = {
             'level': 'INFO',
             'propagate': True,
         },
+        # Yüz kaydı adım adım ayrıntıları için FACE_REGISTRATION_LOG_LEVEL=DEBUG
+        'api.registration': {
+            'level': os.environ.get('FACE_REGISTRATION_LOG_LEVEL', 'INFO'),
+        },
     },
 }
\ No newline at end of file
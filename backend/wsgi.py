@@ -14,3 +14,15 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
 
 application = get_wsgi_application()
+
+# Yüz galerilerini ilk doğrulama isteğinden önce belleğe yükle
+from api.face_index import warm_up as warm_up_face_galleries
+warm_up_face_galleries()
+
+# Diğer worker'lardaki galeri değişikliklerini dinle
+from api.gallery_sync import delta_bus as face_gallery_delta_bus
+face_gallery_delta_bus.start()
+
+# Çıkarım süreç havuzunu başlat; worker'lar modelleri ilk kayıt isteğinden önce yükleyip ısıtır
+from api.inference import inference_engine
+inference_engine.warm_up()